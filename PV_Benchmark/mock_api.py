@@ -0,0 +1,152 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from synthetic_data import generate_table
+
+
+class MockPatentsViewAPI:
+    """
+    Local stand-in for the PatentsView patent query endpoint, serving synthetic g_patent records
+
+    Supports the q filters _eq, _gte and _lte on one field, f, s, cursor pagination with
+    o={"size", "after"} and page pagination with o={"page", "per_page"}. Every fail_every-th
+    request is answered with a 429 or 503 to exercise client retries.
+    """
+
+    def __init__(self, patents=5000, seed=0, fail_every=0, retry_after=0):
+        """
+        Args:
+            patents (int, optional): Number of synthetic patents served
+            seed (int, optional): Seed of the synthetic data
+            fail_every (int, optional): Answer every n-th request with an error, 0 never
+            retry_after (float or str, optional): Retry-After sent with 429 responses, in seconds or as an HTTP date
+        """
+        df = generate_table('g_patent', patents, seed)
+        self.records = df.astype(object).where(df.notna(), None).to_dict('records')
+        self.fail_every = fail_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.server = None
+        self._hits = {}
+        self._lock = threading.Lock()
+        return
+
+    @staticmethod
+    def _matches(record, query):
+        for op, condition in query.items():
+            if not isinstance(condition, dict):
+                # {"field": value} is an equality test
+                op, condition = "_eq", {op: condition}
+            field, value = next(iter(condition.items()))
+            if op == "_eq" and record.get(field) != value:
+                return False
+            if op == "_gte" and not (record.get(field) is not None and record.get(field) >= value):
+                return False
+            if op == "_lte" and not (record.get(field) is not None and record.get(field) <= value):
+                return False
+        return True
+
+    def respond(self, params):
+        """
+        Answer one query
+
+        Args:
+            params (dict): q, f, s and o query string parameters as JSON strings
+
+        Returns:
+            tuple: (status code, headers, body dict)
+        """
+        with self._lock:
+            self.requests += 1
+            n = self.requests
+        if self.fail_every and n % self.fail_every == 0:
+            if (n // self.fail_every) % 2:
+                return 429, {'Retry-After': str(self.retry_after)}, {'error': True}
+            return 503, {}, {'error': True}
+        query = json.loads(params.get('q', '{}'))
+        fields = json.loads(params['f']) if 'f' in params else None
+        sort = json.loads(params['s']) if 's' in params else [{"patent_id": "asc"}]
+        options = json.loads(params.get('o', '{}'))
+        key = (params.get('q', '{}'), json.dumps(sort))
+        if key not in self._hits:
+            # Filtered and sorted once per query, so paging costs the client rather than the mock
+            hits = [record for record in self.records if self._matches(record, query)]
+            for item in reversed(sort):
+                field, direction = next(iter(item.items()))
+                hits.sort(key=lambda record: (record.get(field) is None, record.get(field)),
+                          reverse=direction == "desc")
+            self._hits[key] = hits
+        hits = self._hits[key]
+        if 'page' in options:
+            size = options.get('per_page', 25)
+            start = (options['page'] - 1) * size
+            page = hits[start:start + size]
+        else:
+            size = options.get('size', 100)
+            if 'after' in options:
+                keys = [next(iter(item)) for item in sort]
+                after = tuple(options['after'])
+                hits = [record for record in hits if tuple(record.get(key) for key in keys) > after]
+            page = hits[:size]
+        if fields:
+            page = [{field: record.get(field) for field in fields} for record in page]
+        return 200, {}, {'error': False, 'count': len(page), 'total_hits': len(self._hits[key]), 'patents': page}
+
+    def start(self, port=0):
+        """
+        Serve in a background thread
+
+        Args:
+            port (int, optional): Port to listen on, a free one if 0
+
+        Returns:
+            str: URL of the endpoint
+        """
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                status, headers, body = api.respond(params)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v1/patent/"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock PatentsView patent API")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    parser.add_argument("--patents", type=int, default=5000, help="number of synthetic patents")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every n-th request with 429/503")
+    args = parser.parse_args()
+    api = MockPatentsViewAPI(args.patents, fail_every=args.fail_every)
+    print(f"Serving {api.start(args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.stop()
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import datetime
+import functools
+import http.server
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The other folders are flat script directories, imported the same way they import their own modules
+for folder in ['PV_Compare', 'PV_Downloader', 'misc']:
+    sys.path.insert(0, os.path.join(os.path.dirname(HERE), folder))
+
+from synthetic_data import TABLES, write_legacy_tables, write_release  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ['load', 'compare', 'join', 'download', 'api']
+
+
+def _peak_rss_mb():
+    # ru_maxrss of a spawned process starts at its parent's size on Linux, the high water mark does not
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def _measure(scenario, name, func, kwargs):
+    """
+    Run one benchmark in the current (fresh) process and time it
+    """
+    start = time.perf_counter()
+    counts = func(**kwargs)
+    seconds = time.perf_counter() - start
+    result = {'scenario': scenario, 'name': name, 'seconds': round(seconds, 4), 'peak_rss_mb': _peak_rss_mb(),
+              'rows': counts.get('rows'), 'bytes': counts.get('bytes')}
+    result['rows_per_sec'] = round(result['rows'] / seconds, 1) if result['rows'] else None
+    result['mb_per_sec'] = round(result['bytes'] / 1024 ** 2 / seconds, 2) if result['bytes'] else None
+    return result
+
+
+def bench_load(path, typed=False):
+    from pv_loader import read_file
+    df = read_file(path, typed=typed)
+    return {'rows': len(df), 'bytes': os.path.getsize(path)}
+
+
+def bench_compare(table, new_path, old_path, output_dir, backend='pandas'):
+    from compare_driver import compare_table
+    result = compare_table(table, new_path, old_path, os.path.join(output_dir, table + ".csv"), backend=backend)
+    return {'rows': result['New_Records'] + result['Prior_Records'],
+            'bytes': os.path.getsize(new_path) + os.path.getsize(old_path)}
+
+
+def bench_join(legacy_dir, script):
+    import importlib
+    module = importlib.import_module(script)
+    module.DIR = legacy_dir
+    if hasattr(module, 'NAME_CACHE'):
+        # Timed without the name cache, so every run normalizes every name
+        module.NAME_CACHE = None
+    cwd = os.getcwd()
+    try:
+        data = module.joinData()
+        if hasattr(module, 'cleanData'):
+            data = module.cleanData(data)
+    finally:
+        os.chdir(cwd)
+    return {'rows': len(data)}
+
+
+def bench_join_pipeline(legacy_dir, output_dir, chunksize=200000):
+    from assignee_join import AssigneeJoinPipeline
+    pipeline = AssigneeJoinPipeline(os.path.join(legacy_dir, "applications", "application.tsv"),
+                                    os.path.join(legacy_dir, "assignees", "assignee.tsv"),
+                                    os.path.join(legacy_dir, "crosswalk", "patent_assignee.tsv"),
+                                    os.path.join(legacy_dir, "locations", "location.tsv"), chunksize=chunksize)
+    return {'rows': pipeline.run(os.path.join(output_dir, "assignee_join"))['rows']}
+
+
+def bench_stream_counts(legacy_dir, method, chunksize=200000):
+    from name_normalizer import NameNormalizer
+    from streaming_counts import stream_top_assignees
+    top = stream_top_assignees(os.path.join(legacy_dir, "publications", "publication.tsv"),
+                               os.path.join(legacy_dir, "assignees", "rawassignee.tsv"), method=method,
+                               chunksize=chunksize, normalizer=NameNormalizer())
+    return {'rows': len(top)}
+
+
+def bench_query(release_dir, family):
+    """
+    Top assignees with the SQL layer, over the Parquet copies written by prepare_data
+    """
+    from release_query import ReleaseQuery
+    with ReleaseQuery(release_dir) as query:
+        return {'rows': len(query.top_assignees(family, by=['year']))}
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        return
+
+
+def bench_download(release_dir, download_dir, max_workers=4):
+    """
+    Download a synthetic release from a local HTTP server with PatentsViewDownloader
+    """
+    import PatentsViewDownloader as pvd
+    files = sorted(file for file in os.listdir(release_dir) if file.endswith(".tsv.zip"))
+    with open(os.path.join(release_dir, "index.html"), "w") as f:
+        f.write("<html><body>" + "".join(f'<a href="{file}">{file}</a>' for file in files) + "</body></html>")
+    handler = functools.partial(_QuietHandler, directory=release_dir)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        shutil.rmtree(download_dir, ignore_errors=True)
+        downloader = pvd.PatentsViewDownloader(f"http://127.0.0.1:{server.server_address[1]}/index.html",
+                                               download_dir=download_dir)
+        downloaded = downloader.download_all(delay=0, max_workers=max_workers)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {'rows': None, 'bytes': sum(os.path.getsize(path) for path in downloaded)}
+
+
+def bench_api(patents, page_size=1000, max_concurrency=4, pagination='page'):
+    """
+    Page through every record of a mock PatentsView API with the misc API client
+    """
+    from mock_api import MockPatentsViewAPI
+    from patentsview_api import PatentsViewAPI
+    api = MockPatentsViewAPI(patents)
+    try:
+        client = PatentsViewAPI(api.start(), page_size=page_size, max_concurrency=max_concurrency,
+                                pagination=pagination)
+        df = client.run(client.query_frame({"_gte": {"patent_date": "1976-01-01"}},
+                                           fields=["patent_id", "patent_date", "num_claims"]))
+    finally:
+        api.stop()
+    return {'rows': len(df)}
+
+
+def prepare_data(data_dir, patents, seed=0, growth=0.05):
+    """
+    Write the synthetic releases used by the benchmarks, unless they already exist
+
+    Args:
+        data_dir (str): Directory for the generated data
+        patents (int): Number of patents (and of publications) in the new release
+        seed (int, optional): Seed of the data
+        growth (float, optional): How much larger the new release is than the prior one
+
+    Returns:
+        str: Directory with new/, old/ and legacy/ subdirectories
+    """
+    root = os.path.join(data_dir, f"p{patents}_s{seed}")
+    done = os.path.join(root, ".complete")
+    if not os.path.exists(done):
+        print(f"Generating synthetic releases with {patents} patents in {root}")
+        write_release(os.path.join(root, "new"), patents, seed)
+        write_release(os.path.join(root, "old"), int(patents / (1 + growth)), seed)
+        write_legacy_tables(os.path.join(root, "legacy"), patents, seed)
+        open(done, "w").close()
+    # Parquet copies of the new release, so the query benchmarks time queries rather than the one-off conversion
+    from zip_to_parquet import convert_zip_to_parquet
+    for table in TABLES:
+        convert_zip_to_parquet(os.path.join(root, "new", table + ".tsv.zip"), os.path.join(root, "new", "parquet"))
+    return root
+
+
+def benchmark_jobs(root, work_dir, patents, scenarios=SCENARIOS, backends=('pandas',)):
+    """
+    List the benchmarks to run as (scenario, name, function, kwargs)
+    """
+    jobs = []
+    for table in TABLES:
+        new_path = os.path.join(root, "new", table + ".tsv.zip")
+        old_path = os.path.join(root, "old", table + ".tsv.zip")
+        if 'load' in scenarios:
+            jobs.append(('load', table, bench_load, {'path': new_path}))
+            jobs.append(('load', table + "[typed]", bench_load, {'path': new_path, 'typed': True}))
+        if 'compare' in scenarios:
+            for backend in backends:
+                jobs.append(('compare', f"{table}[{backend}]", bench_compare,
+                             {'table': table, 'new_path': new_path, 'old_path': old_path,
+                              'output_dir': work_dir, 'backend': backend}))
+    if 'join' in scenarios:
+        for script in ['top_patent_assignees', 'top_filings_PGPUB']:
+            jobs.append(('join', script, bench_join, {'legacy_dir': os.path.join(root, "legacy"), 'script': script}))
+        jobs.append(('join', 'assignee_join_pipeline', bench_join_pipeline,
+                     {'legacy_dir': os.path.join(root, "legacy"), 'output_dir': work_dir}))
+        for method in ['exact', 'spacesaving']:
+            jobs.append(('join', f'stream_counts_{method}', bench_stream_counts,
+                         {'legacy_dir': os.path.join(root, "legacy"), 'method': method}))
+        if importlib.util.find_spec('duckdb'):
+            for family in ['grant', 'pgpub']:
+                jobs.append(('join', f'release_query_{family}', bench_query,
+                             {'release_dir': os.path.join(root, "new"), 'family': family}))
+    if 'download' in scenarios:
+        jobs.append(('download', 'release', bench_download,
+                     {'release_dir': os.path.join(root, "new"), 'download_dir': os.path.join(work_dir, "download")}))
+    if 'api' in scenarios:
+        for pagination in ['page', 'cursor']:
+            jobs.append(('api', pagination, bench_api, {'patents': min(patents, 50000), 'pagination': pagination}))
+    return jobs
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(data_dir, patents=100000, seed=0, scenarios=SCENARIOS, backends=('pandas',), repeat=1,
+                   output=None):
+    """
+    Run the benchmarks, each in a fresh process so its peak RSS is its own, and record them as JSON
+
+    Args:
+        data_dir (str): Directory for the generated data, reused by later runs at the same scale
+        patents (int, optional): Number of patents (and of publications) in the new release
+        seed (int, optional): Seed of the data
+        scenarios (list, optional): Any of 'load', 'compare', 'join', 'download' and 'api'
+        backends (tuple, optional): Metrics backends used by the compare scenario
+        repeat (int, optional): Runs per benchmark, the fastest is kept
+        output (str, optional): Path of the JSON results. By default benchmark_results/<commit>_<time>.json
+
+    Returns:
+        dict: The recorded run
+    """
+    root = prepare_data(data_dir, patents, seed)
+    work_dir = tempfile.mkdtemp(prefix="pv_benchmark_")
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for scenario, name, func, kwargs in benchmark_jobs(root, work_dir, patents, scenarios, backends):
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(_measure, scenario, name, func, kwargs).result())
+            best = min(runs, key=lambda run: run['seconds'])
+            print(f"{scenario:<9} {name:<45} {best['seconds']:>9.3f}s  {best['peak_rss_mb']} MB")
+            results.append(best)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    run = {'commit': git_commit(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+           'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+           'patents': patents, 'seed': seed, 'repeat': repeat, 'results': results}
+    if output is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(HERE, "benchmark_results", f"{run['commit'] or 'nocommit'}_{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {output}")
+    return run
+
+
+def compare_runs(baseline, current, threshold=0.1):
+    """
+    Report the benchmarks that got slower or used more memory than in a baseline run
+
+    Args:
+        baseline (dict or str): Baseline run, or the path of its JSON file
+        current (dict or str): Current run, or the path of its JSON file
+        threshold (float, optional): Relative change reported as a regression
+
+    Returns:
+        list: (scenario, name, metric, baseline value, current value) of each regression
+    """
+    runs = []
+    for run in [baseline, current]:
+        if isinstance(run, str):
+            with open(run) as f:
+                run = json.load(f)
+        runs.append(run)
+    if runs[0].get('patents') != runs[1].get('patents'):
+        print("\t Warning: the runs used different data sizes")
+    runs = [{(result['scenario'], result['name']): result for result in run['results']} for run in runs]
+    regressions = []
+    for key, old in runs[0].items():
+        new = runs[1].get(key)
+        if new is None:
+            continue
+        for metric in ['seconds', 'peak_rss_mb']:
+            if old[metric] and new[metric] and new[metric] > old[metric] * (1 + threshold):
+                regressions.append((*key, metric, old[metric], new[metric]))
+                print(f"\t {key[0]} {key[1]}: {metric} {old[metric]} -> {new[metric]}")
+    if not regressions:
+        print("No regressions over the baseline.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading, comparing, joining and downloading PatentsView tables and API queries")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "pv_benchmark_data"),
+                        help="directory for the generated data")
+    parser.add_argument("--patents", type=int, default=100000, help="number of patents and of publications")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the data")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="scenarios to run")
+    parser.add_argument("--backends", nargs="+", default=['pandas'], help="metrics backends for the compare scenario")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per benchmark, the fastest is kept")
+    parser.add_argument("--output", help="path of the JSON results")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    run = run_benchmarks(args.data_dir, args.patents, args.seed, args.scenarios, tuple(args.backends),
+                         args.repeat, args.output)
+    if args.baseline:
+        compare_runs(args.baseline, run, args.threshold)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import argparse
+import os
+import zipfile
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Rows generated per block. Each block has its own random stream, so a release generated with more
+# patents contains every row of a smaller one and the two can be compared like consecutive releases
+BLOCK_ROWS = 100000
+
+# Distinct assignees and locations added to the pools per block, close to the ratios in the real releases
+ENTITY_CHUNKS = {1: BLOCK_ROWS // 15, 2: BLOCK_ROWS // 40}
+
+WORDS = ['ACME', 'GLOBAL', 'ADVANCED', 'MICRO', 'NANO', 'BIO', 'TECH', 'SYSTEMS', 'DYNAMICS', 'ENERGY',
+         'MEDICAL', 'AUTOMOTIVE', 'SEMICONDUCTOR', 'OPTICS', 'NETWORKS', 'PHARMA', 'ROBOTICS', 'DEVICES',
+         'MATERIALS', 'INSTRUMENTS', 'ELECTRIC', 'CHEMICAL', 'SOLUTIONS', 'LABS', 'AEROSPACE', 'DIGITAL']
+SUFFIXES = ['Inc.', 'INC', 'Corporation', 'Corp.', 'Co., Ltd.', 'LLC', 'L.L.C.', 'GmbH', 'AG', 'Ltd', 'S.A.', '']
+FIRST_NAMES = ['John', 'Mary', 'Wei', 'Hiroshi', 'Anna', 'Carlos', 'Priya', 'Hans', 'Olga', 'Kim']
+LAST_NAMES = ['Smith', 'Zhang', 'Tanaka', 'Muller', 'Garcia', 'Patel', 'Kim', 'Ivanova', 'Rossi', 'Brown']
+CITIES = [('San Jose', 'CA', 'US', 37.34, -121.89), ('Austin', 'TX', 'US', 30.27, -97.74),
+          ('Boston', 'MA', 'US', 42.36, -71.06), ('Tokyo', None, 'JP', 35.68, 139.69),
+          ('Seoul', None, 'KR', 37.57, 126.98), ('Munich', None, 'DE', 48.14, 11.58),
+          ('Shenzhen', None, 'CN', 22.54, 114.06), ('Paris', None, 'FR', 48.86, 2.35),
+          ('Toronto', None, 'CA', 43.65, -79.38), ('Raleigh', 'NC', 'US', 35.78, -78.64)]
+TITLE_WORDS = ['method', 'system', 'apparatus', 'device', 'composition', 'wireless', 'battery', 'sensor',
+               'display', 'antibody', 'vehicle', 'memory', 'network', 'catalyst', 'imaging', 'control']
+
+TABLES = ['g_patent', 'g_assignee_disambiguated', 'g_location_disambiguated',
+          'pg_published_application', 'pg_assignee_disambiguated']
+
+
+def _uuids(rng, n):
+    """
+    Random IDs formatted like the PatentsView disambiguated assignee and location IDs
+    """
+    raw = rng.integers(0, 2 ** 63, size=(n, 2), dtype=np.int64)
+    return [f"{a:016x}{b:016x}" for a, b in raw] if n else []
+
+
+@lru_cache(maxsize=None)
+def _entity_chunk(seed, kind, chunk):
+    """
+    IDs of one chunk of the assignee (kind 1) or location (kind 2) pool, formatted like the PatentsView
+    disambiguated IDs. Block b draws from chunks 0..b, so the pool grows with the release
+    """
+    count = ENTITY_CHUNKS[kind]
+    ids = _uuids(np.random.default_rng([seed, kind, chunk]), count)
+    return np.array([f"{i[:8]}-{i[8:12]}-{i[12:16]}-{i[16:20]}-{i[20:]}" for i in ids], dtype=object)
+
+
+def _entity_ids(seed, kind, chunks):
+    return np.concatenate([_entity_chunk(seed, kind, chunk) for chunk in range(chunks)])
+
+
+def _popular(rng, n, count):
+    """
+    Indexes into a pool of count entities with a Zipf-like skew, as a few assignees hold most patents
+    """
+    return (rng.zipf(1.3, n) - 1) % count
+
+
+def _dates(rng, n, start, end):
+    days = rng.integers(np.datetime64(start).astype(int), np.datetime64(end).astype(int), n)
+    return pd.Series(days.astype('datetime64[D]')).dt.strftime("%Y-%m-%d")
+
+
+def _titles(rng, n):
+    words = np.array(TITLE_WORDS)[rng.integers(0, len(TITLE_WORDS), size=(n, 4))]
+    return [" ".join(row).capitalize() for row in words]
+
+
+@lru_cache(maxsize=None)
+def _organization_chunk(seed, chunk):
+    """
+    Canonical organization name of each assignee in a chunk of the pool, with the suffix and case
+    variants found in the raw data
+    """
+    count = ENTITY_CHUNKS[1]
+    rng = np.random.default_rng([seed, 3, chunk])
+    first = np.array(WORDS)[rng.integers(0, len(WORDS), count)]
+    second = np.array(WORDS)[rng.integers(0, len(WORDS), count)]
+    suffix = np.array(SUFFIXES)[rng.integers(0, len(SUFFIXES), count)]
+    names = [f"{a} {b} {s}".strip() for a, b, s in zip(first, second, suffix)]
+    lower = rng.random(count) < 0.1
+    return np.array([name.title() if low else name for name, low in zip(names, lower)], dtype=object)
+
+
+def patent_block(seed, block):
+    """
+    Rows of g_patent for one block
+
+    Args:
+        seed (int): Seed of the release
+        block (int): Block number, rows start at block * BLOCK_ROWS
+
+    Returns:
+        pd.DataFrame: The block
+    """
+    rng = np.random.default_rng([seed, 0, block])
+    rows = BLOCK_ROWS
+    numbers = np.arange(block * BLOCK_ROWS, block * BLOCK_ROWS + rows) + 10000000
+    kind = rng.choice(['utility', 'design', 'reissue'], rows, p=[0.9, 0.08, 0.02])
+    prefix = np.select([kind == 'design', kind == 'reissue'], ['D', 'RE'], '')
+    patent_id = [p + str(n) if p == '' else p + str(n % 1000000) for p, n in zip(prefix, numbers)]
+    return pd.DataFrame({
+        'patent_id': patent_id,
+        'patent_type': kind,
+        'patent_date': _dates(rng, rows, '1976-01-01', '2024-12-31'),
+        'patent_title': _titles(rng, rows),
+        'wipo_kind': np.select([kind == 'design', kind == 'reissue'], ['S1', 'E'], 'B2'),
+        'num_claims': rng.integers(1, 60, rows),
+        'withdrawn': (rng.random(rows) < 0.001).astype(int),
+        'filename': [f"ipg{str(n % 1000000).zfill(6)}.xml" for n in numbers // 5000]
+    })
+
+
+def publication_block(seed, block):
+    """
+    Rows of pg_published_application for one block
+    """
+    rng = np.random.default_rng([seed, 1, block])
+    rows = BLOCK_ROWS
+    numbers = np.arange(block * BLOCK_ROWS, block * BLOCK_ROWS + rows)
+    return pd.DataFrame({
+        'document_number': numbers + 20050000001,
+        'application_number': [f"{s}{str(n % 1000000).zfill(6)}" for s, n in
+                               zip(rng.integers(10, 18, rows), numbers)],
+        'application_type': rng.choice(['utility', 'plant', 'reissue'], rows, p=[0.97, 0.01, 0.02]),
+        'filing_date': _dates(rng, rows, '2001-01-01', '2023-12-31'),
+        'series_code': rng.integers(9, 18, rows),
+        'invention_title': _titles(rng, rows),
+        'rule_47_flag': rng.random(rows) < 0.01,
+        'filename': [f"ipa{str(n % 1000000).zfill(6)}.xml" for n in numbers // 5000]
+    })
+
+
+def assignee_block(seed, block, ids, key):
+    """
+    Rows of g_assignee_disambiguated or pg_assignee_disambiguated for the patents or publications of one block
+
+    Args:
+        seed (int): Seed of the release
+        block (int): Block number
+        ids (array-like): patent_id or document_number of the block
+        key (str): 'patent_id' or 'document_number'
+
+    Returns:
+        pd.DataFrame: The block
+    """
+    rng = np.random.default_rng([seed, 2, block, int(key == 'document_number')])
+    # Most documents have one assignee, some have none and a few several
+    per_doc = rng.choice([0, 1, 2, 3], len(ids), p=[0.2, 0.7, 0.08, 0.02])
+    doc = np.repeat(np.asarray(ids), per_doc)
+    n = len(doc)
+    sequence = np.arange(n) - np.repeat(np.cumsum(per_doc) - per_doc, per_doc)
+    assignee_ids = _entity_ids(seed, 1, block + 1)
+    location_ids = _entity_ids(seed, 2, block + 1)
+    organizations = np.concatenate([_organization_chunk(seed, chunk) for chunk in range(block + 1)])
+    assignee = _popular(rng, n, len(assignee_ids))
+    individual = rng.random(n) < 0.05
+    return pd.DataFrame({
+        key: doc,
+        'assignee_sequence': sequence,
+        'assignee_id': assignee_ids[assignee],
+        'disambig_assignee_individual_name_first': np.where(
+            individual, np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), n)], None),
+        'disambig_assignee_individual_name_last': np.where(
+            individual, np.array(LAST_NAMES)[rng.integers(0, len(LAST_NAMES), n)], None),
+        'disambig_assignee_organization': np.where(individual, None, organizations[assignee]),
+        'assignee_type': np.where(individual, 4, rng.choice([2, 3], n, p=[0.8, 0.2])),
+        'location_id': location_ids[assignee % len(location_ids)]
+    })
+
+
+def location_block(seed, chunk):
+    """
+    Rows of g_location_disambiguated for one chunk of the location pool
+    """
+    location_ids = _entity_chunk(seed, 2, chunk)
+    locations = len(location_ids)
+    rng = np.random.default_rng([seed, 4, chunk])
+    city = rng.integers(0, len(CITIES), locations)
+    cities = [CITIES[i] for i in city]
+    us = np.array([c[2] == 'US' for c in cities])
+    return pd.DataFrame({
+        'location_id': location_ids,
+        'disambig_city': [c[0] for c in cities],
+        'disambig_state': [c[1] for c in cities],
+        'disambig_country': [c[2] for c in cities],
+        'latitude': np.round([c[3] for c in cities] + rng.normal(0, 0.05, locations), 4),
+        'longitude': np.round([c[4] for c in cities] + rng.normal(0, 0.05, locations), 4),
+        'county': np.where(us, 'County ' + pd.Series(city).astype(str), None),
+        'state_fips': np.where(us, pd.Series(city * 3 + 1).astype(str).str.zfill(2), None),
+        'county_fips': np.where(us, pd.Series(city * 7 + 1).astype(str).str.zfill(3), None)
+    })
+
+
+def iter_blocks(table, patents, seed=0):
+    """
+    Generate a synthetic table block by block
+
+    Args:
+        table (str): One of TABLES
+        patents (int): Number of patents (and of publications) in the release
+        seed (int, optional): Seed of the release. The same seed always gives the same data
+
+    Returns:
+        iterator of pd.DataFrame
+    """
+    for block in range((patents + BLOCK_ROWS - 1) // BLOCK_ROWS):
+        # Blocks are always generated whole and the last one cut short, so its rows do not depend on patents
+        rows = min(BLOCK_ROWS, patents - block * BLOCK_ROWS)
+        if table == 'g_location_disambiguated':
+            # One chunk of locations per block, covering every location ID the assignee tables use
+            yield location_block(seed, block)
+        elif table == 'g_patent':
+            yield patent_block(seed, block).head(rows)
+        elif table == 'pg_published_application':
+            yield publication_block(seed, block).head(rows)
+        elif table in ('g_assignee_disambiguated', 'pg_assignee_disambiguated'):
+            key = 'patent_id' if table.startswith('g_') else 'document_number'
+            documents = (patent_block if key == 'patent_id' else publication_block)(seed, block)[key]
+            assignees = assignee_block(seed, block, documents, key)
+            yield assignees[assignees[key].isin(documents.head(rows))].reset_index(drop=True)
+        else:
+            raise ValueError(f"No generator for table {table}, choose from {TABLES}")
+    return
+
+
+def generate_table(table, patents, seed=0):
+    """
+    Generate a whole synthetic table in memory
+
+    Args:
+        table (str): One of TABLES
+        patents (int): Number of patents (and of publications) in the release
+        seed (int, optional): Seed of the release
+
+    Returns:
+        pd.DataFrame: The table
+    """
+    return pd.concat(list(iter_blocks(table, patents, seed)), ignore_index=True)
+
+
+def write_release(out_dir, patents, seed=0, tables=None):
+    """
+    Write a synthetic release as .tsv.zip files named like the PatentsView downloads
+
+    A release written with more patents and the same seed contains every row of the smaller one, so
+    two calls give a prior and a new release to compare.
+
+    Args:
+        out_dir (str): Directory of the release
+        patents (int): Number of patents (and of publications)
+        seed (int, optional): Seed of the release
+        tables (list, optional): Tables to write, all of TABLES by default
+
+    Returns:
+        list: Paths of the written files
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for table in tables or TABLES:
+        path = os.path.join(out_dir, table + ".tsv.zip")
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zfile:
+            with zfile.open(table + ".tsv", 'w') as member:
+                for n, block in enumerate(iter_blocks(table, patents, seed)):
+                    member.write(block.to_csv(sep="\t", index=False, header=n == 0).encode('utf-8'))
+        paths.append(path)
+    return paths
+
+
+def write_legacy_tables(out_dir, patents, seed=0):
+    """
+    Write the 2020-era tables read by the misc scripts, in the directories they extract them to
+    (applications/application.tsv, assignees/assignee.tsv, crosswalk/patent_assignee.tsv,
+    locations/location.tsv, publications/publication.tsv and assignees/rawassignee.tsv)
+
+    Args:
+        out_dir (str): Directory standing in for the scripts' working directory
+        patents (int): Number of patents (and of publications)
+        seed (int, optional): Seed of the data
+
+    Returns:
+        str: out_dir
+    """
+    patent = generate_table('g_patent', patents, seed)
+    assignee = generate_table('g_assignee_disambiguated', patents, seed)
+    publication = generate_table('pg_published_application', patents, seed)
+    pg_assignee = generate_table('pg_assignee_disambiguated', patents, seed)
+    location = generate_table('g_location_disambiguated', patents, seed)
+    tables = {
+        ('applications', 'application.tsv'): patent[['patent_id', 'patent_date']].rename(
+            columns={'patent_date': 'date'}),
+        ('assignees', 'assignee.tsv'): assignee.drop_duplicates('assignee_id').rename(
+            columns={'assignee_id': 'id', 'assignee_type': 'type',
+                     'disambig_assignee_organization': 'organization'})[['id', 'type', 'organization']],
+        ('crosswalk', 'patent_assignee.tsv'): assignee[['patent_id', 'assignee_id', 'location_id']],
+        ('locations', 'location.tsv'): location.rename(
+            columns={'location_id': 'id', 'disambig_country': 'country'})[['id', 'country']],
+        ('publications', 'publication.tsv'): pd.DataFrame({
+            'document_number': publication['document_number'], 'date': publication['filing_date'],
+            'country': 'US', 'kind': 'A1', 'filing_type': publication['application_type']}),
+        ('assignees', 'rawassignee.tsv'): pd.DataFrame({
+            'document_number': pg_assignee['document_number'], 'sequence': pg_assignee['assignee_sequence'],
+            'name_first': pg_assignee['disambig_assignee_individual_name_first'],
+            'name_last': pg_assignee['disambig_assignee_individual_name_last'],
+            'organization': pg_assignee['disambig_assignee_organization'],
+            'type': pg_assignee['assignee_type'], 'city': None, 'state': None, 'country': 'US'}),
+    }
+    for (folder, file), df in tables.items():
+        os.makedirs(os.path.join(out_dir, folder), exist_ok=True)
+        df.to_csv(os.path.join(out_dir, folder, file), sep="\t", index=False)
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic PatentsView release")
+    parser.add_argument("out_dir", help="directory of the release")
+    parser.add_argument("--patents", type=int, default=100000, help="number of patents and of publications")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the release")
+    parser.add_argument("--tables", nargs="+", choices=TABLES, help="tables to write")
+    args = parser.parse_args()
+    for path in write_release(args.out_dir, args.patents, args.seed, args.tables):
+        print(f"\t Wrote {path}")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import abc
+import argparse
+import zipfile
+import pandas as pd
+from column_stats import ColumnStatsEngine, build_metrics, canonical_text, infer_kind, pandas_dtype
+from pv_loader import read_file
+
+# Strings pandas.read_csv treats as missing by default
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def _csv_member(path):
+    """
+    Open a table file for reading as delimited text, returning the file object and its delimiter
+    """
+    if path.endswith(".zip"):
+        zfile = zipfile.ZipFile(path)
+        return zfile.open(zfile.namelist()[0]), "\t"
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, 'rb'), ","
+    return open(path, 'rb'), "\t"
+
+
+def _parquet_text(path):
+    """
+    Read a Parquet table file as text the way the pandas backend hashes it
+
+    Returns:
+        tuple: (pyarrow.Table of string columns, dict of column name to kind)
+    """
+    import pyarrow as pa
+    df = pd.read_parquet(path)
+    kinds = {col: infer_kind(df[col]) for col in df.columns}
+    columns = {}
+    for col in df.columns:
+        text = canonical_text(df[col])
+        columns[col] = pa.array(text, type=pa.string(), mask=df[col].isna().to_numpy())
+    return pa.table(columns), kinds
+
+
+def _comparable(new_kind, old_kind):
+    """
+    Whether values of a column can be common to both releases: numbers compare with numbers, booleans
+    with booleans and text with text, as in ReleaseStats.num_common
+    """
+    numbers = ('int', 'float')
+    return new_kind == old_kind or (new_kind in numbers and old_kind in numbers)
+
+
+class MetricsBackend(abc.ABC):
+    """
+    Computes the DataFrameComparator metrics for one table from the files of both releases
+
+    Dtypes are inferred from the values the way pandas.read_csv types a whole column, and like
+    ColumnStatsEngine, numbers and booleans are compared by their parsed values and text as it is written.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def compute(self, new_path, old_path):
+        """
+        Args:
+            new_path (str): Table file in the new release (.tsv.zip, .csv.gz, .tsv or .parquet)
+            old_path (str): Table file in the prior release
+
+        Returns:
+            pd.DataFrame: The metrics table written by DataFrameComparator.export_metrics
+        """
+
+
+class PandasBackend(MetricsBackend):
+    """
+    The reference backend: single-threaded pandas chunks through ColumnStatsEngine
+    """
+    name = 'pandas'
+
+    def __init__(self, chunksize=1000000):
+        self.chunksize = chunksize
+        return
+
+    def compute(self, new_path, old_path):
+        engine = ColumnStatsEngine()
+        engine.consume(read_file(new_path, self.chunksize, text=True), read_file(old_path, self.chunksize, text=True))
+        return engine.metrics()
+
+
+class ArrowBackend(MetricsBackend):
+    """
+    Multi-threaded, vectorized metrics with PyArrow compute kernels
+    """
+    name = 'arrow'
+
+    def _read(self, path):
+        """
+        Returns:
+            tuple: (number of rows, dict of column name to (text column, kind))
+        """
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        if path.endswith(".parquet"):
+            table, kinds = _parquet_text(path)
+            return table.num_rows, {name: (table[name], kinds[name]) for name in table.column_names}
+        header = read_file(path, nrows=0).columns
+        f, delimiter = _csv_member(path)
+        with f:
+            # Read every column as text, with the missing values pandas recognises
+            reader = pacsv.read_csv(
+                f, parse_options=pacsv.ParseOptions(delimiter=delimiter, newlines_in_values=True),
+                convert_options=pacsv.ConvertOptions(null_values=NA_VALUES, strings_can_be_null=True,
+                                                     column_types={col: pa.string() for col in header}))
+        columns = {name: (reader[name], self._infer(reader[name])) for name in reader.column_names}
+        return reader.num_rows, columns
+
+    @staticmethod
+    def _infer(column):
+        """
+        Infer the kind of a text column the way pandas types it
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        if column.null_count == len(column):
+            return 'null'
+        for kind, dtype in [('int', pa.int64()), ('float', pa.float64())]:
+            try:
+                pc.cast(column, dtype)
+                return kind
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+        lowered = pc.utf8_lower(column)
+        if pc.all(pc.is_in(lowered.drop_null(), value_set=pa.array(['true', 'false']))).as_py():
+            return 'bool'
+        return 'string'
+
+    @staticmethod
+    def _parse(column, kind):
+        """
+        Parse a text column of an 'int', 'float' or 'bool' kind into its values
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        if kind == 'int':
+            return pc.cast(column, pa.int64())
+        if kind == 'float':
+            return pc.cast(column, pa.float64())
+        if kind == 'bool':
+            return pc.equal(pc.utf8_lower(column), 'true')
+        return column
+
+    def compute(self, new_path, old_path):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        new_records, new_columns = self._read(new_path)
+        prior_records, prior_columns = self._read(old_path)
+        new_columns = {col: (self._parse(column, kind), kind) for col, (column, kind) in new_columns.items()}
+        prior_columns = {col: (self._parse(column, kind), kind) for col, (column, kind) in prior_columns.items()}
+        columns = []
+        for col, (new_col, new_kind) in new_columns.items():
+            if col not in prior_columns:
+                continue
+            old_col, old_kind = prior_columns[col]
+            new_values = pc.unique(new_col.drop_null())
+            old_values = pc.unique(old_col.drop_null())
+            common = 0
+            if len(new_values) and len(old_values) and _comparable(new_kind, old_kind):
+                if new_kind != old_kind:
+                    new_values, old_values = pc.cast(new_values, pa.float64()), pc.cast(old_values, pa.float64())
+                common = pc.sum(pc.is_in(new_values, value_set=old_values)).as_py() or 0
+            columns.append({
+                'Column': col,
+                'New_Num_Unique_Values': len(new_values),
+                'Prior_Num_Unique_Values': len(old_values),
+                'New_Num_Missing_Values': new_col.null_count,
+                'Prior_Num_Missing_Values': old_col.null_count,
+                'Num_Values_Common': common,
+                'New_Data_Type': pandas_dtype(new_kind, new_col.null_count > 0),
+                'Prior_Data_Type': pandas_dtype(old_kind, old_col.null_count > 0)
+            })
+
+        def duplicated_rows(num_records, table_columns):
+            table = pa.table({name: column for name, (column, kind) in table_columns.items()})
+            return num_records - table.group_by(table.column_names).aggregate([]).num_rows
+
+        return build_metrics(columns, new_records, prior_records,
+                             duplicated_rows(new_records, new_columns), duplicated_rows(prior_records, prior_columns))
+
+
+class PolarsBackend(MetricsBackend):
+    """
+    Multi-threaded metrics with Polars lazy frames
+    """
+    name = 'polars'
+
+    def _scan(self, path):
+        """
+        Returns:
+            tuple: (LazyFrame of text columns, dict of column name to kind, or None for text files)
+        """
+        import polars as pl
+        if path.endswith(".parquet"):
+            table, kinds = _parquet_text(path)
+            return pl.from_arrow(table).lazy(), kinds
+        f, delimiter = _csv_member(path)
+        options = {'separator': delimiter, 'infer_schema_length': 0, 'null_values': NA_VALUES,
+                   'quote_char': '"'}
+        if path.endswith((".zip", ".gz")):
+            # Polars cannot scan compressed files lazily, so the text is read eagerly, all as strings
+            with f:
+                return pl.read_csv(f, **options).lazy(), None
+        f.close()
+        return pl.scan_csv(path, **options), None
+
+    @staticmethod
+    def _kinds(lf):
+        """
+        Infer each text column's kind the way pandas types it
+        """
+        import polars as pl
+        schema = lf.collect_schema()
+        checks = []
+        for col in schema.names():
+            checks += [pl.col(col).null_count().alias(f"{col}#null"),
+                       pl.col(col).cast(pl.Int64, strict=False).null_count().alias(f"{col}#int"),
+                       pl.col(col).cast(pl.Float64, strict=False).null_count().alias(f"{col}#float"),
+                       pl.col(col).str.to_lowercase().is_in(['true', 'false']).not_()
+                       .and_(pl.col(col).is_not_null()).sum().alias(f"{col}#bool"),
+                       pl.len().alias(f"{col}#len")]
+        counts = lf.select(checks).collect().row(0, named=True)
+        kinds = {}
+        for col in schema.names():
+            nulls = counts[f"{col}#null"]
+            if nulls == counts[f"{col}#len"]:
+                kinds[col] = 'null'
+            elif counts[f"{col}#int"] == nulls:
+                kinds[col] = 'int'
+            elif counts[f"{col}#float"] == nulls:
+                kinds[col] = 'float'
+            elif counts[f"{col}#bool"] == 0:
+                kinds[col] = 'bool'
+            else:
+                kinds[col] = 'string'
+        return kinds
+
+    @staticmethod
+    def _parse(col, kind):
+        """
+        Expression parsing a text column of an 'int', 'float' or 'bool' kind into its values
+        """
+        import polars as pl
+        if kind == 'int':
+            return pl.col(col).cast(pl.Int64)
+        if kind == 'float':
+            return pl.col(col).cast(pl.Float64)
+        if kind == 'bool':
+            return pl.col(col).str.to_lowercase().eq('true')
+        return pl.col(col)
+
+    def compute(self, new_path, old_path):
+        import polars as pl
+        releases = []
+        for path in [new_path, old_path]:
+            lf, kinds = self._scan(path)
+            lf = lf.cache()
+            releases.append((lf, kinds or self._kinds(lf)))
+        (new_lf, new_kinds), (old_lf, old_kinds) = releases
+        new_lf = new_lf.select([self._parse(col, kind) for col, kind in new_kinds.items()])
+        old_lf = old_lf.select([self._parse(col, kind) for col, kind in old_kinds.items()])
+
+        def profile(lf, kinds):
+            exprs = [pl.len().alias("#records"), (pl.len() - pl.struct(pl.all()).n_unique()).alias("#duplicates")]
+            for col in kinds:
+                exprs += [pl.col(col).drop_nulls().n_unique().alias(f"{col}#unique"),
+                          pl.col(col).null_count().alias(f"{col}#missing")]
+            return lf.select(exprs).collect().row(0, named=True)
+
+        new_stats = profile(new_lf, new_kinds)
+        old_stats = profile(old_lf, old_kinds)
+
+        def distinct(lf, col, dtype):
+            return lf.select(pl.col(col).cast(dtype)).drop_nulls().unique()
+
+        columns = []
+        for col, new_kind in new_kinds.items():
+            if col not in old_kinds:
+                continue
+            old_kind = old_kinds[col]
+            common = 0
+            if _comparable(new_kind, old_kind):
+                dtype = pl.Float64 if new_kind != old_kind else new_lf.collect_schema()[col]
+                common = (distinct(new_lf, col, dtype).join(distinct(old_lf, col, dtype), on=col, how='semi')
+                          .select(pl.len()).collect().item())
+            columns.append({
+                'Column': col,
+                'New_Num_Unique_Values': new_stats[f"{col}#unique"],
+                'Prior_Num_Unique_Values': old_stats[f"{col}#unique"],
+                'New_Num_Missing_Values': new_stats[f"{col}#missing"],
+                'Prior_Num_Missing_Values': old_stats[f"{col}#missing"],
+                'Num_Values_Common': common,
+                'New_Data_Type': pandas_dtype(new_kind, new_stats[f"{col}#missing"] > 0),
+                'Prior_Data_Type': pandas_dtype(old_kind, old_stats[f"{col}#missing"] > 0)
+            })
+        return build_metrics(columns, new_stats["#records"], old_stats["#records"],
+                             new_stats["#duplicates"], old_stats["#duplicates"])
+
+
+BACKENDS = {backend.name: backend for backend in [PandasBackend, ArrowBackend, PolarsBackend]}
+
+
+def get_backend(name, **kwargs):
+    """
+    Create a metrics backend by name
+
+    Args:
+        name (str): 'pandas', 'arrow' or 'polars'
+        kwargs: Options passed to the backend
+
+    Returns:
+        MetricsBackend: The backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown metrics backend {name}, choose from {list(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def check_backend_parity(new_path, old_path, backends=('arrow', 'polars')):
+    """
+    Run the same table through the pandas backend and each other backend and compare the CSV output
+
+    Args:
+        new_path (str): Table file in the new release
+        old_path (str): Table file in the prior release
+        backends (tuple, optional): Backends checked against pandas
+
+    Returns:
+        dict: Backend name to True if its metrics CSV is identical to the pandas one
+    """
+    expected = PandasBackend().compute(new_path, old_path).to_csv(index=False)
+    results = {}
+    for name in backends:
+        actual = get_backend(name).compute(new_path, old_path).to_csv(index=False)
+        results[name] = actual == expected
+        if not results[name]:
+            print(f"\t {name} backend differs from pandas:\n{actual}\nexpected:\n{expected}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the metrics backends agree with pandas on a table")
+    parser.add_argument("new_file", help="table file in the new release")
+    parser.add_argument("old_file", help="table file in the prior release")
+    parser.add_argument("--backends", nargs="+", default=['arrow', 'polars'], help="backends to check")
+    args = parser.parse_args()
+    print(check_backend_parity(args.new_file, args.old_file, tuple(args.backends)))
+    return
+
+
+if __name__ == "__main__":
+    main()
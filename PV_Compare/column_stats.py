@@ -0,0 +1,616 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from instrumentation import metrics
+from sketches import ColumnSketch
+
+# Hash given to missing values so they compare equal whatever dtype the chunk was parsed with
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+ROW_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+# Version of the hashing and dtype inference; profiles saved by other versions are not comparable
+PROFILE_VERSION = 3
+# Name of the dtype pandas gives text columns ('object', or 'str' from pandas 3)
+PANDAS_STRING_DTYPE = str(pd.Series(["x"]).dtype)
+# Kinds whose values are compared as the numbers or booleans pandas.read_csv parses them to
+PARSED_KINDS = ('int', 'float', 'bool')
+
+
+def infer_kind(series):
+    """
+    Get the kind of a column's values: 'null', 'int', 'float', 'bool' or 'string'
+
+    Text is inferred from its values the way pandas.read_csv types a column, so a table read as text
+    (read_file(..., text=True)) reports the dtypes a typed full read would give.
+
+    Args:
+        series (pd.Series): Column values
+
+    Returns:
+        str: The kind
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'bool'
+    values = series.dropna()
+    if values.empty:
+        return 'null'
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return 'int'
+    if pd.api.types.is_float_dtype(series.dtype):
+        return 'float'
+    if not (pd.api.types.is_string_dtype(series.dtype) or series.dtype == object):
+        return 'string'
+    text = values.astype(str)
+    try:
+        # Raises at the first value that is not a number, so text columns are rejected quickly
+        numbers = pd.to_numeric(text)
+        return 'int' if pd.api.types.is_integer_dtype(numbers.dtype) else 'float'
+    except (ValueError, TypeError):
+        pass
+    if text.str.lower().isin(['true', 'false']).all():
+        return 'bool'
+    return 'string'
+
+
+def merge_kinds(kinds):
+    """
+    Combine the kinds of a column's chunks into the kind of the whole column
+
+    Args:
+        kinds (iterable): Kinds from infer_kind
+
+    Returns:
+        str: 'null' if every chunk was missing, the common kind, 'float' for ints and floats, otherwise 'string'
+    """
+    merged = 'null'
+    for kind in kinds:
+        if kind == 'null' or kind == merged:
+            continue
+        if merged == 'null':
+            merged = kind
+        elif {merged, kind} == {'int', 'float'}:
+            merged = 'float'
+        else:
+            merged = 'string'
+    return merged
+
+
+def pandas_dtype(kind, has_nulls):
+    """
+    Name of the dtype pandas.read_csv gives a whole column of a kind
+    """
+    if kind == 'null':
+        return 'float64'
+    if kind == 'int':
+        return 'float64' if has_nulls else 'int64'
+    if kind == 'bool':
+        return 'object' if has_nulls else 'bool'
+    if kind == 'float':
+        return 'float64'
+    return PANDAS_STRING_DTYPE
+
+
+def _number_text(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2 ** 63:
+        return str(int(value))
+    return str(value)
+
+
+def canonical_text(series):
+    """
+    Get the text form of a column's values, which is what the metrics hash
+
+    Text is kept as it is. Numbers are written without a trailing .0 when they are whole, so a
+    value hashes the same whether its chunk was read as text or parsed as numbers.
+
+    Args:
+        series (pd.Series): Column values
+
+    Returns:
+        np.ndarray: Object array of strings (missing values are left as they are)
+    """
+    values = series.to_numpy(dtype=object)
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return values.astype(str).astype(object)
+    if pd.api.types.is_integer_dtype(series.dtype) and not series.hasnans:
+        return series.to_numpy().astype(str).astype(object)
+    if pd.api.types.is_float_dtype(series.dtype):
+        numbers = series.to_numpy(dtype='float64', na_value=np.nan)
+        text = numbers.astype(str).astype(object)
+        whole = np.isfinite(numbers) & (np.floor(numbers) == numbers) & (np.abs(numbers) < 2 ** 63)
+        text[whole] = numbers[whole].astype(np.int64).astype(str)
+        return text
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return np.array([_number_text(value) for value in values.tolist()], dtype=object)
+    if pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        return values
+    return np.array([value if isinstance(value, str) else _number_text(value) for value in values.tolist()],
+                    dtype=object)
+
+
+def parse_values(series, kind):
+    """
+    Parse a text column of an 'int', 'float' or 'bool' kind into the values pandas.read_csv gives it,
+    so differently written equal values (e.g. '001', '1' and '1.0', or 'True' and 'true') become equal
+
+    Args:
+        series (pd.Series): Column values
+        kind (str): Kind of the values, from infer_kind
+
+    Returns:
+        pd.Series: The parsed values, or the column itself if it is not text of a parsed kind
+    """
+    if kind not in PARSED_KINDS or not (pd.api.types.is_string_dtype(series.dtype) or series.dtype == object):
+        return series
+    if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'mixed'):
+        # Already parsed, e.g. a boolean column with missing values read from Parquet
+        return series
+    if kind == 'bool':
+        return series.astype(object).str.lower().map({'true': True, 'false': False})
+    return pd.to_numeric(series)
+
+
+def hash_column(series, kind=None):
+    """
+    Hash the values of a column to 64 bits
+
+    The canonical text of each value is hashed, so the same value gets the same hash whatever dtype
+    its chunk was parsed with, and missing values all get the same hash.
+
+    Args:
+        series (pd.Series): Column values
+        kind (str, optional): Kind of the values. Text of an 'int', 'float' or 'bool' kind is hashed
+                              by its parsed value (see parse_values), other text as it is written
+
+    Returns:
+        tuple: (np.ndarray of uint64 hashes, np.ndarray of bool missing flags)
+    """
+    series = parse_values(series, kind)
+    missing = series.isna().to_numpy()
+    values = canonical_text(series)
+    values[missing] = ""
+    hashes = pd.util.hash_array(values)
+    hashes[missing] = NULL_HASH
+    return hashes, missing
+
+
+class HashSet:
+    """
+    A set of 64-bit hashes kept as sorted numpy arrays
+
+    Once more than max_in_memory hashes are held, the set is spilled to disk split into
+    partitions by hash value, so finishing or intersecting it only loads one partition at a time.
+    """
+
+    def __init__(self, spill_dir=None, max_in_memory=20_000_000, partitions=64):
+        """
+        Args:
+            spill_dir (str, optional): Directory for spilled partitions. None keeps everything in memory
+            max_in_memory (int, optional): Number of hashes held in memory before spilling
+            partitions (int, optional): Number of on-disk partitions
+        """
+        self.spill_dir = spill_dir
+        self.max_in_memory = max_in_memory
+        self.partitions = partitions
+        self._pending = []
+        self._pending_size = 0
+        self._spilled = False
+        return
+
+    def add(self, hashes):
+        """
+        Add hashes to the set
+
+        Args:
+            hashes (np.ndarray): uint64 hashes
+        """
+        self._pending.append(np.unique(hashes))
+        self._pending_size += len(self._pending[-1])
+        if self._pending_size > self.max_in_memory:
+            self._compact()
+        return
+
+    def _compact(self):
+        merged = np.unique(np.concatenate(self._pending)) if self._pending else np.empty(0, dtype=np.uint64)
+        self._pending = [merged]
+        self._pending_size = len(merged)
+        if self.spill_dir and self._pending_size > self.max_in_memory:
+            parts = (merged % np.uint64(self.partitions)).astype(np.int64)
+            for part in range(self.partitions):
+                with open(self._partition_path(part), 'ab') as f:
+                    merged[parts == part].tofile(f)
+            self._pending = []
+            self._pending_size = 0
+            self._spilled = True
+        return
+
+    def _partition_path(self, part):
+        return os.path.join(self.spill_dir, f"part_{part}.bin")
+
+    def iter_partitions(self):
+        """
+        Yield the distinct hashes of the set one partition at a time
+
+        Yields:
+            np.ndarray: Sorted distinct uint64 hashes of one partition
+        """
+        self._compact()
+        values = self._pending[0]
+        if not self._spilled:
+            parts = (values % np.uint64(self.partitions)).astype(np.int64)
+            for part in range(self.partitions):
+                yield values[parts == part]
+            return
+        parts = (values % np.uint64(self.partitions)).astype(np.int64)
+        for part in range(self.partitions):
+            on_disk = np.fromfile(self._partition_path(part), dtype=np.uint64)
+            yield np.unique(np.concatenate([on_disk, values[parts == part]]))
+        return
+
+    def save(self, path):
+        """
+        Write the set to a directory as sorted, deduplicated partition files
+
+        Args:
+            path (str): Directory to write to
+        """
+        os.makedirs(path, exist_ok=True)
+        for part, values in enumerate(self.iter_partitions()):
+            values.tofile(os.path.join(path, f"part_{part}.bin"))
+        return
+
+    @classmethod
+    def load(cls, path, partitions=64):
+        """
+        Open a set saved with save. Partitions are read from disk only when the set is used
+
+        Args:
+            path (str): Directory the set was saved to
+            partitions (int, optional): Number of partitions the set was saved with
+
+        Returns:
+            HashSet: The saved set
+        """
+        hash_set = cls(path, partitions=partitions)
+        hash_set._spilled = True
+        return hash_set
+
+    def __len__(self):
+        if not self._spilled:
+            self._compact()
+            return len(self._pending[0])
+        return sum(len(part) for part in self.iter_partitions())
+
+    def intersection_size(self, other):
+        """
+        Count the hashes present in both sets
+
+        Args:
+            other (HashSet): The other set, with the same number of partitions
+
+        Returns:
+            int: Size of the intersection
+        """
+        if not self._spilled and not other._spilled:
+            self._compact()
+            other._compact()
+            return len(np.intersect1d(self._pending[0], other._pending[0], assume_unique=True))
+        return sum(len(np.intersect1d(a, b, assume_unique=True))
+                   for a, b in zip(self.iter_partitions(), other.iter_partitions()))
+
+
+class ReleaseStats:
+    """
+    Running statistics of one release of a table, updated one record batch at a time
+    """
+
+    def __init__(self, spill_dir=None, max_in_memory=20_000_000, approximate=False, relative_error=0.01):
+        """
+        Args:
+            spill_dir (str, optional): Directory for spilled hash partitions. None keeps everything in memory
+            max_in_memory (int, optional): Number of hashes per column held in memory before spilling
+            approximate (bool, optional): Track distinct values with fixed-size sketches instead of exact hash sets
+            relative_error (float, optional): Target relative error of the sketches
+        """
+        self.spill_dir = spill_dir
+        self.max_in_memory = max_in_memory
+        self.approximate = approximate
+        self.relative_error = relative_error
+        self.columns = []
+        self.num_records = 0
+        self.missing = {}
+        self.kinds = {}
+        # Hashes of the written values, and of the parsed values while the column's kind is a parsed kind
+        self.values = {}
+        self.parsed = {}
+        self.rows = self._new_set('rows', exact=True)
+        self._duplicated_rows = None
+        # Order-independent digest of all row hashes: equal digests mean the releases hold the same rows
+        self.row_digest = 0
+        self.meta = {}
+        return
+
+    def _new_set(self, name, exact=False):
+        if self.approximate and not exact:
+            return ColumnSketch(self.relative_error)
+        path = None
+        if self.spill_dir:
+            path = os.path.join(self.spill_dir, name)
+            os.makedirs(path, exist_ok=True)
+        return HashSet(path, self.max_in_memory)
+
+    def update(self, batch):
+        """
+        Add one record batch to the statistics
+
+        Args:
+            batch (pd.DataFrame): A chunk of the table
+        """
+        for col in batch.columns:
+            if col not in self.missing:
+                self.columns.append(col)
+                self.missing[col] = 0
+                self.kinds[col] = 'null'
+                self.values[col] = self._new_set(f"col_{len(self.columns)}")
+                self.parsed[col] = self._new_set(f"col_{len(self.columns)}_parsed")
+        row_hashes = np.zeros(len(batch), dtype=np.uint64)
+        for col in self.columns:
+            if col not in batch.columns:
+                continue
+            start = time.perf_counter()
+            series = batch[col]
+            kind = infer_kind(series)
+            self.kinds[col] = merge_kinds([self.kinds[col], kind])
+            hashes, missing = hash_column(series)
+            self.missing[col] += int(missing.sum())
+            self.values[col].add(hashes[~missing])
+            if self.kinds[col] == 'string':
+                # A full read keeps the column as text, so the parsed values are no longer needed
+                self.parsed[col] = None
+            else:
+                parsed = parse_values(series, kind)
+                if parsed is not series:
+                    hashes = hash_column(parsed)[0]
+                self.parsed[col].add(hashes[~missing])
+            # Rows hash the parsed values of columns parsed so far. A column that only turns out to be
+            # text in a later chunk keeps the parsed hashes in the rows read before
+            row_hashes = row_hashes * ROW_HASH_MULTIPLIER ^ hashes
+            metrics.add_time('column_metrics', time.perf_counter() - start, column=col)
+        self.rows.add(row_hashes)
+        self.row_digest = (self.row_digest + int(row_hashes.sum(dtype=np.uint64))) % 2 ** 64
+        self.num_records += len(batch)
+        return
+
+    def dtype(self, col):
+        return pandas_dtype(self.kinds[col], self.missing[col] > 0)
+
+    def distinct(self, col):
+        """
+        Get the distinct values of a column as pandas.read_csv would read the whole column: parsed values
+        for numbers and booleans, written values for text
+
+        Args:
+            col (str): Column name
+
+        Returns:
+            HashSet or ColumnSketch: The distinct value hashes
+        """
+        parsed = self.parsed.get(col)
+        return parsed if parsed is not None else self.values[col]
+
+    def num_unique(self, col):
+        return len(self.distinct(col))
+
+    def num_common(self, other, col):
+        """
+        Count the values of a column found in both releases. Numbers and booleans never equal text,
+        as in a comparison of the typed columns
+
+        Args:
+            other (ReleaseStats): Statistics of the other release
+            col (str): Column name
+
+        Returns:
+            int: Number of common distinct values
+        """
+        if (self.kinds[col] == 'string') != (other.kinds[col] == 'string'):
+            return 0
+        return self.distinct(col).intersection_size(other.distinct(col))
+
+    def num_duplicated_rows(self):
+        if self.rows is None:
+            return self._duplicated_rows
+        return self.num_records - len(self.rows)
+
+    def save(self, path, meta=None):
+        """
+        Save the finished statistics to a directory so the release never has to be re-read
+
+        Writes stats.json with the schema, dtypes, counts, missing counts, row digest and, in
+        approximate mode, the column sketches. Exact hash sets are written next to it as partition files.
+
+        Args:
+            path (str): Directory to write to
+            meta (dict, optional): Extra fields stored in stats.json (e.g. source file and hash)
+        """
+        os.makedirs(path, exist_ok=True)
+        columns = []
+        for i, col in enumerate(self.columns):
+            column = {'name': col, 'missing': self.missing[col], 'dtype': self.dtype(col), 'kind': self.kinds[col]}
+            if self.approximate:
+                column['sketch'] = self.distinct(col).to_dict()
+            else:
+                column['values'] = f"col_{i}"
+                self.distinct(col).save(os.path.join(path, column['values']))
+            columns.append(column)
+        stats = {'version': PROFILE_VERSION,
+                 'meta': meta or {},
+                 'approximate': self.approximate,
+                 'relative_error': self.relative_error,
+                 'num_records': self.num_records,
+                 'num_duplicated_rows': int(self.num_duplicated_rows()),
+                 'row_digest': format(self.row_digest, '016x'),
+                 'columns': columns}
+        tmp = os.path.join(path, "stats.json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp, os.path.join(path, "stats.json"))
+        return
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load statistics saved with save
+
+        Args:
+            path (str): Directory the statistics were saved to
+
+        Returns:
+            ReleaseStats: Statistics that can be compared against a new release but not updated
+
+        Raises:
+            ValueError: If the statistics were saved with a different hashing version
+        """
+        with open(os.path.join(path, "stats.json")) as f:
+            data = json.load(f)
+        if data.get('version') != PROFILE_VERSION:
+            raise ValueError(f"Statistics in {path} were saved with version {data.get('version', 1)} of the "
+                             f"hashing, not {PROFILE_VERSION}; profile the release again")
+        stats = cls(approximate=data['approximate'], relative_error=data['relative_error'])
+        stats.meta = data['meta']
+        stats.num_records = data['num_records']
+        stats.rows = None
+        stats._duplicated_rows = data['num_duplicated_rows']
+        stats.row_digest = int(data['row_digest'], 16)
+        for column in data['columns']:
+            col = column['name']
+            stats.columns.append(col)
+            stats.missing[col] = column['missing']
+            stats.kinds[col] = column['kind']
+            if data['approximate']:
+                stats.values[col] = ColumnSketch.from_dict(column['sketch'])
+            else:
+                stats.values[col] = HashSet.load(os.path.join(path, column['values']))
+        return stats
+
+
+class ColumnStatsEngine:
+    """
+    Computes the DataFrameComparator metrics from record batches of both releases in one pass
+
+    Distinct values and rows are tracked as 64-bit hashes rather than Python objects, and can be
+    spilled to disk, so tables that do not fit in memory (e.g. pg_claims) can be compared chunk by chunk.
+    """
+
+    def __init__(self, spill_dir=None, max_in_memory=20_000_000, approximate=False, relative_error=0.01,
+                 prior=None):
+        """
+        Args:
+            spill_dir (str, optional): Directory for spilled hash partitions. A temporary directory
+                                       is used if None and max_in_memory is exceeded
+            max_in_memory (int, optional): Number of hashes per column held in memory before spilling
+            approximate (bool, optional): Estimate distinct and common value counts with HyperLogLog and
+                                          theta sketches instead of exact hash sets
+            relative_error (float, optional): Target relative error of the sketches
+            prior (ReleaseStats, optional): Saved statistics of the prior release, used instead of reading it
+        """
+        self._tmp_dir = None
+        if spill_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix="pv_column_stats_")
+            spill_dir = self._tmp_dir
+        self.new = ReleaseStats(os.path.join(spill_dir, "new"), max_in_memory, approximate, relative_error)
+        self._read_prior = prior is None
+        if prior is None:
+            prior = ReleaseStats(os.path.join(spill_dir, "prior"), max_in_memory, approximate, relative_error)
+        self.prior = prior
+        return
+
+    def __del__(self):
+        if self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def consume(self, new_batches, old_batches):
+        """
+        Read the record batches of both releases
+
+        Args:
+            new_batches (iterable): pd.DataFrame chunks of the table in the new release
+            old_batches (iterable): pd.DataFrame chunks of the table in the prior release. Ignored
+                                    when the engine was given saved prior statistics
+        """
+        for batch in new_batches:
+            self.new.update(batch)
+        if self._read_prior:
+            for batch in old_batches:
+                self.prior.update(batch)
+        return
+
+    def metrics(self):
+        """
+        Build the metrics table written by DataFrameComparator.export_metrics
+
+        Returns:
+            pd.DataFrame: A DataFrame with column metrics
+        """
+        columns = []
+        for col in self.new.columns:
+            if col not in self.prior.missing:
+                continue
+            columns.append({
+                'Column': col,
+                'New_Num_Unique_Values': self.new.num_unique(col),
+                'Prior_Num_Unique_Values': self.prior.num_unique(col),
+                'New_Num_Missing_Values': self.new.missing[col],
+                'Prior_Num_Missing_Values': self.prior.missing[col],
+                'Num_Values_Common': self.new.num_common(self.prior, col),
+                'New_Data_Type': self.new.dtype(col),
+                'Prior_Data_Type': self.prior.dtype(col)
+            })
+        return build_metrics(columns, self.new.num_records, self.prior.num_records,
+                             self.new.num_duplicated_rows(), self.prior.num_duplicated_rows())
+
+
+def build_metrics(columns, new_records, prior_records, new_duplicated_rows, prior_duplicated_rows):
+    """
+    Assemble the metrics table from per-column results and print the release warnings
+
+    Every metrics backend goes through this function so their CSV output has the same layout.
+
+    Args:
+        columns (list): One dict per column with the Column, New/Prior_Num_Unique_Values,
+                        New/Prior_Num_Missing_Values, Num_Values_Common and New/Prior_Data_Type keys
+        new_records (int): Number of records in the new release
+        prior_records (int): Number of records in the prior release
+        new_duplicated_rows (int): Number of duplicated rows in the new release
+        prior_duplicated_rows (int): Number of duplicated rows in the prior release
+
+    Returns:
+        pd.DataFrame: A DataFrame with column metrics
+    """
+    metrics = []
+    for column in columns:
+        col = column['Column']
+        if column['New_Num_Unique_Values'] < column['Prior_Num_Unique_Values']:
+            print("\t New release has fewer unique records than prior release for column: ", col)
+        if column['New_Num_Missing_Values'] > 0:
+            print("\t ", col, " has the following number of missing records: ", column['New_Num_Missing_Values'])
+        metrics.append(column)
+
+    if new_records < prior_records:
+        print("\t New release has fewer records than prior release.")
+    if new_duplicated_rows > 0:
+        print("\t New release has the following number of duplicate rows: ", new_duplicated_rows)
+
+    metrics.append({'Column': 'New Release',
+                    'Num_Records': new_records,
+                    'Num_Duplicated_Rows': new_duplicated_rows})
+    metrics.append({'Column': 'Prior Release',
+                    'Num_Records': prior_records,
+                    'Num_Duplicated_Rows': prior_duplicated_rows})
+
+    return pd.DataFrame(metrics)
@@ -0,0 +1,249 @@
+import argparse
+import multiprocessing
+import os
+import time
+import traceback
+import pandas as pd
+from backends import get_backend
+from dataframe_comparator import DataFrameComparator
+from instrumentation import metrics
+from profile_cache import ProfileCache
+from pv_loader import read_file
+from release_catalog import ReleaseCatalog
+from release_report import build_report, check_release
+
+GB = 1024 ** 3
+
+
+def release_dict(dir):
+    """
+    Get the table files of a release as a dictionary of table name to file name
+
+    Args:
+        dir (str): Directory of the release
+
+    Returns:
+        dict: Table name to file name
+    """
+    #Only the downloaded tables, not the manifest, partial downloads or Parquet copies
+    return ReleaseCatalog(dir).tables(formats=['tsv.zip', 'csv.gz'])
+
+
+def compare_table(table, new_path, old_path, output_file, chunksize=1000000, approximate=False, profile_dir=None,
+                  backend='pandas'):
+    """
+    Compare one table between releases and export its metrics CSV
+
+    Args:
+        table (str): Table name
+        new_path (str): Path of the table in the new release
+        old_path (str): Path of the table in the prior release
+        output_file (str): Path of the metrics CSV
+        chunksize (int, optional): Rows read per chunk
+        approximate (bool, optional): Estimate unique/common counts with sketches
+        profile_dir (str, optional): Directory of the profile cache. None disables the cache
+        backend (str, optional): 'pandas', or 'arrow'/'polars' to compute exact metrics with that engine
+                                 instead (the profile cache and approximate mode are pandas only)
+
+    Returns:
+        dict: Record counts of both releases and whether the stored prior profile was used
+    """
+    with metrics.stage('compare', table=table):
+        return _compare_table(table, new_path, old_path, output_file, chunksize, approximate, profile_dir, backend)
+
+
+def _compare_table(table, new_path, old_path, output_file, chunksize, approximate, profile_dir, backend):
+    if backend != 'pandas':
+        table_metrics = get_backend(backend).compute(new_path, old_path)
+        table_metrics.to_csv(output_file, index=False)
+        print(f"\t Metrics exported to {output_file}")
+        counts = table_metrics.set_index('Column')['Num_Records']
+        return {'New_Records': int(counts['New Release']), 'Prior_Records': int(counts['Prior Release']),
+                'Used_Prior_Profile': False}
+    profiles = ProfileCache(profile_dir) if profile_dir else None
+    old_df = profiles.get(old_path, approximate) if profiles else None
+    used_profile = old_df is not None
+    if old_df is None:
+        old_df = read_file(old_path, chunksize, text=True)
+    new_df = read_file(new_path, chunksize, text=True)
+    comparator = DataFrameComparator(new_df, old_df, approximate=approximate)
+    comparator.export_metrics(output_file)
+    if profiles:
+        profiles.put(new_path, comparator.engine.new)
+        if not used_profile:
+            profiles.put(old_path, comparator.engine.prior)
+    return {'New_Records': comparator.engine.new.num_records,
+            'Prior_Records': comparator.engine.prior.num_records,
+            'Used_Prior_Profile': used_profile}
+
+
+def _run_table(conn, kwargs, metrics_config):
+    # Runs in a child process so a crash, memory error or timeout only loses this table
+    metrics.reset()
+    metrics.configure(**metrics_config)
+    try:
+        result = compare_table(**kwargs)
+        conn.send(('ok', result, metrics.snapshot()))
+    except BaseException:
+        conn.send(('error', traceback.format_exc(), metrics.snapshot()))
+    finally:
+        conn.close()
+
+
+def max_concurrency(memory_budget=None, table_memory=4 * GB, max_workers=None):
+    """
+    Number of tables compared at once: the memory budget divided by the memory allowed per table,
+    capped by max_workers (default: the number of CPUs)
+
+    Args:
+        memory_budget (int, optional): Bytes of memory the run may use. None only applies max_workers
+        table_memory (int, optional): Bytes of memory allowed for one table comparison
+        max_workers (int, optional): Upper limit on concurrent tables
+
+    Returns:
+        int: Concurrency cap, at least 1
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if memory_budget:
+        workers = min(workers, memory_budget // table_memory)
+    return max(int(workers), 1)
+
+
+def compare_releases(new_dir, old_dir, output_dir, chunksize=1000000, approximate=False, profile_dir=None,
+                     memory_budget=None, table_memory=4 * GB, max_workers=None, table_timeout=None, tables=None,
+                     backend='pandas', cprofile_stages=None, trace_memory=False):
+    """
+    Compare every table present in both releases on a pool of worker processes
+
+    Tables are started largest file first, so the longest comparisons do not end up running alone
+    at the end. A table that fails, crashes its process or exceeds table_timeout is recorded in the
+    run summary without stopping the other tables.
+
+    Args:
+        new_dir (str): Directory of the new release
+        old_dir (str): Directory of the prior release
+        output_dir (str): Directory for the per-table metrics CSVs and run_summary.csv
+        chunksize (int, optional): Rows read per chunk
+        approximate (bool, optional): Estimate unique/common counts with sketches
+        profile_dir (str, optional): Directory of the profile cache. None disables the cache
+        memory_budget (int, optional): Bytes of memory the run may use
+        table_memory (int, optional): Bytes of memory allowed for one table comparison
+        max_workers (int, optional): Upper limit on concurrent tables
+        table_timeout (float, optional): Seconds after which a table comparison is stopped
+        tables (list, optional): Only compare these tables
+        backend (str, optional): Metrics backend, 'pandas', 'arrow' or 'polars'
+        cprofile_stages (list, optional): Stages ('compare') run under cProfile, written to output_dir/profiles
+        trace_memory (bool, optional): Record the peak Python allocation of each table with tracemalloc
+
+    Returns:
+        pd.DataFrame: The run summary, one row per table. Timers, counters and peak memory of every
+        table are written to run_metrics.json and run_metrics.prom, and the metrics of all tables
+        to release_report.parquet, which release_report.check_release evaluates
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    metrics_config = {'profile_dir': os.path.join(output_dir, "profiles") if cprofile_stages else None,
+                      'profile_stages': cprofile_stages, 'trace_memory': trace_memory}
+    new_files = release_dict(new_dir)
+    old_files = release_dict(old_dir)
+    summary = []
+    pending = []
+    for table in new_files:
+        if tables is not None and table not in tables:
+            continue
+        if table not in old_files:
+            print("\t", table, " is not in prior release.")
+            summary.append({'Table': table, 'Status': 'not in prior release'})
+            continue
+        new_path = os.path.join(new_dir, new_files[table])
+        old_path = os.path.join(old_dir, old_files[table])
+        pending.append({'table': table, 'new_path': new_path, 'old_path': old_path,
+                        'output_file': os.path.join(output_dir, table + ".csv"),
+                        'chunksize': chunksize, 'approximate': approximate, 'profile_dir': profile_dir,
+                        'backend': backend})
+    pending.sort(key=lambda job: os.path.getsize(job['new_path']) + os.path.getsize(job['old_path']), reverse=True)
+
+    workers = max_concurrency(memory_budget, table_memory, max_workers)
+    print(f"Comparing {len(pending)} tables, {workers} at a time")
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop(0)
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_table, args=(child_conn, job, metrics_config))
+            process.start()
+            child_conn.close()
+            running[job['table']] = (process, parent_conn, time.time(), job)
+        for table, (process, conn, started, job) in list(running.items()):
+            elapsed = time.time() - started
+            row = None
+            # Check for a result before liveness: the process may have sent it and exited since the last pass
+            finished = not process.is_alive()
+            if conn.poll():
+                try:
+                    status, result, table_metrics = conn.recv()
+                    metrics.merge(table_metrics, table=table)
+                except EOFError:
+                    status, result = 'error', f"Process exited with code {process.exitcode}"
+                process.join()
+                if status == 'ok':
+                    row = {'Status': 'ok', **result}
+                else:
+                    row = {'Status': 'error', 'Error': result.strip().splitlines()[-1]}
+                    print(f"\t {table} failed:\n{result}")
+            elif finished:
+                row = {'Status': 'error', 'Error': f"Process exited with code {process.exitcode}"}
+            elif table_timeout and elapsed > table_timeout:
+                process.terminate()
+                process.join()
+                row = {'Status': 'timeout', 'Error': f"Exceeded {table_timeout} seconds"}
+            if row is not None:
+                conn.close()
+                del running[table]
+                metrics.count('tables', status=row['Status'])
+                print(f"{table}: {row['Status']} in {elapsed:.1f}s")
+                summary.append({'Table': table, 'Seconds': round(elapsed, 1),
+                                'Output': job['output_file'] if row['Status'] == 'ok' else None, **row})
+        time.sleep(0.1)
+
+    summary_df = pd.DataFrame(summary)
+    summary_path = os.path.join(output_dir, "run_summary.csv")
+    summary_df.to_csv(summary_path, index=False)
+    print(f"Run summary exported to {summary_path}")
+    metrics.write(os.path.join(output_dir, "run_metrics.json"))
+    metrics.write(os.path.join(output_dir, "run_metrics.prom"))
+    # One columnar report across all tables, checked against the release rules
+    build_report(output_dir, summary_df)
+    check_release(output_dir)
+    return summary_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the tables of two PatentsView releases")
+    parser.add_argument("new_dir", help="directory of the new release")
+    parser.add_argument("old_dir", help="directory of the prior release")
+    parser.add_argument("output_dir", help="directory for the metrics CSVs and run summary")
+    parser.add_argument("--chunksize", type=int, default=1000000, help="rows read per chunk")
+    parser.add_argument("--approximate", action="store_true", help="estimate unique/common counts with sketches")
+    parser.add_argument("--profile-dir", help="directory of the profile cache")
+    parser.add_argument("--memory-budget-gb", type=float, help="memory the run may use, in GB")
+    parser.add_argument("--table-memory-gb", type=float, default=4, help="memory allowed per table, in GB")
+    parser.add_argument("--max-workers", type=int, help="maximum number of tables compared at once")
+    parser.add_argument("--table-timeout", type=float, help="seconds after which a table is stopped")
+    parser.add_argument("--tables", nargs="+", help="only compare these tables")
+    parser.add_argument("--backend", default="pandas", choices=["pandas", "arrow", "polars"],
+                        help="engine used to compute the metrics")
+    parser.add_argument("--cprofile", action="store_true", help="profile each table comparison with cProfile")
+    parser.add_argument("--trace-memory", action="store_true", help="record peak Python allocations with tracemalloc")
+    args = parser.parse_args()
+    compare_releases(args.new_dir, args.old_dir, args.output_dir, chunksize=args.chunksize,
+                     approximate=args.approximate, profile_dir=args.profile_dir,
+                     memory_budget=args.memory_budget_gb * GB if args.memory_budget_gb else None,
+                     table_memory=args.table_memory_gb * GB, max_workers=args.max_workers,
+                     table_timeout=args.table_timeout, tables=args.tables,
+                     backend=args.backend, cprofile_stages=['compare'] if args.cprofile else None,
+                     trace_memory=args.trace_memory)
+    return
+
+
+if __name__ == "__main__":
+    main()
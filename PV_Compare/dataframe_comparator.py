@@ -1,20 +1,53 @@
+import itertools
 import pandas as pd
 import numpy as np
+from column_stats import ColumnStatsEngine, ReleaseStats
 
 class DataFrameComparator:
-    def __init__(self, new_df, old_df):
+    def __init__(self, new_df, old_df, spill_dir=None, approximate=False, relative_error=0.01):
         """
         Compares variables in PatentsView table between new and prior releases.
         
+        Either release can be given as a whole DataFrame or as an iterable of DataFrame chunks
+        (e.g. pd.read_csv(..., chunksize=...)), in which case it is read once, one chunk at a time.
+        The prior release can also be given as ReleaseStats saved from an earlier run.
+        
         Args:
-            new_df (pd.DataFrame): Dataframe of the table in the new release
-            old_df (pd.DataFrame): Dataframe of the table in the prior release
+            new_df (pd.DataFrame or iterable): Dataframe of the table in the new release
+            old_df (pd.DataFrame, iterable or ReleaseStats): Dataframe of the table in the prior release
+            spill_dir (str, optional): Directory where distinct-value hashes are spilled for tables
+                                       too large to profile in memory
+            approximate (bool, optional): Estimate unique and common value counts with HyperLogLog and
+                                          theta sketches, for high-cardinality ID columns
+            relative_error (float, optional): Target relative error of the approximate counts
         """
-        self.df1 = new_df.copy()
-        self.df2 = old_df.copy()
+        self.new_batches, self.new_columns = self._as_batches(new_df)
+        self.prior_stats = None
+        if isinstance(old_df, ReleaseStats):
+            self.prior_stats = old_df
+            self.old_batches, self.old_columns = iter([]), list(old_df.columns)
+        else:
+            self.old_batches, self.old_columns = self._as_batches(old_df)
+        self.spill_dir = spill_dir
+        self.approximate = self.prior_stats.approximate if self.prior_stats else approximate
+        self.relative_error = self.prior_stats.relative_error if self.prior_stats else relative_error
+        self.engine = None
         self._validate_columns()
         return
     
+    @staticmethod
+    def _as_batches(data):
+        """
+        Wrap a DataFrame or chunk iterator as an iterator of chunks and get its columns
+        """
+        if isinstance(data, pd.DataFrame):
+            return iter([data]), list(data.columns)
+        batches = iter(data)
+        first = next(batches, None)
+        if first is None:
+            return iter([]), []
+        return itertools.chain([first], batches), list(first.columns)
+    
     def _validate_columns(self):
         """
         Check if both DataFrames have the same columns
@@ -23,8 +56,8 @@ class DataFrameComparator:
             ValueError: If columns are not identical
         """
         # Get column sets
-        cols1 = set(self.df1.columns)
-        cols2 = set(self.df2.columns)
+        cols1 = set(self.new_columns)
+        cols2 = set(self.old_columns)
         
         # Check column consistency
         if cols1 != cols2:
@@ -43,65 +76,32 @@ class DataFrameComparator:
     
     def _calculate_column_metrics(self):
         """
-        Calculate metrics for each column
+        Calculate metrics for each column in a single pass over both releases
         
         Returns:
             pd.DataFrame: A DataFrame with column metrics
         """
-        metrics = []
-        for col in self.df1.columns:
-            if col not in self.df2.columns:
-                continue
-            # Total records
-            total_records_df1 = len(self.df1)
-            total_records_df2 = len(self.df2)
-            if total_records_df1 < total_records_df2:
-                print("\t New release has fewer records than prior release.")
-            
-            # Unique values
-            unique_df1 = self.df1[col].nunique()
-            unique_df2 = self.df2[col].nunique()
-            if unique_df1 < unique_df2:
-                print("\t New release has fewer unique records than prior release for column: ", col)
-
-            # Missing values
-            missing_df1 = self.df1[col].isna().sum()
-            missing_df2 = self.df2[col].isna().sum()
-            if missing_df1 > 0:
-                print("\t ", col, " has the following number of missing records: ", missing_df1)
-            
-            # Values in both DataFrames
-            common_values = len(set(self.df1[col].dropna()) & set(self.df2[col].dropna()))
-            
-            # Data type
-            dtype_df1 = str(self.df1[col].dtype)
-            dtype_df2 = str(self.df2[col].dtype)
-
-            # Duplicate Records
-            dups_df1 = len(self.df1)-len(self.df1.drop_duplicates())
-            dups_df2 = len(self.df2)-len(self.df2.drop_duplicates())
-            if dups_df1 > 0:
-                print("\t ", col, " has the following number of dupicate rows: ", dups_df1)
-            
-            metrics.append({
-                'Column': col,
-                'New_Num_Unique_Values': unique_df1,
-                'Prior_Num_Unique_Values': unique_df2,
-                'New_Num_Missing_Values': missing_df1,
-                'Prior_Num_Missing_Values': missing_df2,
-                'Num_Values_Common': common_values,
-                'New_Data_Type': dtype_df1,
-                'Prior_Data_Type': dtype_df2
-            })
+        if self.engine is None:
+            self.engine = ColumnStatsEngine(self.spill_dir, approximate=self.approximate,
+                                            relative_error=self.relative_error, prior=self.prior_stats)
+            self.engine.consume(self.new_batches, self.old_batches)
+        return self.engine.metrics()
+    
+    def save_new_release_stats(self, path, meta=None):
+        """
+        Save the statistics of the new release so next month's comparison can use them as the prior release
         
-        metrics.append({'Column': 'New Release',
-                        'Num_Records': total_records_df1,
-                        'Num_Duplicated_Rows': dups_df1})
-        metrics.append({'Column': 'Prior Release',
-                        'Num_Records': total_records_df2,
-                        'Num_Duplicated_Rows': dups_df2})
+        Args:
+            path (str): Directory to save the statistics to
+            meta (dict, optional): Extra fields stored with the statistics
         
-        return pd.DataFrame(metrics)
+        Returns:
+            str: Path to the saved statistics
+        """
+        if self.engine is None:
+            self._calculate_column_metrics()
+        self.engine.new.save(path, meta)
+        return path
     
     def export_metrics(self, output_path='dataframe_comparison_metrics.csv'):
         """
@@ -0,0 +1,306 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of this process, or None where it cannot be read
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class RunMetrics:
+    """
+    Timers, counters and gauges of a run, written as JSON or OpenMetrics text
+
+    Every measurement has a name and optional labels, e.g. the time spent parsing each table is the
+    'parse' timer with a table label. Metrics recorded in worker processes are returned with
+    snapshot() and added to the parent's with merge().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+        return
+
+    def reset(self):
+        """
+        Drop all measurements and turn profiling off
+        """
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+            self.gauges = {}
+        self.profile_dir = None
+        self.profile_stages = set()
+        self.trace_memory = False
+        return
+
+    def configure(self, profile_dir=None, profile_stages=None, trace_memory=False):
+        """
+        Turn on the per-stage hooks
+
+        Args:
+            profile_dir (str, optional): Directory for cProfile output (<stage>_<labels>.prof)
+            profile_stages (list, optional): Stages run under cProfile, '*' for all. Needs profile_dir
+            trace_memory (bool, optional): Record the peak Python allocation of every stage with tracemalloc
+        """
+        self.profile_dir = profile_dir
+        self.profile_stages = set(profile_stages or [])
+        self.trace_memory = trace_memory
+        return
+
+    def add_time(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            timer = self.timers.setdefault(key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            timer['count'] += 1
+            timer['seconds'] += seconds
+            timer['max_seconds'] = max(timer['max_seconds'], seconds)
+        return
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        return
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+        return
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time a block of code
+
+        Args:
+            name (str): Timer name
+            labels: Labels of the measurement, e.g. table='g_patent'
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Time a stage of the run, and profile it or trace its memory when configure() asked for it
+
+        Args:
+            name (str): Stage name, e.g. 'download' or 'compare'
+            labels: Labels of the measurement
+        """
+        profiler = None
+        if self.profile_dir and (name in self.profile_stages or '*' in self.profile_stages):
+            profiler = cProfile.Profile()
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            self.add_time(name, time.perf_counter() - start, **labels)
+            if self.trace_memory:
+                self.gauge(name + "_peak_traced_bytes", tracemalloc.get_traced_memory()[1], **labels)
+                if tracing:
+                    tracemalloc.stop()
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                suffix = "_".join(re.sub(r"[^\w.-]", "_", str(v)) for k, v in sorted(labels.items()))
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}_{suffix}.prof" if suffix else f"{name}.prof"))
+
+    def snapshot(self):
+        """
+        Get every measurement, plus the peak resident memory of this process
+
+        Returns:
+            dict: Lists of 'timers', 'counters' and 'gauges', each entry with a name and labels
+        """
+        peak = peak_rss_bytes()
+        if peak is not None:
+            self.gauge('peak_rss_bytes', peak)
+        with self._lock:
+            return {
+                'timers': [{'name': name, 'labels': dict(labels), **timer}
+                           for (name, labels), timer in self.timers.items()],
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in self.counters.items()],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                           for (name, labels), value in self.gauges.items()],
+            }
+
+    def merge(self, snapshot, **labels):
+        """
+        Add the measurements of another process
+
+        Args:
+            snapshot (dict): Output of snapshot() in the other process
+            labels: Labels added to every merged measurement, e.g. the table the process compared
+        """
+        with self._lock:
+            for entry in snapshot['timers']:
+                key = _key(entry['name'], {**entry['labels'], **labels})
+                timer = self.timers.setdefault(key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                timer['count'] += entry['count']
+                timer['seconds'] += entry['seconds']
+                timer['max_seconds'] = max(timer['max_seconds'], entry['max_seconds'])
+            for entry in snapshot['counters']:
+                key = _key(entry['name'], {**entry['labels'], **labels})
+                self.counters[key] = self.counters.get(key, 0) + entry['value']
+            for entry in snapshot['gauges']:
+                self.gauges[_key(entry['name'], {**entry['labels'], **labels})] = entry['value']
+        return
+
+    def to_openmetrics(self, prefix="pv"):
+        """
+        Format the measurements in the OpenMetrics text format
+
+        Args:
+            prefix (str, optional): Prefix of every metric name
+
+        Returns:
+            str: The exposition text
+        """
+        snapshot = self.snapshot()
+
+        def series(name, labels, value):
+            text = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+            return f"{name}{{{text}}} {value}" if text else f"{name} {value}"
+
+        families = {}
+        for entry in snapshot['timers']:
+            name = f"{prefix}_{entry['name']}_seconds"
+            families.setdefault((name, 'summary'), []).extend([
+                series(name + "_count", entry['labels'], entry['count']),
+                series(name + "_sum", entry['labels'], round(entry['seconds'], 6))])
+        for entry in snapshot['counters']:
+            name = f"{prefix}_{entry['name']}"
+            families.setdefault((name, 'counter'), []).append(series(name + "_total", entry['labels'], entry['value']))
+        for entry in snapshot['gauges']:
+            name = f"{prefix}_{entry['name']}"
+            families.setdefault((name, 'gauge'), []).append(series(name, entry['labels'], entry['value']))
+        lines = []
+        for (name, kind), samples in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the measurements to a file, as OpenMetrics text if the path ends with .prom or .txt
+        and as JSON otherwise
+
+        Args:
+            path (str): Output path
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_openmetrics())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+        print(f"\t Run metrics exported to {path}")
+        return
+
+
+class ProgressReporter:
+    """
+    Reports the progress of a transfer every tenth of the total, or every interval seconds when the
+    total is unknown, and records the bytes in the run metrics
+    """
+
+    def __init__(self, name, total, log, done=0, interval=30, run_metrics=None, **labels):
+        """
+        Args:
+            name (str): Name shown in the messages, e.g. the file name
+            total (int): Expected number of bytes, 0 if unknown
+            log (callable): Called with each progress message, e.g. logger.info
+            done (int, optional): Bytes already transferred earlier, e.g. of a resumed download
+            interval (float, optional): Seconds between messages when the total is unknown
+            run_metrics (RunMetrics, optional): Metrics to record the bytes in, the module-wide ones by default
+            labels: Labels of the recorded bytes
+        """
+        self.name = name
+        self.total = total
+        self.log = log
+        self.interval = interval
+        self.metrics = run_metrics or metrics
+        self.labels = labels
+        self.done = done
+        self.transferred = 0
+        self._next_percent = (int(done * 100 / total) // 10 + 1) * 10 if total else 10
+        self._start = self._last_log = time.monotonic()
+        self._lock = threading.Lock()
+        return
+
+    def __call__(self, nbytes):
+        self.metrics.count('bytes_transferred', nbytes, **self.labels)
+        with self._lock:
+            self.done += nbytes
+            self.transferred += nbytes
+            message = None
+            if self.total:
+                percent = self.done * 100 / self.total
+                if percent >= self._next_percent:
+                    message = f"Downloaded {percent:.0f}% of {self.name}"
+                    self._next_percent = (int(percent) // 10 + 1) * 10
+            elif time.monotonic() - self._last_log >= self.interval:
+                message = f"Downloaded {self.done / 1024 ** 2:.1f} MB of {self.name}"
+                self._last_log = time.monotonic()
+        if message:
+            self.log(message)
+        return
+
+    def rate(self):
+        """
+        Bytes per second transferred since the reporter was created
+        """
+        elapsed = time.monotonic() - self._start
+        return self.transferred / elapsed if elapsed > 0 else 0.0
+
+
+# Measurements of this process, shared by the downloader and the comparison modules
+metrics = RunMetrics()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+from column_stats import ReleaseStats, PROFILE_VERSION
+
+
+class ProfileCache:
+    """
+    Stores the profile (schema, dtypes, counts, missing counts, distinct-value hashes or sketches and
+    row digest) of every table file, keyed by the sha256 of the file
+
+    The new release profiled this month is next month's prior release, so its stored profile
+    replaces re-reading and re-profiling the old files.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): Directory where profiles are stored
+        """
+        self.cache_dir = cache_dir
+        self._hashes_dir = os.path.join(cache_dir, "file_hashes")
+        os.makedirs(self._hashes_dir, exist_ok=True)
+        return
+
+    def _hash_entry(self, path):
+        # One small file per table file, so the processes of compare_releases never rewrite each other's hashes
+        key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self._hashes_dir, key + ".json")
+
+    def file_hash(self, path):
+        """
+        Get the sha256 of a table file
+
+        The hash recorded by PatentsViewDownloader in the release manifest.json is used when it is
+        there, and computed hashes are remembered by path, size and modification time.
+
+        Args:
+            path (str): Path of the table file
+
+        Returns:
+            str: Hex sha256 digest
+        """
+        stat = os.stat(path)
+        manifest = os.path.join(os.path.dirname(path), "manifest.json")
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                entry = json.load(f).get('files', {}).get(os.path.basename(path))
+            if entry and entry.get('sha256') and entry.get('size') == stat.st_size:
+                return entry['sha256']
+        entry_path = self._hash_entry(path)
+        if os.path.exists(entry_path):
+            with open(entry_path) as f:
+                known = json.load(f)
+            if known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+                return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(4 * 1024 * 1024), b''):
+                digest.update(block)
+        entry = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                 'sha256': digest.hexdigest()}
+        # Written whole and renamed, so a reader never sees a partial entry
+        tmp = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, entry_path)
+        return digest.hexdigest()
+
+    def _profile_dir(self, path, approximate):
+        table = os.path.basename(path).split(".")[0]
+        mode = "approx" if approximate else "exact"
+        # Profiles made with another hashing version are left alone and the file is profiled again
+        return os.path.join(self.cache_dir, table, f"{self.file_hash(path)}_{mode}_v{PROFILE_VERSION}")
+
+    def get(self, path, approximate=None):
+        """
+        Get the stored profile of a table file
+
+        Args:
+            path (str): Path of the table file
+            approximate (bool, optional): Only return a profile made in this mode. None accepts either,
+                                          preferring the exact profile
+
+        Returns:
+            ReleaseStats: The stored profile, or None if the file has not been profiled
+        """
+        modes = [False, True] if approximate is None else [approximate]
+        for mode in modes:
+            profile_dir = self._profile_dir(path, mode)
+            if os.path.exists(os.path.join(profile_dir, "stats.json")):
+                return ReleaseStats.load(profile_dir)
+        return None
+
+    def put(self, path, stats):
+        """
+        Store the profile of a table file
+
+        Args:
+            path (str): Path of the table file
+            stats (ReleaseStats): Finished statistics of the file
+
+        Returns:
+            str: Directory of the stored profile
+        """
+        profile_dir = self._profile_dir(path, stats.approximate)
+        if not os.path.exists(os.path.join(profile_dir, "stats.json")):
+            stats.save(profile_dir, meta={'source': os.path.abspath(path), 'sha256': self.file_hash(path)})
+        return profile_dir
@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import tracemalloc
+import pandas as pd
+from instrumentation import metrics
+from table_names import table_name  # noqa: F401 (imported from here by the comparison modules)
+
+try:
+    import pyarrow  # noqa: F401 (only checks that Arrow-backed strings are available)
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
+
+# Column name rules applied to every table, first match wins
+COLUMN_RULES = [
+    (re.compile(r"^(id|.*_id|document_number|application_number|filename)$"), STRING_DTYPE),
+    (re.compile(r"^(.*_)?(country|kind|type|category|section|state|state_fips|county_fips|series_code|rule_47_flag)$"),
+     "category"),
+    (re.compile(r"^(.*_)?date$"), "date"),
+    (re.compile(r"^(.*_)?(sequence|num_.*|.*_count|withdrawn)$"), "Int64"),
+]
+
+# Per-table overrides of the rules, for columns whose names do not say enough
+TABLE_SCHEMAS = {
+    'g_patent': {'patent_title': STRING_DTYPE, 'patent_abstract': STRING_DTYPE, 'wipo_kind': "category"},
+    'g_location_disambiguated': {'latitude': "float64", 'longitude': "float64", 'county': "category",
+                                 'disambig_city': "category", 'disambig_state': "category",
+                                 'disambig_country': "category"},
+    'g_assignee_disambiguated': {'disambig_assignee_organization': STRING_DTYPE, 'assignee_type': "category"},
+    'pg_assignee_disambiguated': {'disambig_assignee_organization': STRING_DTYPE, 'assignee_type': "category"},
+}
+
+
+def table_schema(table, columns):
+    """
+    Get the dtype of each column of a table from the registry
+
+    Args:
+        table (str): Table name, e.g. g_assignee_disambiguated
+        columns (list): Column names in the file
+
+    Returns:
+        dict: Column name to dtype ("date" for columns parsed as dates). Columns without a rule are left out
+    """
+    overrides = TABLE_SCHEMAS.get(table, {})
+    schema = {}
+    for col in columns:
+        if col in overrides:
+            schema[col] = overrides[col]
+            continue
+        for pattern, dtype in COLUMN_RULES:
+            if pattern.match(col):
+                schema[col] = dtype
+                break
+    return schema
+
+
+def _read_csv_args(path):
+    if path.endswith(".csv.gz"):
+        return {'compression': "gzip"}
+    if path.endswith(".zip"):
+        return {'sep': "\t", 'compression': "zip"}
+    return {'sep': "\t"}
+
+
+def _apply_schema(df, schema):
+    """
+    Convert the columns read as plain numbers or strings to their registry dtypes
+    """
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype == "date":
+            # PatentsView has placeholder dates such as 0000-00-00, which become NaT
+            df[col] = pd.to_datetime(df[col], format="%Y-%m-%d", errors="coerce")
+        elif dtype == "Int64":
+            values = pd.to_numeric(df[col], errors="coerce")
+            # Only convert when nothing is lost, otherwise keep the column as read
+            if values.notna().sum() == df[col].notna().sum() and (values.dropna() % 1 == 0).all():
+                df[col] = values.astype("Int64")
+    return df
+
+
+def read_file(file, chunksize=None, columns=None, typed=False, nrows=None, text=False):
+    """
+    Read a PatentsView table file (.tsv.zip, .csv.gz, .tsv or .parquet)
+
+    Args:
+        file (str): Path of the table file
+        chunksize (int, optional): Return an iterator of DataFrames with this many rows each
+        columns (list, optional): Only read these columns
+        typed (bool, optional): Use the schema registry: categoricals for codes, Arrow strings for IDs,
+                                parsed dates and nullable ints. By default pandas infers the dtypes as
+                                the comparison metrics have always used
+        nrows (int, optional): Only read this many rows
+        text (bool, optional): Read every column of a text file as strings (missing values stay missing), so
+                               each chunk holds the values as written whatever the other chunks contain.
+                               Used by the comparison metrics, which infer dtypes from the values
+
+    Returns:
+        pd.DataFrame or iterator of pd.DataFrame
+    """
+    table = table_name(file)
+    if file.endswith(".parquet"):
+        if chunksize:
+            return _timed_chunks(_read_parquet(file, chunksize, columns), table)
+        with metrics.timer('parse', table=table):
+            df = _read_parquet(file, chunksize, columns)
+        return df.head(nrows) if nrows is not None else df
+    args = _read_csv_args(file)
+    schema = {}
+    if typed:
+        header = pd.read_csv(file, nrows=0, **args).columns.to_list()
+        schema = table_schema(table, columns or header)
+        args['dtype'] = {col: dtype for col, dtype in schema.items() if dtype not in ("date", "Int64")}
+        args['dtype'].update({col: STRING_DTYPE for col, dtype in schema.items() if dtype == "date"})
+    elif text:
+        args['dtype'] = str
+    else:
+        args['low_memory'] = False
+    if chunksize:
+        chunks = pd.read_csv(file, usecols=columns, chunksize=chunksize, nrows=nrows, **args)
+        if schema:
+            chunks = (_apply_schema(chunk, schema) for chunk in chunks)
+        return _timed_chunks(chunks, table)
+    with metrics.timer('parse', table=table):
+        df = pd.read_csv(file, usecols=columns, nrows=nrows, **args)
+        df = _apply_schema(df, schema) if schema else df
+    metrics.count('rows_parsed', len(df), table=table)
+    return df
+
+
+def _timed_chunks(chunks, table):
+    """
+    Record the time spent reading each chunk in the 'parse' timer, which excludes the consumer's work
+    """
+    chunks = iter(chunks)
+    while True:
+        with metrics.timer('parse', table=table):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        metrics.count('rows_parsed', len(chunk), table=table)
+        yield chunk
+
+
+def _read_parquet(file, chunksize, columns):
+    if not chunksize:
+        return pd.read_parquet(file, columns=columns)
+    import pyarrow.parquet as pq
+    batches = pq.ParquetFile(file).iter_batches(batch_size=chunksize, columns=columns)
+    return (batch.to_pandas() for batch in batches)
+
+
+def load_table(file, columns=None, typed=True):
+    """
+    Load a table with the schema registry and report how long it took and how much memory it used
+
+    Args:
+        file (str): Path of the table file
+        columns (list, optional): Only read these columns
+        typed (bool, optional): Use the schema registry
+
+    Returns:
+        tuple: (pd.DataFrame, dict with rows, seconds, memory_bytes of the result and
+                peak_bytes allocated during the load)
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    df = read_file(file, columns=columns, typed=typed)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    if not tracing:
+        tracemalloc.stop()
+    report = {'table': table_name(file), 'rows': len(df), 'seconds': round(seconds, 3),
+              'memory_bytes': int(df.memory_usage(deep=True).sum()), 'peak_bytes': peak}
+    print(f"\t Loaded {report['table']}: {report['rows']} rows in {report['seconds']}s, "
+          f"{report['memory_bytes'] / 1024 ** 2:.1f} MB in memory, peak {report['peak_bytes'] / 1024 ** 2:.1f} MB")
+    return df, report
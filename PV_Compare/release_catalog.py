@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import sqlite3
+import zipfile
+from contextlib import closing, contextmanager
+from pv_loader import read_file
+from table_names import table_family, table_name
+
+# Table file formats, in order of preference when a table is there in more than one
+TABLE_SUFFIXES = (".tsv.zip", ".csv.gz", ".tsv", ".parquet")
+# Rows read to infer the dtypes of text tables, as Agg_Compare.read_schema does by default
+SAMPLE_ROWS = 10000
+# Metadata computed on first request, the rest comes from listing the directory
+LAZY_FIELDS = ('uncompressed_size', 'row_count', 'columns', 'dtypes', 'sha256')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    family TEXT NOT NULL,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    uncompressed_size INTEGER,
+    row_count INTEGER,
+    columns TEXT,
+    dtypes TEXT,
+    sha256 TEXT
+)
+"""
+
+
+def table_format(file):
+    for suffix in TABLE_SUFFIXES:
+        if file.endswith(suffix):
+            return suffix.lstrip(".")
+    return None
+
+
+class ReleaseCatalog:
+    """
+    Index of the table files of a release directory, kept in a small SQLite database
+
+    Listing the directory gives each table's name, family, format and file size for free. The
+    uncompressed size, row count, schema and sha256 are computed the first time they are asked for
+    and stored with the file's size and modification time, so they are only computed again for
+    files that changed. Lookups work from several processes at once.
+    """
+
+    def __init__(self, release_dir, index_path=None, in_directory=False):
+        """
+        Args:
+            release_dir (str): Directory of the release
+            index_path (str, optional): Path of the SQLite index. By default a file under ~/.cache/pv_catalog
+                                        named by the release directory
+            in_directory (bool, optional): Keep the index in the release directory as .catalog.sqlite instead,
+                                           so it moves with the release. Not for directories shared through
+                                           network or FUSE mounts (e.g. Databricks volumes), where SQLite
+                                           locking is unreliable
+        """
+        self.release_dir = release_dir
+        if index_path is None and in_directory:
+            index_path = os.path.join(release_dir, ".catalog.sqlite")
+        elif index_path is None:
+            # Outside the release, so the release directory only holds release files
+            key = hashlib.sha256(os.path.abspath(release_dir).encode('utf-8')).hexdigest()[:16]
+            index_path = os.path.join(os.path.expanduser("~"), ".cache", "pv_catalog", key + ".sqlite")
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self.index_path = index_path
+        self._refreshed = False
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+        return
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation, so the catalog can be used from worker processes
+        with closing(sqlite3.connect(self.index_path, timeout=60)) as conn:
+            conn.row_factory = sqlite3.Row
+            with conn:
+                yield conn
+
+    def refresh(self, force=False):
+        """
+        Sync the index with the directory listing: add new files, drop deleted ones and clear the
+        computed metadata of files whose size or modification time changed
+
+        Args:
+            force (bool, optional): List the directory again even if it was already listed
+        """
+        if self._refreshed and not force:
+            return
+        listing = {}
+        with os.scandir(self.release_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and table_format(entry.name):
+                    stat = entry.stat()
+                    listing[entry.name] = (stat.st_size, stat.st_mtime)
+        with self._connect() as conn:
+            known = {row['file']: (row['size'], row['mtime']) for row in conn.execute("SELECT file, size, mtime FROM files")}
+            gone = [(file,) for file in known if file not in listing]
+            conn.executemany("DELETE FROM files WHERE file = ?", gone)
+            for file, (size, mtime) in listing.items():
+                if known.get(file) == (size, mtime):
+                    continue
+                name = table_name(file)
+                conn.execute("INSERT OR REPLACE INTO files (file, name, family, format, size, mtime) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (file, name, table_family(name), table_format(file), size, mtime))
+        self._refreshed = True
+        return
+
+    def _rows(self):
+        self.refresh()
+        with self._connect() as conn:
+            rows = [dict(row) for row in conn.execute("SELECT * FROM files")]
+        return sorted(rows, key=lambda row: (row['name'], TABLE_SUFFIXES.index("." + row['format'])))
+
+    def _row(self, table):
+        """
+        Get the index row of a table name (its preferred file) or of a file name
+        """
+        for row in self._rows():
+            if table in (row['file'], row['name']):
+                return row
+        raise KeyError(f"{table} is not in {self.release_dir}")
+
+    def tables(self, family=None, formats=None):
+        """
+        Get the table files of the release
+
+        Args:
+            family (str, optional): Only tables of this family, 'grant' or 'pgpub'
+            formats (list, optional): Only files of these formats, e.g. ['tsv.zip', 'csv.gz']
+
+        Returns:
+            dict: Table name to file name, the preferred format when a table has several files
+        """
+        files = {}
+        for row in self._rows():
+            if family and row['family'] != family:
+                continue
+            if formats and row['format'] not in formats:
+                continue
+            files.setdefault(row['name'], row['file'])
+        return files
+
+    def counts(self, formats=None):
+        """
+        Count the tables of the release by family
+
+        Args:
+            formats (list, optional): Only count files of these formats
+
+        Returns:
+            dict: Number of tables in 'total', 'pgpub' and 'grant'
+        """
+        count = {'total': 0, 'pgpub': 0, 'grant': 0}
+        for name in self.tables(formats=formats):
+            count['total'] += 1
+            if table_family(name) in count:
+                count[table_family(name)] += 1
+        return count
+
+    def diff_names(self, other, formats=None):
+        """
+        Compare the table names of two releases
+
+        Args:
+            other (ReleaseCatalog): Catalog of the other release
+            formats (list, optional): Only consider files of these formats
+
+        Returns:
+            tuple: (set of tables only in this release, set of tables only in the other)
+        """
+        mine, theirs = set(self.tables(formats=formats)), set(other.tables(formats=formats))
+        return mine - theirs, theirs - mine
+
+    def info(self, table, fields=LAZY_FIELDS):
+        """
+        Get the metadata of a table, computing and storing the requested fields that are not yet known
+
+        Args:
+            table (str): Table name or file name
+            fields (tuple, optional): Lazy fields needed, any of LAZY_FIELDS
+
+        Returns:
+            dict: file, name, family, format, size, mtime and the lazy fields (None where not requested
+            and not yet known). columns and dtypes are lists
+        """
+        row = self._row(table)
+        missing = [field for field in fields if row[field] is None]
+        if 'columns' in missing or 'dtypes' in missing:
+            missing = [field for field in missing if field not in ('columns', 'dtypes')] + ['schema']
+        if missing:
+            path = os.path.join(self.release_dir, row['file'])
+            updates = {}
+            for field in missing:
+                print(f"\t Cataloging {field} of {path}")
+                if field == 'schema':
+                    columns, dtypes = self._schema(path)
+                    updates['columns'], updates['dtypes'] = json.dumps(columns), json.dumps(dtypes)
+                else:
+                    updates[field] = getattr(self, "_" + field)(path)
+            with self._connect() as conn:
+                # Only stored if the file is still the one that was read
+                assignments = ", ".join(f"{field} = ?" for field in updates)
+                conn.execute(f"UPDATE files SET {assignments} WHERE file = ? AND size = ? AND mtime = ?",
+                             (*updates.values(), row['file'], row['size'], row['mtime']))
+            row.update(updates)
+        for field in ('columns', 'dtypes'):
+            if isinstance(row[field], str):
+                row[field] = json.loads(row[field])
+        return row
+
+    def row_count(self, table):
+        return self.info(table, ('row_count',))['row_count']
+
+    def schema(self, table):
+        """
+        Returns:
+            tuple: (list of column names, list of dtype names inferred from the first SAMPLE_ROWS rows,
+                    or from the Parquet footer)
+        """
+        row = self.info(table, ('columns', 'dtypes'))
+        return row['columns'], row['dtypes']
+
+    def sha256(self, table):
+        return self.info(table, ('sha256',))['sha256']
+
+    def scan(self, fields=LAZY_FIELDS):
+        """
+        Compute the requested metadata of every table that does not have it yet
+
+        Returns:
+            pd.DataFrame: One row per table file
+        """
+        import pandas as pd
+        return pd.DataFrame([self.info(row['file'], fields) for row in self._rows()])
+
+    @staticmethod
+    def _uncompressed_size(path):
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as zfile:
+                return sum(info.file_size for info in zfile.infolist())
+        if path.endswith(".gz"):
+            # Size stored in the gzip trailer, modulo 4 GB
+            with open(path, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                return int.from_bytes(f.read(4), 'little')
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            metadata = pq.ParquetFile(path).metadata
+            return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+        return os.path.getsize(path)
+
+    @staticmethod
+    def _row_count(path):
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(path).metadata.num_rows
+        # Parsed rather than counting newlines, since quoted text fields can contain line breaks
+        first = read_file(path, nrows=0).columns[:1].to_list()
+        return sum(len(chunk) for chunk in read_file(path, chunksize=1000000, columns=first))
+
+    @staticmethod
+    def _schema(path):
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(path)
+            return schema.names, [str(field.type) for field in schema]
+        df = read_file(path, nrows=SAMPLE_ROWS)
+        return df.columns.to_list(), [str(dtype) for dtype in df.dtypes]
+
+    def _sha256(self, path):
+        # The downloader records the hash of every file in the release manifest
+        manifest = os.path.join(self.release_dir, "manifest.json")
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                entry = json.load(f).get('files', {}).get(os.path.basename(path))
+            if entry and entry.get('sha256') and entry.get('size') == os.path.getsize(path):
+                return entry['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(4 * 1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
@@ -0,0 +1,199 @@
+import argparse
+import os
+import sys
+from release_catalog import ReleaseCatalog
+# Zipped tables are queried through the downloader's Parquet conversion
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PV_Downloader"))
+
+# Assignee table, document table, document key and date column of each release family
+ASSIGNEE_TABLES = {
+    'grant': ('g_assignee_disambiguated', 'g_patent', 'patent_id', 'patent_date', 'g_location_disambiguated'),
+    'pgpub': ('pg_assignee_disambiguated', 'pg_published_application', 'document_number', 'filing_date',
+              'pg_location_disambiguated'),
+}
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class ReleaseQuery:
+    """
+    SQL over the tables of one or more releases with DuckDB, an in-process analytical database
+
+    Every table of a release is a view over its file, so queries only read the columns and row
+    groups they need and joins and aggregations run on all cores. Zipped TSV tables are converted
+    to Parquet once (into <release>/parquet, where the downloader's conversion stage writes them)
+    and read from there. Several releases can be registered side by side, each as a schema named
+    after its alias, e.g. new.g_patent and old.g_patent.
+
+    Requires the duckdb package.
+    """
+
+    def __init__(self, releases=None, tables=None, database=":memory:", threads=None, memory_limit=None):
+        """
+        Args:
+            releases (str or dict, optional): Release directory, whose tables become views in the main schema,
+                                              or dict of alias to release directory
+            tables (dict, optional): Extra views, view name to table file path (.tsv.zip, .tsv, .csv.gz, .parquet)
+            database (str, optional): DuckDB database file, in memory by default
+            threads (int, optional): Threads DuckDB may use, all cores by default
+            memory_limit (str, optional): Memory DuckDB may use before spilling to disk, e.g. '8GB'
+        """
+        import duckdb
+        self.con = duckdb.connect(database)
+        if threads:
+            self.con.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            self.con.execute(f"SET memory_limit = {_literal(memory_limit)}")
+        self.views = {}
+        if isinstance(releases, str):
+            self.add_release(releases)
+        for alias, release_dir in (releases or {}).items() if isinstance(releases, dict) else []:
+            self.add_release(release_dir, alias)
+        for name, path in (tables or {}).items():
+            self.register(name, path)
+        return
+
+    def close(self):
+        self.con.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _source(self, path):
+        """
+        SQL table function reading a table file
+        """
+        if path.endswith(".zip"):
+            from zip_to_parquet import convert_zip_to_parquet
+            # Converted once; later runs reuse the Parquet file while it is newer than the zip
+            path = convert_zip_to_parquet(path, os.path.join(os.path.dirname(os.path.abspath(path)), "parquet"))[0]
+        if path.endswith(".parquet"):
+            return f"read_parquet({_literal(path)})"
+        delimiter = "," if path.endswith((".csv", ".csv.gz")) else "\t"
+        return f"read_csv({_literal(path)}, delim = {_literal(delimiter)}, header = true, quote = '\"')"
+
+    def register(self, name, path, schema=None):
+        """
+        Create a view over a table file
+
+        Args:
+            name (str): View name
+            path (str): Path of the table file
+            schema (str, optional): Schema of the view, the main schema if None
+        """
+        qualified = f"{_identifier(schema)}.{_identifier(name)}" if schema else _identifier(name)
+        if schema:
+            self.con.execute(f"CREATE SCHEMA IF NOT EXISTS {_identifier(schema)}")
+        self.con.execute(f"CREATE OR REPLACE VIEW {qualified} AS SELECT * FROM {self._source(path)}")
+        self.views[f"{schema}.{name}" if schema else name] = path
+        return
+
+    def add_release(self, release_dir, alias=None):
+        """
+        Register every table of a release directory
+
+        Args:
+            release_dir (str): Directory of the release
+            alias (str, optional): Schema the views are created in, the main schema if None
+        """
+        print(f"\t Registering tables of {release_dir}")
+        for table, file in ReleaseCatalog(release_dir).tables().items():
+            self.register(table, os.path.join(release_dir, file), alias)
+        return
+
+    def sql(self, query, params=None):
+        """
+        Run a query
+
+        Args:
+            query (str): SQL, with ? or $name placeholders for params
+            params (list or dict, optional): Parameter values
+
+        Returns:
+            pd.DataFrame: The result
+        """
+        return self.con.execute(query, params or []).df()
+
+    def top_assignees(self, family='grant', n=25, by=None, start_year=None, end_year=None, release=None):
+        """
+        Count documents by assignee organization, the question top_filings_PGPUB and top_patent_assignees answer
+
+        Args:
+            family (str, optional): 'grant' (patents by grant year) or 'pgpub' (publications by filing year)
+            n (int, optional): Number of rows returned
+            by (list, optional): Extra keys, any of 'year' and 'country' (assignee location country)
+            start_year (int, optional): First year counted
+            end_year (int, optional): Last year counted
+            release (str, optional): Alias of the release to query, for releases registered side by side
+
+        Returns:
+            pd.DataFrame: organization, the extra keys and filings, highest count first
+        """
+        assignees, documents, key, date, locations = ASSIGNEE_TABLES[family]
+        prefix = _identifier(release) + "." if release else ""
+        by = list(by or [])
+        year = f"try_cast(left(CAST(d.{date} AS VARCHAR), 4) AS INTEGER)"
+        keys = ["a.disambig_assignee_organization AS organization"]
+        if 'year' in by:
+            keys.append(f"{year} AS year")
+        if 'country' in by:
+            keys.append("l.disambig_country AS country")
+        joins = f"JOIN {prefix}{documents} d ON a.{key} = d.{key}"
+        if 'country' in by:
+            joins += f" LEFT JOIN {prefix}{locations} l ON a.location_id = l.location_id"
+        query = f"""
+            SELECT {", ".join(keys)}, count(*) AS filings
+            FROM {prefix}{assignees} a {joins}
+            WHERE a.disambig_assignee_organization IS NOT NULL
+              AND ($start_year IS NULL OR {year} >= $start_year)
+              AND ($end_year IS NULL OR {year} <= $end_year)
+            GROUP BY ALL
+            ORDER BY filings DESC, organization
+            LIMIT $n"""
+        return self.sql(query, {'start_year': start_year, 'end_year': end_year, 'n': n})
+
+    def row_counts(self, releases):
+        """
+        Count the rows of every table in releases registered side by side
+
+        Args:
+            releases (list): Release aliases, e.g. ['new', 'old']
+
+        Returns:
+            pd.DataFrame: One row per table, one column of counts per release (missing where a release
+            does not have the table)
+        """
+        tables = sorted({view.split(".", 1)[1] for view in self.views if view.split(".", 1)[0] in releases})
+        parts = [f"SELECT {_literal(table)} AS table_name, {_literal(release)} AS release, count(*) AS num_rows "
+                 f"FROM {_identifier(release)}.{_identifier(table)}"
+                 for table in tables for release in releases if f"{release}.{table}" in self.views]
+        counts = self.sql(" UNION ALL ".join(parts))
+        counts = counts.pivot(index='table_name', columns='release', values='num_rows')[releases]
+        return counts.rename_axis(columns=None).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SQL over the tables of PatentsView releases")
+    parser.add_argument("new_dir", help="directory of the new release (schema new)")
+    parser.add_argument("old_dir", nargs="?", help="directory of the prior release (schema old)")
+    parser.add_argument("--sql", help="query to run; prints the table row counts of the releases if omitted")
+    args = parser.parse_args()
+    releases = {'new': args.new_dir, **({'old': args.old_dir} if args.old_dir else {})}
+    with ReleaseQuery(releases) as query:
+        print(query.sql(args.sql) if args.sql else query.row_counts(list(releases)))
+    return
+
+
+if __name__ == "__main__":
+    main()
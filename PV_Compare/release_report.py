@@ -0,0 +1,194 @@
+import argparse
+import os
+import re
+import numpy as np
+import pandas as pd
+
+REPORT_FILE = "release_report.parquet"
+# Rows of the metrics CSVs holding the table-level counts
+RELEASE_ROWS = {'New Release': 'New', 'Prior Release': 'Prior'}
+# Report columns with one value per table; rules using only these alert once per table
+TABLE_COLUMNS = {'New_Num_Records', 'Prior_Num_Records', 'New_Num_Duplicated_Rows', 'Prior_Num_Duplicated_Rows',
+                 'Row_Count_Change'}
+
+# Thresholds referenced by the rules as @name
+DEFAULT_THRESHOLDS = {
+    'max_row_drop': 0.0,          # fraction of the prior row count
+    'max_null_rate_jump': 0.05,   # increase of the share of missing values
+    'max_unique_drop': 0.05,      # fraction of the prior unique value count
+    'min_common_rate': 0.5,       # share of prior unique values still present
+}
+
+# (name, severity, expression over the report columns), evaluated on the whole report at once
+DEFAULT_RULES = [
+    ('row_count_drop', 'fail', "Row_Count_Change < -@max_row_drop"),
+    ('dtype_changed', 'fail', "Dtype_Changed"),
+    ('new_duplicate_rows', 'warn', "New_Num_Duplicated_Rows > Prior_Num_Duplicated_Rows"),
+    ('null_rate_jump', 'warn', "Missing_Rate_Change > @max_null_rate_jump"),
+    ('unique_drop', 'warn', "Unique_Change < -@max_unique_drop"),
+    ('low_overlap', 'warn', "Common_Rate < @min_common_rate"),
+]
+
+
+def load_table_metrics(path, table):
+    """
+    Read the metrics CSV of one table into report rows
+
+    Args:
+        path (str): Path of the CSV written by DataFrameComparator.export_metrics or a metrics backend
+        table (str): Table name
+
+    Returns:
+        pd.DataFrame: One row per column, with the table's record and duplicate counts on every row
+    """
+    df = pd.read_csv(path)
+    releases = df[df['Column'].isin(list(RELEASE_ROWS))].set_index('Column')
+    columns = df[~df['Column'].isin(list(RELEASE_ROWS))].drop(columns=['Num_Records', 'Num_Duplicated_Rows'],
+                                                              errors='ignore')
+    columns.insert(0, 'Table', table)
+    for row, prefix in RELEASE_ROWS.items():
+        columns[prefix + '_Num_Records'] = releases.loc[row, 'Num_Records']
+        columns[prefix + '_Num_Duplicated_Rows'] = releases.loc[row, 'Num_Duplicated_Rows']
+    return columns
+
+
+def add_derived_columns(report):
+    """
+    Add the change columns the rules are written against
+
+    Returns:
+        pd.DataFrame: The report with Row_Count_Change, New/Prior_Missing_Rate, Missing_Rate_Change,
+        Unique_Change, Common_Rate and Dtype_Changed
+    """
+    def ratio(numerator, denominator):
+        return numerator / denominator.where(denominator != 0)
+
+    report['Row_Count_Change'] = ratio(report['New_Num_Records'], report['Prior_Num_Records']) - 1
+    report['New_Missing_Rate'] = ratio(report['New_Num_Missing_Values'], report['New_Num_Records'])
+    report['Prior_Missing_Rate'] = ratio(report['Prior_Num_Missing_Values'], report['Prior_Num_Records'])
+    report['Missing_Rate_Change'] = report['New_Missing_Rate'] - report['Prior_Missing_Rate']
+    report['Unique_Change'] = ratio(report['New_Num_Unique_Values'], report['Prior_Num_Unique_Values']) - 1
+    report['Common_Rate'] = ratio(report['Num_Values_Common'], report['Prior_Num_Unique_Values'])
+    report['Dtype_Changed'] = report['New_Data_Type'].astype(str) != report['Prior_Data_Type'].astype(str)
+    return report
+
+
+def build_report(output_dir, summary=None):
+    """
+    Consolidate the per-table metrics CSVs of a compare_releases run into one columnar report,
+    saved as output_dir/release_report.parquet
+
+    Args:
+        output_dir (str): Output directory of the run
+        summary (pd.DataFrame, optional): The run summary, read from output_dir/run_summary.csv if None
+
+    Returns:
+        pd.DataFrame: One row per table column, with the metrics of both releases and the change columns
+    """
+    if summary is None:
+        summary = pd.read_csv(os.path.join(output_dir, "run_summary.csv"))
+    ok = summary[summary['Status'] == 'ok']
+    parts = [load_table_metrics(output, table) for table, output in zip(ok['Table'], ok['Output'])] if len(ok) else []
+    report = add_derived_columns(pd.concat(parts, ignore_index=True)) if parts else pd.DataFrame()
+    path = os.path.join(output_dir, REPORT_FILE)
+    report.to_parquet(path, index=False)
+    print(f"Release report exported to {path}")
+    return report
+
+
+def evaluate(report, rules=DEFAULT_RULES, thresholds=None):
+    """
+    Evaluate the rules on every row of the report at once
+
+    Args:
+        report (pd.DataFrame): The report from build_report, or read from its Parquet file
+        rules (list, optional): (name, severity, expression) tuples. Severity is 'fail' or 'warn'; expressions
+                                are pandas eval expressions over the report columns, with @name thresholds
+        thresholds (dict, optional): Threshold values, overriding DEFAULT_THRESHOLDS
+
+    Returns:
+        pd.DataFrame: One row per triggered rule and column: Table, Column, Rule and Severity. Rules on
+        table-level counts give one row per table, with an empty Column
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    alerts = [pd.DataFrame(columns=['Table', 'Column', 'Rule', 'Severity'])]
+    if report.empty:
+        return alerts[0]
+    for name, severity, expression in rules:
+        hits = report.eval(expression, local_dict=thresholds).fillna(False).astype(bool)
+        if not hits.any():
+            continue
+        hit = report.loc[hits, ['Table', 'Column']].assign(Rule=name, Severity=severity)
+        if set(re.findall(r"(?<!@)\b[A-Za-z_]\w*", expression)) & set(report.columns) <= TABLE_COLUMNS:
+            hit = hit.drop_duplicates('Table').assign(Column="")
+        alerts.append(hit)
+    return pd.concat(alerts, ignore_index=True)
+
+
+def summarize(alerts, summary):
+    """
+    Reduce the alerts to one pass/warn/fail line per table
+
+    Tables that were not compared (errors, timeouts) fail; tables only in the new release warn.
+
+    Args:
+        alerts (pd.DataFrame): Output of evaluate
+        summary (pd.DataFrame): The run summary
+
+    Returns:
+        pd.DataFrame: Table, Status ('pass', 'warn' or 'fail'), Failed and Warnings (rule names)
+    """
+    status = pd.DataFrame({'Table': summary['Table'].to_numpy()})
+    for severity, column in (('fail', 'Failed'), ('warn', 'Warnings')):
+        rules = alerts[alerts['Severity'] == severity].drop_duplicates(['Table', 'Rule'])
+        status[column] = status['Table'].map(rules.groupby('Table')['Rule'].agg(", ".join)).fillna("")
+    run_status = summary['Status'].to_numpy()
+    not_compared = (run_status != 'ok') & (run_status != 'not in prior release')
+    status.loc[not_compared, 'Failed'] = summary.loc[not_compared, 'Status'].to_numpy()
+    status.loc[run_status == 'not in prior release', 'Warnings'] = 'not in prior release'
+    status['Status'] = np.select([status['Failed'] != "", status['Warnings'] != ""], ['fail', 'warn'], 'pass')
+    return status[['Table', 'Status', 'Failed', 'Warnings']]
+
+
+def check_release(output_dir, rules=DEFAULT_RULES, thresholds=None):
+    """
+    Decide whether a release is safe from the report of a compare_releases run
+
+    Args:
+        output_dir (str): Output directory of the run
+        rules (list, optional): Rules, see evaluate
+        thresholds (dict, optional): Threshold values, overriding DEFAULT_THRESHOLDS
+
+    Returns:
+        tuple: (True if no table failed, per-table status from summarize, alerts from evaluate)
+    """
+    summary = pd.read_csv(os.path.join(output_dir, "run_summary.csv"))
+    path = os.path.join(output_dir, REPORT_FILE)
+    report = pd.read_parquet(path) if os.path.exists(path) else build_report(output_dir, summary)
+    alerts = evaluate(report, rules, thresholds)
+    status = summarize(alerts, summary)
+    counts = status['Status'].value_counts()
+    passed = not counts.get('fail', 0)
+    print(f"Release check: {'PASS' if passed else 'FAIL'} ({counts.get('pass', 0)} passed, "
+          f"{counts.get('warn', 0)} warned, {counts.get('fail', 0)} failed of {len(status)} tables)")
+    for row in status[status['Status'] != 'pass'].itertuples():
+        print(f"\t {row.Table}: {row.Status} {'; '.join(filter(None, [row.Failed, row.Warnings]))}")
+    return passed, status, alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a release from the report of a compare_releases run")
+    parser.add_argument("output_dir", help="output directory of the run")
+    for name, value in DEFAULT_THRESHOLDS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=float, default=value, help=f"default {value}")
+    parser.add_argument("--rebuild", action="store_true", help="build the report again from the metrics CSVs")
+    args = parser.parse_args()
+    if args.rebuild:
+        build_report(args.output_dir)
+    thresholds = {name: getattr(args, name) for name in DEFAULT_THRESHOLDS}
+    passed, status, alerts = check_release(args.output_dir, thresholds=thresholds)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
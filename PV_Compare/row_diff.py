@@ -0,0 +1,138 @@
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from column_stats import canonical_text, hash_column, ROW_HASH_MULTIPLIER
+from dataframe_comparator import DataFrameComparator
+from pv_loader import read_file
+
+
+class RowDiff:
+    """
+    Finds the records added, removed and changed between releases of a PatentsView table
+
+    Both releases are hash-partitioned on the key columns into a work directory, storing only the
+    key values and a 64-bit hash per column, then compared one partition at a time so memory is
+    bounded by the partition size rather than the table size.
+    """
+
+    def __init__(self, new_df, old_df, key_columns, partitions=64, work_dir=None):
+        """
+        Args:
+            new_df (pd.DataFrame or iterable): The table in the new release, whole or as chunks
+            old_df (pd.DataFrame or iterable): The table in the prior release, whole or as chunks
+            key_columns (list): Columns that identify a record, e.g. ['patent_id'] or ['document_number', 'sequence']
+            partitions (int, optional): Number of on-disk partitions
+            work_dir (str, optional): Directory for the partitions. A temporary directory is used if None
+        """
+        self.new_batches, self.new_columns = DataFrameComparator._as_batches(new_df)
+        self.old_batches, self.old_columns = DataFrameComparator._as_batches(old_df)
+        self.key_columns = list(key_columns)
+        missing = [col for col in self.key_columns if col not in self.new_columns or col not in self.old_columns]
+        if missing:
+            raise ValueError(f"Key columns missing from a release: {missing}")
+        self.value_columns = [col for col in self.new_columns
+                              if col in self.old_columns and col not in self.key_columns]
+        self.partitions = partitions
+        self.work_dir = work_dir
+        return
+
+    def _partition(self, batches, release, work_dir):
+        """
+        Split a release into partition files of key values and per-column hashes
+        """
+        # Partitions left in a reused work directory by an earlier run would be read with this one
+        shutil.rmtree(os.path.join(work_dir, release), ignore_errors=True)
+        for n, batch in enumerate(batches):
+            key_hash = np.zeros(len(batch), dtype=np.uint64)
+            for col in self.key_columns:
+                key_hash = key_hash * ROW_HASH_MULTIPLIER ^ hash_column(batch[col])[0]
+            # Keys and values are matched on the hash of their text, so a key hashes the same
+            # whatever dtype its chunk was parsed with, and keys are written out as text
+            hashed = pd.DataFrame({col: canonical_text(batch[col]) for col in self.key_columns})
+            hashed['#key'] = key_hash
+            for col in self.value_columns:
+                hashed['#' + col] = hash_column(batch[col])[0]
+            parts = (key_hash % np.uint64(self.partitions)).astype(np.int64)
+            for part in np.unique(parts):
+                path = os.path.join(work_dir, release, f"p{part}", f"b{n}.pkl")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                hashed[parts == part].to_pickle(path)
+        return
+
+    def _load(self, work_dir, release, part):
+        files = sorted(glob.glob(os.path.join(work_dir, release, f"p{part}", "*.pkl")))
+        if not files:
+            return pd.DataFrame(columns=self.key_columns + ['#key'] + ['#' + col for col in self.value_columns])
+        return pd.concat([pd.read_pickle(file) for file in files], ignore_index=True)
+
+    def export_diff(self, output_dir):
+        """
+        Write added.csv, removed.csv and changed.csv (keys plus the names of the changed columns)
+
+        Args:
+            output_dir (str): Directory to write the CSV files to
+
+        Returns:
+            dict: Number of added, removed, changed and duplicate-key records
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        work_dir = self.work_dir or tempfile.mkdtemp(prefix="pv_row_diff_")
+        outputs = {name: os.path.join(output_dir, name + ".csv") for name in ['added', 'removed', 'changed']}
+        for path in outputs.values():
+            if os.path.exists(path):
+                os.remove(path)
+        counts = {'added': 0, 'removed': 0, 'changed': 0, 'new_duplicate_keys': 0, 'prior_duplicate_keys': 0}
+        try:
+            self._partition(self.new_batches, "new", work_dir)
+            self._partition(self.old_batches, "prior", work_dir)
+            for part in range(self.partitions):
+                new = self._load(work_dir, "new", part)
+                old = self._load(work_dir, "prior", part)
+                dup_new = new.duplicated('#key')
+                dup_old = old.duplicated('#key')
+                counts['new_duplicate_keys'] += int(dup_new.sum())
+                counts['prior_duplicate_keys'] += int(dup_old.sum())
+                new, old = new[~dup_new], old[~dup_old]
+                added = new.loc[~new['#key'].isin(old['#key']), self.key_columns]
+                removed = old.loc[~old['#key'].isin(new['#key']), self.key_columns]
+                both = new.merge(old.drop(columns=self.key_columns), on='#key', suffixes=('_new', '_prior'))
+                changed_mask = pd.DataFrame({col: both['#' + col + '_new'] != both['#' + col + '_prior']
+                                             for col in self.value_columns}, index=both.index)
+                changed_rows = changed_mask.any(axis=1) if self.value_columns else pd.Series(False, index=both.index)
+                changed = both.loc[changed_rows, self.key_columns].copy()
+                changed['changed_columns'] = [";".join(col for col in self.value_columns if row[col])
+                                              for row in changed_mask[changed_rows].to_dict('records')]
+                for name, frame in [('added', added), ('removed', removed), ('changed', changed)]:
+                    counts[name] += len(frame)
+                    frame.to_csv(outputs[name], mode='a', index=False, header=not os.path.exists(outputs[name]))
+        finally:
+            if self.work_dir is None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"\t Added: {counts['added']}, removed: {counts['removed']}, changed: {counts['changed']}")
+        print(f"\t Row diff exported to {output_dir}")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find records added, removed and changed between two releases of a table")
+    parser.add_argument("new_file", help="table file in the new release")
+    parser.add_argument("old_file", help="table file in the prior release")
+    parser.add_argument("output_dir", help="directory for added.csv, removed.csv and changed.csv")
+    parser.add_argument("--keys", nargs="+", required=True, help="key columns, e.g. patent_id")
+    parser.add_argument("--chunksize", type=int, default=1000000, help="rows read per chunk")
+    parser.add_argument("--partitions", type=int, default=64, help="number of on-disk partitions")
+    parser.add_argument("--work-dir", help="directory for the partitions")
+    args = parser.parse_args()
+    diff = RowDiff(read_file(args.new_file, args.chunksize, text=True),
+                   read_file(args.old_file, args.chunksize, text=True),
+                   args.keys, partitions=args.partitions, work_dir=args.work_dir)
+    diff.export_diff(args.output_dir)
+    return
+
+
+if __name__ == "__main__":
+    main()
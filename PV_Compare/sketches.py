@@ -0,0 +1,222 @@
+import base64
+import math
+import struct
+import numpy as np
+
+HASH_SPACE = 2.0 ** 64
+
+
+def _bit_length(values):
+    """
+    Vectorized bit length of uint64 values
+    """
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp is exact for 32-bit integers and returns the bit length as the exponent
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def precision_for_error(relative_error):
+    """
+    Number of HyperLogLog index bits needed for a target relative standard error
+
+    Args:
+        relative_error (float): Target relative standard error, e.g. 0.01 for 1%
+
+    Returns:
+        int: Precision between 4 and 18
+    """
+    return int(min(max(math.ceil(math.log2((1.04 / relative_error) ** 2)), 4), 18))
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch over 64-bit hashes
+
+    Uses 2**precision one-byte registers and has a relative standard error of about 1.04 / sqrt(2**precision).
+    """
+
+    def __init__(self, precision=14):
+        """
+        Args:
+            precision (int, optional): Number of hash bits used to pick a register (4-18)
+        """
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+        return
+
+    def add(self, hashes):
+        """
+        Add hashed values to the sketch
+
+        Args:
+            hashes (np.ndarray): uint64 hashes
+        """
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = hashes << p
+        rank = np.where(rest == 0, 65 - self.precision, 65 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return
+
+    def merge(self, other):
+        """
+        Merge another sketch of the same precision into this one
+
+        Args:
+            other (HyperLogLog): The sketch to merge
+        """
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return
+
+    def estimate(self):
+        """
+        Estimate the number of distinct values added
+
+        Returns:
+            int: Estimated distinct count
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self):
+        return struct.pack('<B', self.precision) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls(struct.unpack_from('<B', data)[0])
+        sketch.registers = np.frombuffer(data[1:], dtype=np.uint8).copy()
+        return sketch
+
+
+class ThetaSketch:
+    """
+    K-minimum-values (theta) sketch over 64-bit hashes
+
+    Keeps the k smallest hashes seen. Two sketches estimate the size of the intersection of
+    their sets with a relative standard error of about 1 / sqrt(k) of the union size.
+    """
+
+    def __init__(self, k=4096):
+        """
+        Args:
+            k (int, optional): Number of hashes retained
+        """
+        self.k = k
+        self.values = np.empty(0, dtype=np.uint64)
+        return
+
+    @property
+    def theta(self):
+        """
+        Hash value below which the retained hashes are a complete sample
+        """
+        if len(self.values) < self.k:
+            return np.uint64(np.iinfo(np.uint64).max)
+        return self.values[-1]
+
+    def add(self, hashes):
+        """
+        Add hashed values to the sketch
+
+        Args:
+            hashes (np.ndarray): uint64 hashes
+        """
+        if len(self.values) >= self.k:
+            hashes = hashes[hashes < self.theta]
+        if len(hashes) == 0:
+            return
+        self.values = np.unique(np.concatenate([self.values, hashes]))[:self.k]
+        return
+
+    def estimate(self):
+        """
+        Estimate the number of distinct values added
+
+        Returns:
+            int: Estimated distinct count
+        """
+        if len(self.values) < self.k:
+            return len(self.values)
+        return int(round((self.k - 1) / (float(self.theta) / HASH_SPACE)))
+
+    def intersection_estimate(self, other):
+        """
+        Estimate the number of distinct values added to both sketches
+
+        Args:
+            other (ThetaSketch): The other sketch
+
+        Returns:
+            int: Estimated intersection size
+        """
+        theta = min(self.theta, other.theta)
+        common = np.intersect1d(self.values[self.values <= theta], other.values[other.values <= theta],
+                                assume_unique=True)
+        if len(self.values) < self.k and len(other.values) < self.k:
+            return len(common)
+        return int(round(len(common) / (float(theta) / HASH_SPACE)))
+
+    def to_bytes(self):
+        return struct.pack('<I', self.k) + self.values.astype('<u8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls(struct.unpack_from('<I', data)[0])
+        sketch.values = np.frombuffer(data[4:], dtype='<u8').astype(np.uint64)
+        return sketch
+
+
+class ColumnSketch:
+    """
+    Approximate replacement for column_stats.HashSet: HyperLogLog for the distinct count and a
+    theta sketch for the overlap with the other release
+
+    Memory is fixed by relative_error instead of growing with the number of distinct values.
+    """
+
+    def __init__(self, relative_error=0.01):
+        """
+        Args:
+            relative_error (float, optional): Target relative standard error of the estimates
+        """
+        self.relative_error = relative_error
+        self.hll = HyperLogLog(precision_for_error(relative_error))
+        self.theta = ThetaSketch(int(math.ceil(1 / relative_error ** 2)))
+        return
+
+    def add(self, hashes):
+        self.hll.add(hashes)
+        self.theta.add(hashes)
+        return
+
+    def __len__(self):
+        # The theta sketch holds every value exactly until it fills up
+        if len(self.theta.values) < self.theta.k:
+            return len(self.theta.values)
+        return self.hll.estimate()
+
+    def intersection_size(self, other):
+        # The intersection can never exceed either distinct count
+        return min(self.theta.intersection_estimate(other.theta), len(self), len(other))
+
+    def to_dict(self):
+        return {'relative_error': self.relative_error,
+                'hll': base64.b64encode(self.hll.to_bytes()).decode('ascii'),
+                'theta': base64.b64encode(self.theta.to_bytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls.__new__(cls)
+        sketch.relative_error = data['relative_error']
+        sketch.hll = HyperLogLog.from_bytes(base64.b64decode(data['hll']))
+        sketch.theta = ThetaSketch.from_bytes(base64.b64decode(data['theta']))
+        return sketch
@@ -0,0 +1,21 @@
+import os
+
+# Table naming of the comparison modules. PV_Downloader's link_discovery names files the same way
+
+
+def table_name(path):
+    """
+    Table name of a release file, e.g. g_patent for .../g_patent.tsv.zip
+    """
+    return os.path.basename(path).split(".")[0]
+
+
+def table_family(name):
+    """
+    Release family of a table: 'grant' (g_ tables), 'pgpub' (pg_ tables) or 'other'
+    """
+    if name.startswith("g_"):
+        return 'grant'
+    if name.startswith("pg_"):
+        return 'pgpub'
+    return 'other'
@@ -1,13 +1,17 @@
 import os
 import pandas as pd
 import numpy as np
+from profile_cache import ProfileCache
+from pv_loader import read_file, table_name
+from release_catalog import ReleaseCatalog, SAMPLE_ROWS
 
 class Agg_Compare:
     """
     A class to compare PatentView releases at the aggregate(grant or pgpubs) level
     """
     
-    def __init__(self, new_release_dir, old_release_dir, new_release_ext='.tsv.zip', old_release_ext='.tsv.zip'):
+    def __init__(self, new_release_dir, old_release_dir, new_release_ext='.tsv.zip', old_release_ext='.tsv.zip',
+                 profile_dir=None):
         """
         Initialize the object with the directories of the new and old releases
         Args:
@@ -15,22 +19,31 @@ class Agg_Compare:
             old_release_dir = directory where the old release files are stored
             new_release_ext = file extensions in new release
             old_release_ext = file extensions in old release
+            profile_dir = directory of the table_comparer profile cache. Old release tables with a stored
+                          profile take their columns and data types from it instead of being read
         """
         self.new_dir = new_release_dir
         self.old_dir = old_release_dir
         self.new_ext = new_release_ext
         self.old_ext = old_release_ext
+        self.profiles = ProfileCache(profile_dir) if profile_dir else None
+        self.catalogs = {}
+        self.new_catalog = self.catalog(new_release_dir)
+        self.old_catalog = self.catalog(old_release_dir)
         return
+
+    def catalog(self, dir):
+        """
+        Get the table catalog of a release directory, which keeps table names, counts and schemas
+        between runs
+        """
+        key = os.path.abspath(dir)
+        if key not in self.catalogs:
+            self.catalogs[key] = ReleaseCatalog(dir)
+        return self.catalogs[key]
     
     def count_tables(self, dir):
-        count = {'total':0,'pgpub':0,'grant':0}
-        for file in os.listdir(dir):
-            count['total'] += 1
-            if file.startswith("g_"):
-                count['grant'] += 1
-            elif file.startswith("pg_"):
-                count['pgpub'] += 1
-        return(count)
+        return(self.catalog(dir).counts())
     
     def count_all_tables(self):
         new_counts = self.count_tables(self.new_dir)
@@ -50,54 +63,132 @@ class Agg_Compare:
                 print("\t\t", table)
             return
 
-        new_tables = set([file.split(".")[0] for file in os.listdir(self.new_dir)])
-        old_tables = set([file.split(".")[0] for file in os.listdir(self.old_dir)])
-        if new_tables == old_tables:
+        only_new, only_old = self.new_catalog.diff_names(self.old_catalog)
+        if not only_new and not only_old:
             print("New release contains same table names as prior release. \n")
         else:
             print("New release has different table names than prior release:")
             print("\t Tables in new release, but not in prior release: ")
-            print_missing_tables(new_tables - old_tables)
+            print_missing_tables(sorted(only_new))
             print("\t Tables in prior release, but not in new release: ")
-            print_missing_tables(old_tables - new_tables)
+            print_missing_tables(sorted(only_old))
             print("\n")
         return
     
-    def compare_data_types(self):
+    @staticmethod
+    def dtype_kind(dtype):
+        """
+        Reduce a pandas or Arrow data type name to its kind (numeric, bool, datetime or string), so
+        schemas read from a sample, a Parquet footer or a full scan can be compared
+        """
+        dtype = str(dtype).lower()
+        # Arrow's null type is a column with no values, which pandas reads as float64
+        if dtype.startswith(('int', 'uint', 'float', 'halffloat', 'double', 'decimal', 'null')):
+            return 'numeric'
+        if dtype.startswith('bool'):
+            return 'bool'
+        if dtype.startswith(('datetime', 'timestamp', 'date')):
+            return 'datetime'
+        return 'string'
+
+    def schema_sources(self, file, full_scan=False, sample_rows=10000):
+        """
+        Get the sources the schema of a table file can be read from, best first
+        Args:
+            file = path of the table file
+            full_scan = only sources giving the exact pandas data types of the whole table
+            sample_rows = number of rows read when not doing a full scan
+        Returns:
+            List of 'profile' (stored table_comparer profile), 'parquet' (footer of the downloader's
+            Parquet copy) and 'read' (the file itself, always available)
+        """
+        sources = []
+        if self.profiles and self.profiles.get(file) is not None:
+            sources.append('profile')
+        if not full_scan:
+            parquet = self.parquet_copy(file)
+            if os.path.exists(parquet) and os.path.getmtime(parquet) >= os.path.getmtime(file):
+                sources.append('parquet')
+        return sources + ['read']
+
+    @staticmethod
+    def parquet_copy(file):
+        # Written by the downloader's conversion stage, with the schema in its footer
+        return os.path.join(os.path.dirname(file), "parquet", table_name(file) + ".parquet")
+
+    def read_schema(self, file, full_scan=False, sample_rows=10000, source=None):
+        """
+        Get the column names and data types of a table file
+        Args:
+            file = path of the table file
+            full_scan = read the whole table, giving the exact pandas data types
+            sample_rows = number of rows read when not doing a full scan
+            source = 'profile', 'parquet' or 'read' (see schema_sources), the best available if None.
+                     Releases compared with each other should use the same source: the Parquet copy
+                     has registry types (e.g. string ids) where a pandas read infers int64
+        Returns:
+            Tuple of (list of column names, list of data type names)
+        """
+        source = source or self.schema_sources(file, full_scan, sample_rows)[0]
+        if source == 'profile':
+            profile = self.profiles.get(file)
+            return profile.columns, [profile.dtype(col) for col in profile.columns]
+        if source == 'parquet':
+            import pyarrow.parquet as pq
+            schema = pq.read_schema(self.parquet_copy(file))
+            return schema.names, [str(field.type) for field in schema]
+        if not full_scan and sample_rows == SAMPLE_ROWS:
+            # The catalog keeps the sampled schema of every file until the file changes
+            return self.catalog(os.path.dirname(file)).schema(os.path.basename(file))
+        df = read_file(file, nrows=None if full_scan else sample_rows)
+        return df.columns.to_list(), [str(dtype) for dtype in df.dtypes]
+
+    def compare_data_types(self, full_scan=False, sample_rows=10000):
+        """
+        Compares column names and data types of every table between releases
+        Args:
+            full_scan = read every table completely and compare exact pandas data types. By default only
+                        the header and a sample of rows (or the Parquet footer) are read and data types
+                        are compared by kind (numeric, bool, datetime, string)
+            sample_rows = number of rows read per table when not doing a full scan
+        """
         bad_cols = []
         bad_dtypes = []
+        errors = []
 
-        def read_file(file):
-            if file.endswith(".csv.gz"):
-                df = pd.read_csv(file, compression = "gzip", low_memory=False)
-            else:
-                df = pd.read_csv(file, sep="\t", compression="zip", low_memory=False)
-            return(df)
-
-        for file in os.listdir(self.new_dir):
+        old_files = self.old_catalog.tables(formats=[self.old_ext.lstrip(".")])
+        for old_name, file in self.new_catalog.tables(formats=[self.new_ext.lstrip(".")]).items():
             print("... analyzing ", file)
-            old_df = 0
             new_fname = os.path.join(self.new_dir, file)
-            new_df = read_file(new_fname)
-            old_name = file.split(".")[0]
-            temp = [self.old_dir, old_name, self.old_ext]
-            old_fname = "".join(temp)
+            if old_name not in old_files:
+                print("\t", old_name, " is not in prior release.")
+                continue
+            old_fname = os.path.join(self.old_dir, old_files[old_name])
             try:
-                old_df = read_file(old_fname)
-            except:
-                pass
-            else:
-                new_cols = new_df.columns.to_list()
-                old_cols = old_df.columns.to_list()
-                if new_cols != old_cols:
-                    bad_cols.append(old_name)
-                else:
-                    if (new_df.dtypes == old_df.dtypes).all():
-                        pass
-                    else:
-                        bad_dtypes.append(old_name)
-            del new_df, old_df
-        if not bad_cols and not bad_dtypes:
+                # Both releases are read from the best source they have in common
+                old_sources = self.schema_sources(old_fname, full_scan, sample_rows)
+                source = [source for source in self.schema_sources(new_fname, full_scan, sample_rows)
+                          if source in old_sources][0]
+                new_cols, new_dtypes = self.read_schema(new_fname, full_scan, sample_rows, source)
+                old_cols, old_dtypes = self.read_schema(old_fname, full_scan, sample_rows, source)
+            except Exception as e:
+                print("\t Could not read ", old_name, ": ", repr(e))
+                errors.append(old_name)
+                continue
+            if new_cols != old_cols:
+                bad_cols.append(old_name)
+                print("\t Columns only in new release: ", [col for col in new_cols if col not in old_cols])
+                print("\t Columns only in prior release: ", [col for col in old_cols if col not in new_cols])
+                continue
+            if not full_scan:
+                new_dtypes = [self.dtype_kind(dtype) for dtype in new_dtypes]
+                old_dtypes = [self.dtype_kind(dtype) for dtype in old_dtypes]
+            changed = [(col, old, new) for col, new, old in zip(new_cols, new_dtypes, old_dtypes) if new != old]
+            if changed:
+                bad_dtypes.append(old_name)
+                for col, old, new in changed:
+                    print("\t ", col, ": ", old, " -> ", new)
+        if not bad_cols and not bad_dtypes and not errors:
             print("All tables have the same columns and data types between releases.")
         else:
             if len(bad_cols) > 0:
@@ -108,13 +199,19 @@ class Agg_Compare:
                 print("The following tables have different data types:")
                 for table in bad_dtypes:
                     print("\t", table)
+            if len(errors) > 0:
+                print("The following tables could not be read:")
+                for table in errors:
+                    print("\t", table)
         return
 
-    def run_all_tests(self):
+    def run_all_tests(self, full_scan=False):
         """
         Runs all the tests above
+        Args:
+            full_scan = read every table completely when comparing data types
         """
         self.count_all_tables()
         self.compare_table_names()
-        self.compare_data_types()
+        self.compare_data_types(full_scan)
         return
\ No newline at end of file
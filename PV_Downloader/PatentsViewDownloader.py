@@ -1,26 +1,77 @@
 import requests
-from bs4 import BeautifulSoup
+import hashlib
 import os
 import logging
-from urllib.parse import urljoin
-import time
-from typing import List, Optional
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Optional, Union
+from rate_limiter import TokenBucket, HostLimiter, connection_slot
+import ranged_download
+from release_manifest import ReleaseManifest, file_sha256, link_or_copy
+from zip_verify import verify_files
+from storage import open_storage
+try:
+    # Run metrics are shared with the comparison code when PV_Compare is on the import path
+    # (pv_download_notebook adds it)
+    from instrumentation import metrics, ProgressReporter
+except ImportError:
+    from null_metrics import metrics, ProgressReporter
+from link_discovery import LinkDiscovery, prioritize, DEFAULT_CACHE_PATH
 
 class PatentsViewDownloader:
     """
     A class to download TSV.zip files from PatentsView.org's data download tables.
     """
     
-    def __init__(self, base_url: str, download_dir: str = "/Volumes/oce_dev/bronze/patentsview_files/latest"):
+    def __init__(self, base_url: Union[str, List[str]], download_dir: str = "/Volumes/oce_dev/bronze/patentsview_files/latest",
+                 segments: int = 1, min_segment_size: int = 256 * 1024 * 1024,
+                 buffer_size: int = ranged_download.DEFAULT_BUFFER_SIZE, max_retries: int = 3,
+                 previous_dir: Optional[str] = None, parquet_dir: Optional[str] = None, convert_workers: int = 2,
+                 verify: bool = True, verify_workers: int = 4, storage=None, pool_size: int = 16,
+                 link_cache: Optional[str] = DEFAULT_CACHE_PATH):
         """
         Initialize the downloader with base URL and download directory.
         Args:
-            base_url: The URL of the PatentsView download page
-            download_dir: Local directory to save downloaded files
+            base_url: The URL of the PatentsView download page, or a list of pages crawled together
+            download_dir: Local directory to save downloaded files, and to keep the release manifest in
+            segments: Number of parallel byte-range requests used for one large file
+            min_segment_size: Files are only split when every segment would be at least this many bytes
+            buffer_size: Read/write buffer size in bytes, clamped to 1-8 MB
+            max_retries: Number of times an interrupted download is resumed before giving up
+            previous_dir: Directory of the prior release. Files that are unchanged on the server are
+                          linked from it instead of downloaded again
+            parquet_dir: If given, every downloaded zip is converted to Parquet files in this directory
+                         while the remaining files are still downloading (requires pyarrow)
+            convert_workers: Number of processes used for the Parquet conversion
+            verify: Check the zip central directory and the CRC of every member of each file, including
+                    files already on disk or linked from the previous release, and download corrupt files again
+            verify_workers: Number of threads checking the members of one file
+            storage: Where the files are kept instead of download_dir: a storage backend (storage.S3Storage, ...)
+                     or a location such as s3://bucket/prefix. Files are streamed into object stores without
+                     a local copy; previous release linking, Parquet conversion and zip verification need
+                     local storage
+            pool_size: Keep-alive connections kept open per host, shared by all download workers
+            link_cache: JSON file caching the download pages, their links and the links' HEAD metadata
+                        between runs, no cache if None
         """
         self.base_url = base_url
         self.download_dir = download_dir
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.buffer_size = ranged_download.clamp_buffer_size(buffer_size)
+        self.max_retries = max_retries
+        self.previous_dir = previous_dir
+        self.parquet_dir = parquet_dir
+        self.convert_workers = convert_workers
+        self.session = ranged_download.new_session(pool_size)
+        self.verify = verify
+        self.verify_workers = verify_workers
+        # Files found corrupt in this run, which are never linked from the previous release again
+        self.rejected = set()
+        self.parquet_files = []
         self.downloaded_files = []
+        self._files_lock = threading.Lock()
         
         # Set up logging
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,6 +79,13 @@ class PatentsViewDownloader:
         
         # Create download directory if it doesn't exist
         os.makedirs(download_dir, exist_ok=True)
+        if storage is None:
+            storage = download_dir
+        self.storage = open_storage(storage) if isinstance(storage, str) else storage
+        self.manifest = ReleaseManifest(download_dir, None if self.storage.is_local else self.storage)
+        self.previous_manifest = ReleaseManifest(previous_dir) if previous_dir else None
+        pages = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.discovery = LinkDiscovery(pages, link_cache, self.session)
         return
     
     def get_download_links(self) -> List[str]:
@@ -36,100 +94,366 @@ class PatentsViewDownloader:
         Returns:
             List of URLs containt the TSV.zip files to download.
         """
-    
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
-            response = requests.get(self.base_url, headers=headers)
-            response.raise_for_status()
-            print(response.status_code)
+        zip_links = [link['url'] for link in self.discover_links()]
+        self.logger.info(f"Found {len(zip_links)} TSV zip files to download")
+        for file in zip_links:
+            print(file)
+        return zip_links
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find all links that end with tsv.zip
-            zip_links = [
-                urljoin(self.base_url, link['href'])
-                for link in soup.find_all('a', href=True)
-                if link['href'].endswith('tsv.zip')
-            ]
-            self.logger.info(f"Found {len(zip_links)} TSV zip files to download")
-            for file in zip_links:
-                print(file)
-            return zip_links
-            
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"Error fetching download links: {str(e)}")
-            return []
+    def discover_links(self, refresh: bool = False) -> List[dict]:
+        """
+        Crawl the download pages concurrently, reusing the cached links of pages that did not change.
+        Args:
+            refresh: Send HEAD requests for all links, even on pages that did not change
+        Returns:
+            Metadata of every linked file: url, file, table, family, page, size, etag, last_modified
+            and accepts_ranges
+        """
+        with metrics.timer('discover'):
+            return self.discovery.discover(refresh)
     
-    def download_file(self, url: str) -> Optional[str]:
+    def download_file(self, url: str, hosts: Optional[HostLimiter] = None) -> Optional[str]:
         """
         Download a single TSV.zip file from the given URL.
+        Bytes are written to a .part file, which is resumed with an HTTP Range request after a
+        dropped connection and only renamed to the final name once its size matches Content-Length.
+        A HEAD probe compares the server's ETag/Last-Modified with the release manifests, so files
+        that did not change are skipped, or linked from the previous release directory.
+        When verification is on, the file is then checked and downloaded again if it is corrupt.
         Args:
             url: URL of the file to download
+            hosts: Limiter of the connections per host; the HEAD probe and every transfer
+                   (each segment of a segmented download) hold one of its slots. No limit if None
         Returns:
             Path to the downloaded file or None if download failed
         """
+        filename = url.split("/")[-1]
+        for attempt in range(self.max_retries + 1):
+            filepath = self._download_file(url, hosts)
+            if not filepath or not self.verify or not self.storage.is_local or self.verify_file(filepath):
+                return filepath
+            with self._files_lock:
+                if filepath in self.downloaded_files:
+                    self.downloaded_files.remove(filepath)
+            if attempt < self.max_retries:
+                self.logger.warning(f"Downloading {filename} again")
+        self.logger.error(f"File {filename} is still corrupt after {self.max_retries + 1} downloads")
+        metrics.count('files', outcome='failed')
+        return None
+
+    def verify_file(self, filepath: str) -> bool:
+        """
+        Check the central directory and member CRCs of a zip file, once per version of the file.
+        The result is recorded in the manifest with the file's size and modification time; a corrupt
+        file is deleted and its manifest entry dropped, so it is downloaded again.
+        Args:
+            filepath: Path of the file in the release directory
+        Returns:
+            True if the file is intact
+        """
+        filename = os.path.basename(filepath)
+        stat = os.stat(filepath)
+        version = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        entry = self.manifest.get(filename) or {}
+        if entry.get('verified') == version:
+            return True
+        with metrics.timer('verify', file=filename):
+            error = verify_files([filepath], self.verify_workers, self.buffer_size)[filepath]
+        if error is None:
+            if entry:
+                self.manifest.update(filename, verified=version)
+            return True
+        self.logger.error(f"File {filename} is corrupt: {error}")
+        metrics.count('files', outcome='corrupt')
+        self.rejected.add(filename)
+        os.remove(filepath)
+        self.manifest.remove(filename)
+        return False
+
+    def verify_release(self, max_workers: int = 8, refetch: bool = True) -> List[str]:
+        """
+        Verify every file in the release manifest in parallel, and download corrupt files again.
+        Files verified before and unchanged since are not read. Only files in local storage are verified.
+        Args:
+            max_workers: Number of verification threads, shared by all files
+            refetch: Download corrupt files again
+        Returns:
+            Names of the files that were found corrupt
+        """
+        pending = {}
+        if not self.storage.is_local:
+            self.logger.warning(f"Files in {self.storage.path('')} cannot be verified")
+            return []
+        for filename in list(self.manifest.entries):
+            path = os.path.join(self.download_dir, filename)
+            entry = self.manifest.get(filename) or {}
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            if entry.get('verified') != {'size': stat.st_size, 'mtime': stat.st_mtime}:
+                pending[path] = entry
+        self.logger.info(f"Verifying {len(pending)} files")
+        with metrics.timer('verify_release'):
+            results = verify_files(list(pending), max_workers, self.buffer_size)
+        corrupt = []
+        for path, error in results.items():
+            filename = os.path.basename(path)
+            if error is None:
+                stat = os.stat(path)
+                self.manifest.update(filename, verified={'size': stat.st_size, 'mtime': stat.st_mtime})
+                continue
+            self.logger.error(f"File {filename} is corrupt: {error}")
+            metrics.count('files', outcome='corrupt')
+            corrupt.append(filename)
+            self.rejected.add(filename)
+            os.remove(path)
+            self.manifest.remove(filename)
+        if refetch:
+            urls = [pending[os.path.join(self.download_dir, filename)].get('url') for filename in corrupt]
+            self.download_urls([url for url in urls if url], delay=0)
+        return corrupt
+
+    def _download_file(self, url: str, hosts: Optional[HostLimiter] = None) -> Optional[str]:
+        filename = url.split("/")[-1]
+        filepath = os.path.join(self.download_dir, filename)
+        part_path = filepath + ".part"
         try:
-            #print(url)
-            filename = url.split("/")[-1]
-            filepath = os.path.join(self.download_dir, filename)
-            #print("filepath: ", filepath)
-            # Skip if file already exists
-            if os.path.exists(filepath):
-                self.logger.info(f"File {filename} already exists, skipping")
+            with connection_slot(hosts, url):
+                total_size, accepts_ranges, validators = ranged_download.probe(url, session=self.session)
+            # Skip if the file in this release is already up to date
+            if self.manifest.matches(filename, total_size, **validators):
+                self.logger.info(f"File {filename} is unchanged, skipping")
+                metrics.count('files', outcome='unchanged')
+                return self.storage.path(filename)
+            if not self.storage.is_local:
+                return self._upload_file(url, total_size, accepts_ranges, validators, hosts)
+            # Link the file from the previous release if the server copy did not change
+            if (self.previous_manifest and not os.path.exists(filepath) and filename not in self.rejected
+                    and self.previous_manifest.matches(filename, total_size, **validators)):
+                method = link_or_copy(os.path.join(self.previous_dir, filename), filepath)
+                previous = self.previous_manifest.get(filename)
+                self.manifest.update(filename, url=url, size=total_size, sha256=previous.get('sha256'), **validators)
+                with self._files_lock:
+                    self.downloaded_files.append(filepath)
+                self.logger.info(f"File {filename} is unchanged since the previous release ({method})")
+                metrics.count('files', outcome='linked')
                 return filepath
+            # Skip if a complete file already exists
+            if os.path.exists(filepath):
+                existing_size = os.path.getsize(filepath)
+                recorded = self.manifest.get(filename)
+                if total_size == 0 or (existing_size == total_size and not recorded):
+                    if not recorded:
+                        self.manifest.update(filename, url=url, size=existing_size,
+                                             sha256=file_sha256(filepath, self.buffer_size), **validators)
+                    self.logger.info(f"File {filename} already exists, skipping")
+                    metrics.count('files', outcome='existing')
+                    return filepath
+                if (not recorded and accepts_ranges and existing_size < total_size
+                        and not os.path.exists(part_path)):
+                    self.logger.info(f"File {filename} is incomplete ({existing_size} of {total_size} bytes), resuming")
+                    os.replace(filepath, part_path)
+                else:
+                    self.logger.info(f"File {filename} changed on the server, downloading again")
+                    os.remove(filepath)
             
             self.logger.info(f"Downloading {filename}")
+            use_segments = (accepts_ranges and self.segments > 1
+                            and total_size >= self.segments * self.min_segment_size
+                            and (not os.path.exists(part_path) or os.path.exists(part_path + ".segments.json")))
             
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
+            resumed = os.path.getsize(part_path) if os.path.exists(part_path) and not use_segments else 0
+            progress = ProgressReporter(filename, total_size, self.logger.info, done=resumed, file=filename)
             
-            # Get total file size
-            total_size = int(response.headers.get('content-length', 0))
+            validator = ranged_download.range_validator(validators)
+            with metrics.stage('download', file=filename):
+                for attempt in range(self.max_retries + 1):
+                    # Hashed as the bytes arrive; segments arrive out of order and are hashed afterwards
+                    digest = None if use_segments else hashlib.sha256()
+                    try:
+                        if use_segments:
+                            size = ranged_download.download_segments(url, part_path, total_size, self.segments,
+                                                                     buffer_size=self.buffer_size, progress=progress,
+                                                                     session=self.session, hosts=hosts,
+                                                                     validator=validator)
+                        else:
+                            with connection_slot(hosts, url):
+                                size = ranged_download.stream_to_part(url, part_path, accepts_ranges,
+                                                                      buffer_size=self.buffer_size, progress=progress,
+                                                                      digest=digest, session=self.session,
+                                                                      validator=validator)
+                        break
+                    except requests.exceptions.RequestException as e:
+                        if attempt == self.max_retries:
+                            raise
+                        metrics.count('retries', file=filename)
+                        self.logger.warning(f"Download of {filename} interrupted ({str(e)}), resuming")
+            metrics.gauge('bytes_per_second', round(progress.rate(), 1), file=filename)
             
-            with open(filepath, 'wb') as f:
-                if total_size == 0:
-                    f.write(response.content)
-                else:
-                    downloaded = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            # Log progress for large files
-                            if downloaded % (1024 * 1024) == 0:  # Log every MB
-                                percent = (downloaded / total_size) * 100
-                                self.logger.info(f"Downloaded {percent:.1f}% of {filename}")
+            if total_size and size != total_size:
+                self.logger.error(f"Incomplete download of {filename}: {size} of {total_size} bytes")
+                metrics.count('files', outcome='failed')
+                return None
+            os.replace(part_path, filepath)
+            ranged_download.remove_part(part_path)
+            if digest is not None:
+                sha256 = digest.hexdigest()
+            else:
+                with metrics.timer('hash', file=filename):
+                    sha256 = file_sha256(filepath, self.buffer_size)
+            self.manifest.update(filename, url=url, size=os.path.getsize(filepath), sha256=sha256, **validators)
+            metrics.count('files', outcome='downloaded')
             
-            self.downloaded_files.append(filepath)
+            with self._files_lock:
+                self.downloaded_files.append(filepath)
             self.logger.info(f"Successfully downloaded {filename}")
             return filepath
             
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Error downloading {url}: {str(e)}")
+            metrics.count('files', outcome='failed')
+            return None
+
+    def _upload_file(self, url: str, total_size: int, accepts_ranges: bool, validators: dict,
+                     hosts: Optional[HostLimiter] = None) -> Optional[str]:
+        """
+        Stream a file from the server into an object store multipart upload, without a local copy.
+        A dropped connection resumes from the last byte received.
+        Args:
+            url: URL of the file
+            total_size: Content-Length of the file, 0 if unknown
+            accepts_ranges: Whether the server accepts byte range requests
+            validators: ETag and Last-Modified of the file
+            hosts: Limiter of the connections per host, no limit if None
+        Returns:
+            Location of the stored file or None if the upload failed
+        """
+        filename = url.split("/")[-1]
+        location = self.storage.path(filename)
+        self.logger.info(f"Uploading {filename} to {location}")
+        progress = ProgressReporter(filename, total_size, self.logger.info, file=filename)
+        upload = None
+        try:
+            upload = self.storage.open_upload(filename)
+            with metrics.stage('download', file=filename):
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        with connection_slot(hosts, url):
+                            size = ranged_download.stream_to_upload(url, upload, accepts_ranges, progress=progress,
+                                                                    session=self.session)
+                        break
+                    except requests.exceptions.RequestException as e:
+                        if attempt == self.max_retries:
+                            raise
+                        metrics.count('retries', file=filename)
+                        self.logger.warning(f"Download of {filename} interrupted ({str(e)}), resuming")
+                if total_size and size != total_size:
+                    raise IOError(f"incomplete download, {size} of {total_size} bytes")
+                upload.complete()
+        except Exception as e:
+            # Storage errors are not requests exceptions, so they are handled here as well
+            self.logger.error(f"Error uploading {url} to {location}: {str(e)}")
+            metrics.count('files', outcome='failed')
+            if upload is not None:
+                upload.abort()
             return None
+        metrics.gauge('bytes_per_second', round(progress.rate(), 1), file=filename)
+        self.manifest.update(filename, url=url, size=size, sha256=upload.digest.hexdigest(), **validators)
+        metrics.count('files', outcome='downloaded')
+        with self._files_lock:
+            self.downloaded_files.append(location)
+        self.logger.info(f"Successfully uploaded {filename}")
+        return location
     
-    def download_all(self, delay: int = 2) -> List[str]:
+    def download_all(self, delay: float = 2, max_workers: int = 1, per_host_limit: int = 4,
+                     rate: Optional[float] = None, burst: int = 1) -> List[str]:
         """
         Download all TSV zip files from the webpage.
         Args:
-            delay: Delay between downloads in seconds to avoid overwhelming the server
+            delay: Minimum average delay between download starts in seconds to avoid overwhelming the server.
+                   Ignored when rate is given
+            max_workers: Number of files downloaded concurrently
+            per_host_limit: Maximum number of concurrent connections to any single host
+            rate: Download starts allowed per second (token bucket refill rate)
+            burst: Number of download starts that may happen back to back before rate limiting applies
         Returns:
             List of paths to successfully downloaded files
         """
-        download_links = self.get_download_links()
+        # Files that need downloading go first, largest first; unchanged files are only skipped or linked
+        links = prioritize(self.discover_links(), [self.manifest, self.previous_manifest])
+        download_links = [link['url'] for link in links]
         print(f"{len(download_links)} tables will be downloaded.")
         print("Downloading...")
-        for link in download_links:
-            self.download_file(link)
-            time.sleep(delay)
+        self.download_urls(download_links, delay=delay, max_workers=max_workers,
+                           per_host_limit=per_host_limit, rate=rate, burst=burst)
         
         print(f"Downloaded {len(self.downloaded_files)} files successfully")
         return self.downloaded_files
 
+    def download_urls(self, urls: List[str], delay: float = 2, max_workers: int = 1, per_host_limit: int = 4,
+                      rate: Optional[float] = None, burst: int = 1) -> List[Optional[str]]:
+        """
+        Download a list of TSV.zip URLs on a bounded worker pool.
+        Args:
+            urls: URLs of the files to download
+            delay: Minimum average delay between download starts in seconds. Ignored when rate is given
+            max_workers: Number of files downloaded concurrently
+            per_host_limit: Maximum number of concurrent connections to any single host
+            rate: Download starts allowed per second (token bucket refill rate)
+            burst: Number of download starts that may happen back to back before rate limiting applies
+        Returns:
+            Path to each file (or None if its download failed), in the same order as urls
+        """
+        if rate is None:
+            rate = 1.0 / delay if delay else None
+        bucket = TokenBucket(rate, capacity=burst)
+        hosts = HostLimiter(per_host_limit)
+        converter = None
+        conversions = []
+        if self.parquet_dir and self.storage.is_local:
+            from zip_to_parquet import convert_zip_to_parquet
+            converter = ProcessPoolExecutor(max_workers=self.convert_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+        def fetch(url: str) -> Optional[str]:
+            # Connection slots are taken per request inside download_file, so the segments of one
+            # file count against the per-host limit too
+            bucket.acquire()
+            path = self.download_file(url, hosts)
+            if path and converter:
+                # Convert in the background so the next downloads are not held up
+                conversions.append((path, converter.submit(convert_zip_to_parquet, path, self.parquet_dir)))
+            return path
+
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+            results = list(pool.map(fetch, urls))
+
+        if converter:
+            for path, future in conversions:
+                try:
+                    self.parquet_files.extend(future.result())
+                except Exception as e:
+                    self.logger.error(f"Error converting {path} to Parquet: {str(e)}")
+            converter.shutdown()
+
+        # Keep downloaded_files in link order regardless of completion order
+        order = {path: i for i, path in enumerate(results) if path}
+        with self._files_lock:
+            self.downloaded_files.sort(key=lambda path: order.get(path, len(order)))
+        return results
+
     def get_downloaded_files(self) -> List[str]:
         """
         Get list of successfully downloaded files.  
         Returns:
             List of paths to downloaded files
         """
-        return self.downloaded_files
\ No newline at end of file
+        return self.downloaded_files
+
+    def get_parquet_files(self) -> List[str]:
+        """
+        Get list of Parquet files written by the conversion stage.
+        Returns:
+            List of paths to Parquet files
+        """
+        return self.parquet_files
\ No newline at end of file
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+import ranged_download
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
+LINK_SUFFIX = 'tsv.zip'
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pv_links.json")
+
+
+def table_name(path: str) -> str:
+    """
+    Table name of a release file, e.g. g_patent for .../g_patent.tsv.zip
+    (named as PV_Compare's table_names does).
+    """
+    return os.path.basename(path).split(".")[0]
+
+
+def table_family(name: str) -> str:
+    """
+    Release family of a table: 'grant' (g_ tables), 'pgpub' (pg_ tables) or 'other'
+    """
+    if name.startswith("g_"):
+        return 'grant'
+    if name.startswith("pg_"):
+        return 'pgpub'
+    return 'other'
+
+
+def html_parser() -> str:
+    """
+    Get the fastest BeautifulSoup parser installed: lxml (C) if available, else the pure-Python html.parser.
+    """
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+def parse_links(html: str, page_url: str, suffix: str = LINK_SUFFIX, parser: Optional[str] = None) -> List[str]:
+    """
+    Find the file links of a download page.
+    Only <a> tags are parsed, the rest of the page is skipped.
+    Args:
+        html: Page content
+        page_url: URL of the page, to resolve relative links
+        suffix: Links ending with this are kept
+        parser: BeautifulSoup parser, the fastest installed if None
+    Returns:
+        Absolute URLs in page order, without duplicates
+    """
+    soup = BeautifulSoup(html, parser or html_parser(), parse_only=SoupStrainer('a', href=True))
+    links = {}
+    for link in soup.find_all('a', href=True):
+        if link['href'].endswith(suffix):
+            links.setdefault(urljoin(page_url, link['href']), None)
+    return list(links)
+
+
+def prioritize(links: List[dict], manifests: Optional[list] = None) -> List[dict]:
+    """
+    Order links for download: files that need downloading first, largest first so the big files
+    start early and the workers finish together, then files of unknown size, then files the
+    manifests record as unchanged, which are only skipped or linked.
+    Args:
+        links: Link metadata from LinkDiscovery.discover
+        manifests: ReleaseManifest objects to check for unchanged files (current, previous release)
+    Returns:
+        The links in download order
+    """
+    def priority(link):
+        unchanged = any(manifest.matches(link['file'], link['size'], link['etag'], link['last_modified'])
+                        for manifest in manifests or [] if manifest)
+        return (unchanged, not link['size'], -link['size'])
+    return sorted(links, key=priority)
+
+
+class LinkDiscovery:
+    """
+    Finds the table files on a set of PatentsView download pages.
+    Pages are fetched concurrently with conditional requests (ETag/Last-Modified). A page that did not
+    change, by the server's 304 or by its content hash, reuses its cached links and their HEAD metadata,
+    so discovery costs one request per page when nothing changed.
+    """
+
+    def __init__(self, pages: List[str], cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                 session: Optional[requests.Session] = None, max_workers: int = 8):
+        """
+        Args:
+            pages: URLs of the download pages
+            cache_path: JSON file caching pages, links and HEAD metadata between runs, no cache if None
+            session: Session the requests are sent on
+            max_workers: Number of pages and HEAD requests fetched concurrently
+        """
+        self.pages = pages
+        self.cache_path = cache_path
+        self.session = session or ranged_download.new_session(max_workers)
+        self.max_workers = max_workers
+        self.logger = logging.getLogger(__name__)
+        self.cache = {'pages': {}, 'links': {}}
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache.update(json.load(f))
+        return
+
+    def discover(self, refresh: bool = False) -> List[dict]:
+        """
+        Crawl the pages and describe every file linked from them.
+        Args:
+            refresh: Send HEAD requests for all links, even on pages that did not change
+        Returns:
+            One dict per file in page order: url, file, table, family ('grant', 'pgpub' or 'other'), page,
+            size (0 if unknown), etag, last_modified and accepts_ranges
+        """
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as pool:
+            crawled = list(pool.map(self._crawl, self.pages))
+            stale = list(dict.fromkeys(url for page, links, changed in crawled for url in links
+                                       if changed or refresh or url not in self.cache['links']))
+            heads = dict(zip(stale, pool.map(self._head, stale)))
+        links = []
+        for page, urls, changed in crawled:
+            for url in urls:
+                if url in heads:
+                    self.cache['links'][url] = heads[url]
+                file = url.split("/")[-1]
+                table = table_name(file)
+                links.append({'url': url, 'file': file, 'table': table, 'family': table_family(table), 'page': page,
+                              **self.cache['links'][url]})
+        self._save()
+        self.logger.info(f"Found {len(links)} files on {len(self.pages)} pages, {len(heads)} probed")
+        return links
+
+    def _crawl(self, page: str):
+        """
+        Returns:
+            Tuple of (page, its links, True if the page changed since it was cached)
+        """
+        with self._lock:
+            cached = self.cache['pages'].get(page)
+        headers = dict(HEADERS)
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            response = self.session.get(page, headers=headers, timeout=30)
+            if response.status_code == 304 and cached:
+                return page, cached['links'], False
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            if cached:
+                self.logger.warning(f"Error fetching {page} ({str(e)}), using its cached links")
+                return page, cached['links'], False
+            self.logger.error(f"Error fetching download links from {page}: {str(e)}")
+            return page, [], False
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        changed = not cached or cached.get('sha256') != content_hash
+        links = parse_links(response.text, page) if changed else cached['links']
+        with self._lock:
+            self.cache['pages'][page] = {'etag': response.headers.get('etag'),
+                                         'last_modified': response.headers.get('last-modified'),
+                                         'sha256': content_hash, 'links': links}
+        return page, links, changed
+
+    def _head(self, url: str) -> dict:
+        size, accepts_ranges, validators = ranged_download.probe(url, session=self.session)
+        return {'size': size, 'accepts_ranges': accepts_ranges, **validators}
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.cache, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.cache_path)
+        return
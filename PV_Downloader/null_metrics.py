@@ -0,0 +1,75 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+class NullMetrics:
+    """
+    Stand-in for the run metrics of PV_Compare's instrumentation module, used when the downloader
+    runs without PV_Compare on the import path. Measurements are dropped.
+    """
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        yield
+
+    @contextmanager
+    def stage(self, name: str, **labels) -> Iterator[None]:
+        yield
+
+    def count(self, name: str, value: int = 1, **labels) -> None:
+        return
+
+    def gauge(self, name: str, value, **labels) -> None:
+        return
+
+
+class ProgressReporter:
+    """
+    Logs the progress of a transfer every tenth of the total, like instrumentation.ProgressReporter
+    but without recording the bytes in the run metrics.
+    """
+
+    def __init__(self, name: str, total: int, log: Callable[[str], None], done: int = 0, **labels):
+        """
+        Args:
+            name: Name shown in the messages, e.g. the file name
+            total: Expected number of bytes, 0 if unknown
+            log: Called with each progress message, e.g. logger.info
+            done: Bytes already transferred earlier, e.g. of a resumed download
+            labels: Ignored, accepted for compatibility with instrumentation.ProgressReporter
+        """
+        self.name = name
+        self.total = total
+        self.log = log
+        self.done = done
+        self.transferred = 0
+        self._next_percent = (int(done * 100 / total) // 10 + 1) * 10 if total else 10
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        return
+
+    def __call__(self, nbytes: int) -> None:
+        with self._lock:
+            self.done += nbytes
+            self.transferred += nbytes
+            message = None
+            if self.total:
+                percent = self.done * 100 / self.total
+                if percent >= self._next_percent:
+                    message = f"Downloaded {percent:.0f}% of {self.name}"
+                    self._next_percent = (int(percent) // 10 + 1) * 10
+        if message:
+            self.log(message)
+        return
+
+    def rate(self) -> float:
+        """
+        Bytes per second transferred since the reporter was created
+        """
+        elapsed = time.monotonic() - self._start
+        return self.transferred / elapsed if elapsed > 0 else 0.0
+
+
+metrics = NullMetrics()
@@ -1,7 +1,13 @@
 # Databricks notebook source
+import os
+import sys
+#The downloader records its run metrics in PV_Compare's instrumentation module, imported from there
+#(notebooks run from their own directory)
+sys.path.append(os.path.abspath(os.path.join(os.getcwd(), "..", "PV_Compare")))
 import PatentsViewDownloader as pvd
+from release_manifest import find_previous_release
+from instrumentation import metrics
 from datetime import datetime
-import os
 
 # COMMAND ----------
 
@@ -15,7 +21,8 @@ text_table = ["https://patentsview.org/download/pg_brf_sum_text"]
 claims_table = ["https://patentsview.org/download/pg_claims"]
 desc_table = ["https://patentsview.org/download/pg_detail_desc_text"]
 draw_table = ["https://patentsview.org/download/pg_draw_desc_text"]
-urls = [grants, pgpubs]
+#The text pages are crawled with the table pages
+urls = [grants, pgpubs] + text_table + claims_table + desc_table + draw_table
 
 #Get current month and year
 current_month = datetime.now().month
@@ -26,12 +33,25 @@ release = str(current_month) + "_" + str(current_year)
 print(release)
 download_dir = os.path.join(volume, release)
 print(download_dir)
+os.makedirs(download_dir, exist_ok=True)
+
+#Unchanged tables are linked from the most recent prior release instead of downloaded again
+previous_dir = find_previous_release(volume, download_dir)
+print("Previous release: ", previous_dir)
 
 # COMMAND ----------
 
-for url in urls:
-    downloader = pvd.PatentsViewDownloader(url, download_dir)
-    downloaded_files = downloader.download_all()
+#Pages are crawled concurrently; pages unchanged since the last run reuse their cached links
+downloader = pvd.PatentsViewDownloader(urls, download_dir, previous_dir=previous_dir)
+downloaded_files = downloader.download_all(max_workers=4, per_host_limit=4, rate=1)
+
+for file in downloader.get_downloaded_files():
+    print(f"Downloaded: {file}")
+
+# COMMAND ----------
 
-    for file in downloader.get_downloaded_files():
-        print(f"Downloaded: {file}")
+#Bytes/sec, download and hash time per file, retries and file outcomes of this run
+#(kept out of the release directory, which should only hold the tables)
+metrics_dir = os.path.join(volume, "run_metrics")
+metrics.write(os.path.join(metrics_dir, release + "_download.json"))
+metrics.write(os.path.join(metrics_dir, release + "_download.prom"))
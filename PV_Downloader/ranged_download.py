@@ -0,0 +1,312 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import HostLimiter, connection_slot
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+MIN_BUFFER_SIZE = 1024 * 1024
+MAX_BUFFER_SIZE = 8 * 1024 * 1024
+# Network reads stay small so a dropped connection loses little data; disk writes go through the large buffer
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def clamp_buffer_size(buffer_size: int) -> int:
+    """
+    Keep write buffers within the 1-8 MB range.
+    Args:
+        buffer_size: Requested buffer size in bytes
+    Returns:
+        Buffer size clamped to [MIN_BUFFER_SIZE, MAX_BUFFER_SIZE]
+    """
+    return min(max(buffer_size, MIN_BUFFER_SIZE), MAX_BUFFER_SIZE)
+
+
+def new_session(pool_size: int = 16) -> requests.Session:
+    """
+    Create an HTTP session whose keep-alive connections are reused across requests and threads.
+    Args:
+        pool_size: Connections kept open per host, at least the number of concurrent requests to one host
+    Returns:
+        The session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def probe(url: str, timeout: float = 30,
+          session: Optional[requests.Session] = None) -> Tuple[int, bool, Dict[str, Optional[str]]]:
+    """
+    Send a HEAD request to learn the size of a file, whether the server accepts byte ranges
+    and the validators used to tell if the file changed.
+    Args:
+        url: URL of the file
+        timeout: Request timeout in seconds
+        session: Session to send the request on, a new connection if None
+    Returns:
+        Tuple of (Content-Length or 0 if unknown, True if the server accepts byte ranges,
+        dict with the 'etag' and 'last_modified' headers)
+    """
+    try:
+        response = (session or requests).head(url, allow_redirects=True, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return 0, False, {'etag': None, 'last_modified': None}
+    total_size = int(response.headers.get('content-length', 0))
+    accepts_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+    validators = {'etag': response.headers.get('etag'), 'last_modified': response.headers.get('last-modified')}
+    return total_size, accepts_ranges, validators
+
+
+def range_validator(validators: Dict[str, Optional[str]]) -> Optional[str]:
+    """
+    Pick the If-Range value of a file version: its strong ETag, else its Last-Modified date.
+    Args:
+        validators: The 'etag' and 'last_modified' headers from probe
+    Returns:
+        The If-Range value, or None if the server sent neither
+    """
+    etag = validators.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return validators.get('last_modified')
+
+
+def _response_validator(response: requests.Response) -> Optional[str]:
+    return range_validator({'etag': response.headers.get('etag'),
+                            'last_modified': response.headers.get('last-modified')})
+
+
+def _write_validator(part_path: str, validator: Optional[str]) -> None:
+    path = part_path + '.validator'
+    if validator is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as f:
+        f.write(validator)
+    return
+
+
+def remove_part(part_path: str) -> None:
+    """
+    Delete a .part file and the sidecars recording which version of the file it holds and how far
+    its segments got, if they exist.
+    Args:
+        part_path: Path of the partial file
+    """
+    for path in [part_path, part_path + '.validator', part_path + '.segments.json']:
+        if os.path.exists(path):
+            os.remove(path)
+    return
+
+
+def stream_to_part(url: str, part_path: str, accepts_ranges: bool,
+                   buffer_size: int = DEFAULT_BUFFER_SIZE, timeout: float = 60,
+                   progress: Optional[Callable[[int], None]] = None, digest=None,
+                   session: Optional[requests.Session] = None, validator: Optional[str] = None) -> int:
+    """
+    Stream a URL into a .part file, resuming from the bytes already on disk when the server allows it.
+    The version of the file the bytes belong to is kept in a .validator sidecar. A .part file of another
+    version is started over, and resumed requests carry If-Range so the server sends the whole file
+    instead of the missing bytes if it changed since.
+    Args:
+        url: URL of the file
+        part_path: Path of the partial file
+        accepts_ranges: Whether the server accepts byte range requests
+        buffer_size: Size of the read/write buffer in bytes
+        timeout: Request timeout in seconds
+        progress: Called with the size of every chunk received
+        digest: New hashlib object fed with the whole file as it is written, so it does not have to be
+                read again afterwards. Bytes resumed from the .part file are read back into it first
+        session: Session to send the request on, a new connection if None
+        validator: If-Range value of the file version being downloaded, from range_validator
+    Returns:
+        Size of the .part file after the transfer
+    """
+    offset = os.path.getsize(part_path) if accepts_ranges and os.path.exists(part_path) else 0
+    if offset and os.path.exists(part_path + '.validator'):
+        with open(part_path + '.validator') as f:
+            saved = f.read()
+        if validator and saved != validator:
+            # The .part file holds an older version of the file
+            offset = 0
+        else:
+            validator = saved
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        if validator:
+            headers['If-Range'] = validator
+    with (session or requests).get(url, stream=True, headers=headers, timeout=timeout) as response:
+        if response.status_code == 416:
+            # Requested range starts at or past the end: the .part file is already complete
+            _hash_existing(part_path, offset, digest, buffer_size)
+            return offset
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            # Server ignored the Range header or the file changed (If-Range failed), start over
+            offset = 0
+        if not offset:
+            _write_validator(part_path, _response_validator(response) or validator)
+        _hash_existing(part_path, offset, digest, buffer_size)
+        with open(part_path, 'ab' if offset else 'wb', buffering=buffer_size) as f:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    if progress:
+                        progress(len(chunk))
+    return os.path.getsize(part_path)
+
+
+def stream_to_upload(url: str, upload, accepts_ranges: bool, timeout: float = 60,
+                     progress: Optional[Callable[[int], None]] = None,
+                     session: Optional[requests.Session] = None) -> int:
+    """
+    Stream a URL into an object store upload, resuming where the last attempt stopped when the server allows it.
+    Args:
+        url: URL of the file
+        upload: storage.MultipartUpload to write to
+        accepts_ranges: Whether the server accepts byte range requests
+        timeout: Request timeout in seconds
+        progress: Called with the size of every chunk received
+        session: Session to send the request on, a new connection if None
+    Returns:
+        Number of bytes written to the upload
+    """
+    offset = upload.rewind(restart=not accepts_ranges)
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    with (session or requests).get(url, stream=True, headers=headers, timeout=timeout) as response:
+        if response.status_code == 416:
+            return offset
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            offset = upload.rewind(restart=True)
+        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+            if chunk:
+                upload.write(chunk)
+                offset += len(chunk)
+                if progress:
+                    progress(len(chunk))
+    return offset
+
+
+def _hash_existing(part_path: str, size: int, digest, buffer_size: int) -> None:
+    if digest is None or not size:
+        return
+    with open(part_path, 'rb') as f:
+        remaining = size
+        while remaining:
+            block = f.read(min(buffer_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return
+
+
+def _segment_ranges(total_size: int, segments: int) -> List[List[int]]:
+    step = -(-total_size // segments)
+    return [[start, min(start + step, total_size) - 1, 0] for start in range(0, total_size, step)]
+
+
+def download_segments(url: str, part_path: str, total_size: int, segments: int,
+                      buffer_size: int = DEFAULT_BUFFER_SIZE, timeout: float = 60,
+                      progress: Optional[Callable[[int], None]] = None,
+                      session: Optional[requests.Session] = None, hosts: Optional[HostLimiter] = None,
+                      validator: Optional[str] = None) -> int:
+    """
+    Download a file as parallel byte-range segments written in place into a preallocated .part file.
+    Progress of every segment is kept in a .segments.json sidecar so an interrupted download resumes
+    each segment where it stopped. The sidecar records the version of the file, so segments of another
+    version are started over; segment requests carry If-Range and fail if the file changes meanwhile.
+    Every segment request holds its own slot of the host limiter, so segments wait for a slot rather
+    than exceed the per-host connection limit.
+    Args:
+        url: URL of the file
+        part_path: Path of the partial file
+        total_size: Content-Length of the file
+        segments: Number of parallel byte-range requests
+        buffer_size: Size of the read/write buffer in bytes
+        timeout: Request timeout in seconds
+        progress: Called with the size of every chunk received, from several threads
+        session: Session shared by the segment requests, new connections if None
+        hosts: Limiter of the connections per host, no limit if None
+        validator: If-Range value of the file version being downloaded, from range_validator
+    Returns:
+        Number of bytes written across all segments
+    """
+    state_path = part_path + '.segments.json'
+    state = None
+    if os.path.exists(state_path) and os.path.exists(part_path):
+        with open(state_path) as f:
+            saved = json.load(f)
+        if saved.get('total_size') == total_size and saved.get('validator') == validator:
+            state = saved
+    if state is None:
+        state = {'url': url, 'total_size': total_size, 'validator': validator,
+                 'ranges': _segment_ranges(total_size, segments)}
+        with open(part_path, 'wb') as f:
+            f.truncate(total_size)
+    lock = threading.Lock()
+
+    def save_state():
+        tmp = state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, state_path)
+
+    def fetch(segment: List[int]) -> None:
+        start, end, done = segment
+        if start + done > end:
+            return
+        headers = {'Range': f'bytes={start + done}-{end}'}
+        if validator:
+            headers['If-Range'] = validator
+        with connection_slot(hosts, url), \
+                (session or requests).get(url, stream=True, headers=headers, timeout=timeout) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise requests.exceptions.RequestException(f"Server ignored range request for {url}, "
+                                                           f"or the file changed during the download")
+            with open(part_path, 'r+b', buffering=buffer_size) as f:
+                f.seek(start + done)
+                pending = 0
+                try:
+                    for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            pending += len(chunk)
+                            if progress:
+                                progress(len(chunk))
+                            if pending >= buffer_size:
+                                f.flush()
+                                with lock:
+                                    segment[2] += pending
+                                    save_state()
+                                pending = 0
+                finally:
+                    # Every chunk handed to f.write was received in full, so keep it even if the connection dropped
+                    f.flush()
+                    with lock:
+                        segment[2] += pending
+                        save_state()
+
+    with lock:
+        save_state()
+    with ThreadPoolExecutor(max_workers=len(state['ranges'])) as pool:
+        list(pool.map(fetch, state['ranges']))
+    written = sum(segment[2] for segment in state['ranges'])
+    if written == total_size:
+        os.remove(state_path)
+    return written
@@ -0,0 +1,94 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket used to pace requests to PatentsView.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: float = 1.0):
+        """
+        Initialize the bucket.
+        Args:
+            rate: Tokens added per second. None or 0 disables rate limiting
+            capacity: Maximum number of tokens that can be saved up for a burst
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        return
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Block until the requested number of tokens is available, then take them.
+        Args:
+            tokens: Number of tokens to take from the bucket
+        """
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """
+    Caps the number of simultaneous connections opened to any single host.
+    """
+
+    def __init__(self, per_host_limit: int = 4):
+        """
+        Initialize the limiter.
+        Args:
+            per_host_limit: Maximum number of concurrent requests per host
+        """
+        self.per_host_limit = max(per_host_limit, 1)
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        return
+
+    def _semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+    @contextmanager
+    def limit(self, url: str) -> Iterator[None]:
+        """
+        Hold one of the host's connection slots for the duration of the block.
+        Args:
+            url: URL whose host is being contacted
+        """
+        semaphore = self._semaphore(url)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def connection_slot(hosts: Optional[HostLimiter], url: str) -> ContextManager[None]:
+    """
+    Hold one of the host's connection slots for the duration of a request, or nothing without a limiter.
+    Args:
+        hosts: Limiter shared by the requests of a run, None for no limit
+        url: URL whose host is being contacted
+    Returns:
+        Context manager holding the slot
+    """
+    return hosts.limit(url) if hosts is not None else nullcontext()
@@ -0,0 +1,167 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+MANIFEST_NAME = "manifest.json"
+# Linux ioctl used to clone a file on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def file_sha256(path: str, buffer_size: int = 4 * 1024 * 1024) -> str:
+    """
+    Compute the sha256 digest of a file.
+    Args:
+        path: Path of the file
+        buffer_size: Read buffer size in bytes
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(buffer_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    Place an unchanged file from a previous release into the new release without downloading it.
+    Tries a hard link first, then a reflink, and falls back to a plain copy.
+    Args:
+        src: Path of the file in the previous release
+        dst: Path of the file in the new release
+    Returns:
+        Method used: 'hardlink', 'reflink' or 'copy'
+    """
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return 'reflink'
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def find_previous_release(root_dir: str, current_dir: str) -> Optional[str]:
+    """
+    Find the most recently updated release directory under root_dir that has a manifest.
+    Args:
+        root_dir: Directory that holds one subdirectory per release
+        current_dir: Directory of the release being downloaded, which is never returned
+    Returns:
+        Path of the previous release directory or None if there is none
+    """
+    candidates = []
+    for name in os.listdir(root_dir):
+        path = os.path.join(root_dir, name)
+        manifest = os.path.join(path, MANIFEST_NAME)
+        if os.path.abspath(path) != os.path.abspath(current_dir) and os.path.isfile(manifest):
+            candidates.append((os.path.getmtime(manifest), path))
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+class ReleaseManifest:
+    """
+    A JSON manifest of the files in one release directory with their URL, ETag,
+    Last-Modified, size and sha256.
+    """
+
+    def __init__(self, release_dir: str, storage=None):
+        """
+        Load the manifest of a release directory, or start an empty one.
+        Args:
+            release_dir: Directory of the release, where the manifest is kept
+            storage: Storage backend holding the files (storage.S3Storage, ...), release_dir if None
+        """
+        self.release_dir = release_dir
+        self.storage = storage
+        self.path = os.path.join(release_dir, MANIFEST_NAME)
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f).get('files', {})
+        return
+
+    def get(self, filename: str) -> Optional[dict]:
+        """
+        Get the manifest entry of a file.
+        Args:
+            filename: Name of the file in the release directory
+        Returns:
+            The entry or None if the file is not in the manifest
+        """
+        with self._lock:
+            return self.entries.get(filename)
+
+    def update(self, filename: str, **fields) -> dict:
+        """
+        Add or update the entry of a file and save the manifest.
+        Args:
+            filename: Name of the file in the release directory
+            fields: Entry fields to set (url, etag, last_modified, size, sha256, ...)
+        Returns:
+            The updated entry
+        """
+        with self._lock:
+            entry = self.entries.setdefault(filename, {})
+            entry.update(fields)
+            entry['updated'] = datetime.now(timezone.utc).isoformat()
+            self._save()
+            return dict(entry)
+
+    def remove(self, filename: str) -> None:
+        """
+        Drop the entry of a file, e.g. one that was found corrupt, and save the manifest.
+        Args:
+            filename: Name of the file in the release directory
+        """
+        with self._lock:
+            if self.entries.pop(filename, None) is not None:
+                self._save()
+        return
+
+    def matches(self, filename: str, size: int, etag: Optional[str], last_modified: Optional[str]) -> bool:
+        """
+        Check whether a file on the server is the same as the one recorded in the manifest.
+        The ETag is compared when the server sends one, otherwise Last-Modified, and the size must always match.
+        Args:
+            filename: Name of the file in the release directory
+            size: Content-Length reported by the server
+            etag: ETag reported by the server
+            last_modified: Last-Modified reported by the server
+        Returns:
+            True if the recorded file is unchanged on the server and still present in storage
+        """
+        entry = self.get(filename)
+        if not entry or not size or entry.get('size') != size:
+            return False
+        if etag:
+            same = entry.get('etag') == etag
+        elif last_modified:
+            same = entry.get('last_modified') == last_modified
+        else:
+            return False
+        if self.storage is not None:
+            return same and self.storage.size(filename) == size
+        path = os.path.join(self.release_dir, filename)
+        return same and os.path.exists(path) and os.path.getsize(path) == size
+
+    def _save(self) -> None:
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'files': self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
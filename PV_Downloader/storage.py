@@ -0,0 +1,185 @@
+import hashlib
+import os
+from typing import Optional
+from urllib.parse import urlparse
+
+# S3 rejects multipart parts smaller than 5 MB, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+
+
+class LocalStorage:
+    """
+    Release files in a local or mounted directory (e.g. a Databricks volume).
+    The downloader writes these through .part files, with resumable and segmented downloads.
+    """
+    is_local = True
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Directory of the release
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        return
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def size(self, name: str) -> Optional[int]:
+        """
+        Args:
+            name: File name
+        Returns:
+            Size of the stored file in bytes, or None if it is not stored
+        """
+        path = self.path(name)
+        return os.path.getsize(path) if os.path.exists(path) else None
+
+    def delete(self, name: str) -> None:
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+        return
+
+
+class S3Storage:
+    """
+    Release files in an S3 bucket or any S3-compatible object store (MinIO, Ceph, a moto server, ...).
+    Files are streamed from the HTTP response into a multipart upload, without a local copy.
+    Requires the boto3 package.
+    """
+    is_local = False
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 part_size: int = DEFAULT_PART_SIZE, client=None, **client_kwargs):
+        """
+        Args:
+            bucket: Bucket name
+            prefix: Key prefix of the release, e.g. 'patentsview/11_2024'
+            endpoint_url: Endpoint of an S3-compatible store, AWS if None
+            part_size: Bytes buffered in memory per multipart part, at least 5 MB
+            client: boto3 S3 client to use instead of creating one
+            client_kwargs: Passed to boto3.client, e.g. region_name or credentials
+        """
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url, **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        return
+
+    def key(self, name: str) -> str:
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def path(self, name: str) -> str:
+        return f"s3://{self.bucket}/{self.key(name)}"
+
+    def size(self, name: str) -> Optional[int]:
+        """
+        Args:
+            name: File name
+        Returns:
+            Size of the stored object in bytes, or None if it is not stored
+        """
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['ContentLength']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+        return
+
+    def open_upload(self, name: str) -> "MultipartUpload":
+        return MultipartUpload(self.client, self.bucket, self.key(name), self.part_size)
+
+
+class MultipartUpload:
+    """
+    A file streamed into an object store in parts.
+    Bytes received before a dropped HTTP connection stay in the part buffer, so the download
+    resumes with a Range request from the last byte received.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+        self.parts = []
+        self.buffer = bytearray()
+        self.committed = 0
+        # Fed with each part as it is uploaded, so bytes dropped on a restart never reach it
+        self.digest = hashlib.sha256()
+        return
+
+    def write(self, chunk: bytes) -> None:
+        self.buffer += chunk
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return
+
+    def _upload_part(self) -> None:
+        data = bytes(self.buffer)
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+        self.parts.append({'PartNumber': number, 'ETag': response['ETag']})
+        self.digest.update(data)
+        self.committed += len(data)
+        self.buffer = bytearray()
+        return
+
+    def rewind(self, restart: bool = False) -> int:
+        """
+        Get the offset a download continues from.
+        Args:
+            restart: Drop everything written so far, when the server cannot resume with a Range request
+        Returns:
+            Number of bytes written so far
+        """
+        if restart:
+            # Parts uploaded again under the same numbers replace the old ones
+            self.buffer = bytearray()
+            self.parts = []
+            self.committed = 0
+            self.digest = hashlib.sha256()
+        return self.committed + len(self.buffer)
+
+    def complete(self) -> int:
+        """
+        Upload the buffered tail and assemble the object.
+        Returns:
+            Size of the object in bytes
+        """
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+        return self.committed
+
+    def abort(self) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        return
+
+
+def open_storage(location: str, **kwargs):
+    """
+    Get the storage backend of a location.
+    Args:
+        location: Local directory, or s3://bucket/prefix
+        kwargs: Passed to S3Storage, e.g. endpoint_url
+    Returns:
+        LocalStorage or S3Storage
+    """
+    parsed = urlparse(location)
+    if parsed.scheme == 's3':
+        return S3Storage(parsed.netloc, parsed.path, **kwargs)
+    return LocalStorage(location)
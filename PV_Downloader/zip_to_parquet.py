@@ -0,0 +1,127 @@
+import os
+import zipfile
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class SchemaMismatch(ValueError):
+    """
+    Raised when a chunk holds values that do not fit the schema inferred from the sample.
+    """
+
+    def __init__(self, column: str):
+        super().__init__(f"Column {column} does not match its inferred type")
+        self.column = column
+
+
+def _is_id_column(column: str) -> bool:
+    # PatentsView IDs mix digits and letters (e.g. D-prefixed design patents) and may have leading zeros
+    return column == 'id' or column.endswith('_id')
+
+
+def infer_schema(zip_path: str, member: str, sample_rows: int = 100000,
+                 overrides: Optional[Dict[str, pa.DataType]] = None) -> pa.Schema:
+    """
+    Infer a stable Arrow schema for a TSV member from a sample of its rows.
+    Columns become int64, float64 or string; ID columns and numbers with leading zeros stay strings.
+    Args:
+        zip_path: Path of the TSV.zip file
+        member: Name of the TSV file inside the zip
+        sample_rows: Number of rows used for inference
+        overrides: Column types that replace the inferred ones
+    Returns:
+        The inferred schema
+    """
+    with zipfile.ZipFile(zip_path) as zfile, zfile.open(member) as f:
+        sample = pd.read_csv(f, sep="\t", dtype=str, nrows=sample_rows)
+    overrides = overrides or {}
+    fields = []
+    for col in sample.columns:
+        if col in overrides:
+            fields.append(pa.field(col, overrides[col]))
+            continue
+        values = sample[col].dropna()
+        numeric = pd.to_numeric(values, errors='coerce')
+        leading_zero = values.str.match(r'^-?0\d').any()
+        if _is_id_column(col) or values.empty or numeric.isna().any() or leading_zero:
+            dtype = pa.string()
+        elif (numeric % 1 == 0).all() and numeric.abs().max() < 2 ** 63:
+            dtype = pa.int64()
+        else:
+            dtype = pa.float64()
+        fields.append(pa.field(col, dtype))
+    return pa.schema(fields)
+
+
+def _to_table(chunk: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    arrays = []
+    for field in schema:
+        values = chunk[field.name]
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            # The sample had no leading zeros; parsing '007' as 7 would lose them
+            if values.dropna().str.match(r'^-?0\d').any():
+                raise SchemaMismatch(field.name)
+        try:
+            if pa.types.is_integer(field.type):
+                values = pd.to_numeric(values).astype('Int64')
+            elif pa.types.is_floating(field.type):
+                values = pd.to_numeric(values)
+        except (ValueError, TypeError):
+            raise SchemaMismatch(field.name)
+        arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _write_member(zip_path: str, member: str, out_path: str, schema: pa.Schema, chunksize: int) -> None:
+    tmp_path = out_path + ".tmp"
+    try:
+        with zipfile.ZipFile(zip_path) as zfile, zfile.open(member) as f, \
+                pq.ParquetWriter(tmp_path, schema) as writer:
+            for chunk in pd.read_csv(f, sep="\t", dtype=str, chunksize=chunksize):
+                writer.write_table(_to_table(chunk, schema))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    return
+
+
+def convert_zip_to_parquet(zip_path: str, parquet_dir: str, chunksize: int = 250000, sample_rows: int = 100000,
+                           overrides: Optional[Dict[str, pa.DataType]] = None) -> List[str]:
+    """
+    Stream every TSV member of a zip into a Parquet file, one chunk (row group) at a time,
+    so a table is never fully loaded into memory.
+    Members whose Parquet file is newer than the zip are not converted again.
+    Args:
+        zip_path: Path of the TSV.zip file
+        parquet_dir: Directory to write the Parquet files to
+        chunksize: Number of rows read and written per chunk
+        sample_rows: Number of rows used to infer the schema
+        overrides: Column types that replace the inferred ones
+    Returns:
+        List of paths to the Parquet files
+    """
+    os.makedirs(parquet_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path) as zfile:
+        members = [name for name in zfile.namelist() if not name.endswith('/')]
+    outputs = []
+    for member in members:
+        table_name = os.path.basename(member).split(".")[0]
+        out_path = os.path.join(parquet_dir, table_name + ".parquet")
+        outputs.append(out_path)
+        if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(zip_path):
+            continue
+        schema = infer_schema(zip_path, member, sample_rows, overrides)
+        while True:
+            try:
+                _write_member(zip_path, member, out_path, schema, chunksize)
+                break
+            except SchemaMismatch as e:
+                # A later chunk disagrees with the sample: fall back to string for that column and start over
+                index = schema.get_field_index(e.column)
+                schema = schema.set(index, pa.field(e.column, pa.string()))
+    return outputs
@@ -0,0 +1,87 @@
+import argparse
+import os
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def zip_members(path: str) -> List[str]:
+    """
+    Read the central directory of a zip file.
+    Args:
+        path: Path of the zip file
+    Returns:
+        Names of the file members
+    Raises:
+        zipfile.BadZipFile if the central directory is missing or damaged, e.g. in a truncated file
+    """
+    with zipfile.ZipFile(path) as zfile:
+        return [info.filename for info in zfile.infolist() if not info.is_dir()]
+
+
+def verify_member(path: str, member: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> Optional[str]:
+    """
+    Decompress one member of a zip file and check its CRC-32.
+    Decompression and CRC computation release the GIL, so members are checked in parallel on threads.
+    Args:
+        path: Path of the zip file
+        member: Name of the member
+        buffer_size: Bytes decompressed at a time
+    Returns:
+        None if the member is intact, otherwise a description of the problem
+    """
+    try:
+        with zipfile.ZipFile(path) as zfile, zfile.open(member) as f:
+            # ZipExtFile compares the CRC-32 once the member has been read to the end
+            while f.read(buffer_size):
+                pass
+    except (zipfile.BadZipFile, zlib.error, EOFError, OSError) as e:
+        return f"{member}: {e}"
+    return None
+
+
+def verify_files(paths: List[str], max_workers: int = 8,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE) -> Dict[str, Optional[str]]:
+    """
+    Verify zip files on a thread pool, one task per member so a single large file is also split up.
+    Args:
+        paths: Paths of the zip files
+        max_workers: Number of threads
+        buffer_size: Bytes decompressed at a time
+    Returns:
+        Path to None for intact files, or to a description of the first problem found
+    """
+    results: Dict[str, Optional[str]] = {path: None for path in paths}
+    tasks: List[Tuple[str, str]] = []
+    for path in paths:
+        try:
+            tasks.extend((path, member) for member in zip_members(path))
+        except (zipfile.BadZipFile, OSError) as e:
+            results[path] = f"central directory: {e}"
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        errors = pool.map(lambda task: verify_member(*task, buffer_size), tasks)
+        for (path, member), error in zip(tasks, errors):
+            if error and results[path] is None:
+                results[path] = error
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the central directory and member CRCs of the zips of a release")
+    parser.add_argument("release_dir", help="directory with the .zip files")
+    parser.add_argument("--workers", type=int, default=8, help="verification threads")
+    args = parser.parse_args()
+    paths = sorted(os.path.join(args.release_dir, file) for file in os.listdir(args.release_dir) if file.endswith(".zip"))
+    results = verify_files(paths, args.workers)
+    for path, error in results.items():
+        print(f"{os.path.basename(path)}: {error or 'ok'}")
+    bad = [path for path, error in results.items() if error]
+    print(f"{len(paths) - len(bad)} of {len(paths)} files intact")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core join of the application, assignee, patent_assignee (cross walk) and
+location tables, giving the same rows as top_patent_assignees.joinData without
+loading the tables whole.
+
+The two large tables (applications and the cross walk) are read in chunks, with only
+the needed columns, and hash-partitioned by patent_id into Parquet files in a work
+directory. Each partition is then joined on its own, so memory depends on the partition
+size rather than the release size. The small dimension tables (assignees, locations) are
+held as lookup indexes with dictionary-encoded (categorical) values, so a name repeated
+on thousands of patents is stored once.
+
+The result is written as Parquet partitioned by filing year
+(<out_dir>/filing_year=YYYY/part-000.parquet).
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#Output columns, in the order joinData returns them
+COLUMNS = ['patent_id', 'filing_date', 'assignee_id', 'location_id', 'assignee_type', 'assignee_name',
+           'assignee_country']
+
+
+def _read_args(path):
+    args = {'sep': "\t", 'dtype': str, 'keep_default_na': False, 'na_values': [""]}
+    if path.endswith(".zip"):
+        args['compression'] = "zip"
+    return args
+
+
+class Lookup:
+    """
+    Dimension table held as an index of its keys and dictionary-encoded value columns
+    """
+
+    def __init__(self, keys, columns):
+        """
+        Args:
+            keys = pd.Series of the key of each row (duplicate keys keep their first row)
+            columns = dict of output column name to pd.Series of values, aligned with keys
+        """
+        first = ~keys.duplicated().to_numpy()
+        self.index = pd.Index(keys[first].to_numpy())
+        self.columns = {name: values[first].astype('category').reset_index(drop=True)
+                        for name, values in columns.items()}
+        return
+
+    def take(self, keys):
+        """
+        Look up keys, giving missing values for keys not in the table
+        Args:
+            keys = pd.Series of keys
+        Returns:
+            dict of column name to categorical pd.Series aligned with keys
+        """
+        positions = self.index.get_indexer(keys)
+        result = {}
+        for name, values in self.columns.items():
+            # Keys not found get position -1, which picks the -1 (missing) code appended at the end
+            codes = np.append(values.cat.codes.to_numpy(), -1)[positions]
+            # Every partition shares the same categories, so the Parquet files have one dictionary per column
+            result[name] = pd.Series(pd.Categorical.from_codes(codes, categories=values.cat.categories),
+                                     index=keys.index)
+        return result
+
+
+class AssigneeJoinPipeline:
+    """
+    Joins applications to their assignees and assignee locations in bounded memory
+    """
+
+    def __init__(self, application, assignee, crosswalk, location, chunksize=1000000, partitions=32, work_dir=None):
+        """
+        Args:
+            application = path of application.tsv (patent_id, date)
+            assignee = path of assignee.tsv (id, type, organization)
+            crosswalk = path of patent_assignee.tsv (patent_id, assignee_id, location_id)
+            location = path of location.tsv (id, country)
+            chunksize = rows read at a time from the large tables
+            partitions = number of hash partitions; more partitions use less memory each
+            work_dir = directory for the partition files. A temporary directory is used if None
+        Files may also be .tsv.zip.
+        """
+        self.application = application
+        self.assignee = assignee
+        self.crosswalk = crosswalk
+        self.location = location
+        self.chunksize = chunksize
+        self.partitions = partitions
+        self.work_dir = work_dir
+        return
+
+    def build_lookups(self):
+        """
+        Read the assignee and location tables into lookup indexes
+        """
+        df = pd.read_csv(self.assignee, usecols=['id', 'type', 'organization'], **_read_args(self.assignee))
+        self.assignees = Lookup(df['id'], {'assignee_type': pd.to_numeric(df['type'], errors='coerce'),
+                                           'assignee_name': df['organization']})
+        df = pd.read_csv(self.location, usecols=['id', 'country'], **_read_args(self.location))
+        self.locations = Lookup(df['id'], {'assignee_country': df['country']})
+        print("Number of records in assignee table: ", len(self.assignees.index))
+        print("Number of records in location table: ", len(self.locations.index))
+        return
+
+    def _partition(self, path, usecols, rename, name, work_dir):
+        """
+        Stream a large table into hash partitions of patent_id
+        """
+        rows = 0
+        for n, chunk in enumerate(pd.read_csv(path, usecols=usecols, chunksize=self.chunksize, **_read_args(path))):
+            chunk = chunk.rename(columns=rename)
+            rows += len(chunk)
+            parts = pd.util.hash_pandas_object(chunk['patent_id'], index=False).to_numpy() % self.partitions
+            for part in np.unique(parts):
+                folder = os.path.join(work_dir, name, f"p{part}")
+                os.makedirs(folder, exist_ok=True)
+                chunk[parts == part].to_parquet(os.path.join(folder, f"c{n}.parquet"), index=False)
+        return rows
+
+    def _load(self, work_dir, name, part, columns):
+        folder = os.path.join(work_dir, name, f"p{part}")
+        if not os.path.exists(folder):
+            return pd.DataFrame({col: pd.Series(dtype=object) for col in columns})
+        return pd.read_parquet(folder)
+
+    def run(self, out_dir):
+        """
+        Join the tables and write the result as Parquet partitioned by filing year
+        Args:
+            out_dir = output directory, replaced if it exists
+        Returns:
+            dict with the number of application, cross walk and output rows and the files written
+        """
+        self.build_lookups()
+        work_dir = self.work_dir or tempfile.mkdtemp(prefix="pv_assignee_join_")
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        summary = {'application_rows': 0, 'crosswalk_rows': 0, 'rows': 0, 'files': []}
+        writers = {}
+        schema = None
+        try:
+            summary['application_rows'] = self._partition(self.application, ['patent_id', 'date'],
+                                                          {'date': 'filing_date'}, "application", work_dir)
+            summary['crosswalk_rows'] = self._partition(self.crosswalk, ['patent_id', 'assignee_id', 'location_id'],
+                                                        {}, "crosswalk", work_dir)
+            print("Number of records in application table: ", summary['application_rows'])
+            print("Number of records in cross-walk table: ", summary['crosswalk_rows'])
+            for part in range(self.partitions):
+                apps = self._load(work_dir, "application", part, ['patent_id', 'filing_date'])
+                links = self._load(work_dir, "crosswalk", part, ['patent_id', 'assignee_id', 'location_id'])
+                joined = apps.merge(links, how='left', on='patent_id')
+                for name, values in self.assignees.take(joined['assignee_id']).items():
+                    joined[name] = values
+                for name, values in self.locations.take(joined['location_id']).items():
+                    joined[name] = values
+                joined = joined[COLUMNS]
+                summary['rows'] += len(joined)
+                year = joined['filing_date'].str[:4].where(joined['filing_date'].str.match(r"^\d{4}"), "unknown")
+                for value, group in joined.groupby(year, sort=True):
+                    table = pa.Table.from_pandas(group, preserve_index=False)
+                    schema = schema or table.schema
+                    if value not in writers:
+                        # One file per year, each partition adding row groups to it
+                        folder = os.path.join(out_dir, f"filing_year={value}")
+                        os.makedirs(folder, exist_ok=True)
+                        path = os.path.join(folder, "part-000.parquet")
+                        writers[value] = pq.ParquetWriter(path, schema)
+                        summary['files'].append(path)
+                    writers[value].write_table(table.cast(schema))
+        finally:
+            for writer in writers.values():
+                writer.close()
+            if self.work_dir is None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"Joined {summary['rows']} records into {len(summary['files'])} files in {out_dir}")
+        return summary
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Download zipped PatentsView tables and extract them with a few MB of memory per file.
+
+Three ways to get a table, chosen with fetch(url, dest_dir, mode=...):
+    'stream'  - decompress the members while the download arrives, parsing the zip local
+                headers, so neither the archive nor a temporary copy of it is kept. Archives
+                that cannot be read this way (e.g. stored members of unknown size) are
+                spooled instead
+    'spool'   - download the archive to a temporary file next to the destination, extract
+                it and delete it
+    'keep'    - download the archive and do not extract it; pandas reads the member of a
+                single-file .zip directly (see table_file)
+
+Everything is copied with large buffers, so memory does not grow with the file size.
+"""
+import os
+import shutil
+import struct
+import zlib
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from zipfile import ZipFile
+
+#Size of the read/write buffers
+BUFFER = 1024 * 1024
+LOCAL_HEADER = b"PK\x03\x04"
+DESCRIPTOR = b"PK\x07\x08"
+STORED, DEFLATED = 0, 8
+
+
+class _Reader:
+    """
+    File-like wrapper allowing bytes read ahead to be pushed back
+    """
+
+    def __init__(self, raw, buffer_size):
+        self.raw = raw
+        self.buffer_size = buffer_size
+        self.pending = b""
+        return
+
+    def read(self, n=-1):
+        if self.pending:
+            if n < 0 or n >= len(self.pending):
+                data, self.pending = self.pending, b""
+            else:
+                data, self.pending = self.pending[:n], self.pending[n:]
+            return data
+        return self.raw.read(self.buffer_size if n < 0 else n)
+
+    def read_exact(self, n):
+        data = b""
+        while len(data) < n:
+            block = self.read(n - len(data))
+            if not block:
+                raise EOFError("Archive ended early")
+            data += block
+        return data
+
+    def unread(self, data):
+        self.pending = data + self.pending
+        return
+
+
+def _target(dest_dir, name):
+    #Keep members inside dest_dir, whatever their stored path
+    target = os.path.realpath(os.path.join(dest_dir, name))
+    if not target.startswith(os.path.realpath(dest_dir) + os.sep):
+        raise ValueError(f"Zip member {name} is outside {dest_dir}")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return target
+
+
+def stream_extract(response, dest_dir, buffer_size=BUFFER):
+    """
+    Extract a zip archive from a stream, one member at a time
+    Args:
+        response = file-like object of the archive, e.g. an HTTP response
+        dest_dir = directory to extract to
+        buffer_size = bytes read at a time
+    Returns:
+        List of extracted file paths
+    Raises:
+        ValueError if a member cannot be streamed, zlib.error or EOFError if the archive is damaged
+    """
+    reader = _Reader(response, buffer_size)
+    paths = []
+    while True:
+        signature = reader.read_exact(4)
+        if signature != LOCAL_HEADER:
+            #The central directory follows the last member
+            break
+        header = reader.read_exact(26)
+        flags, method, crc, compressed, size, name_len, extra_len = struct.unpack("<2xHH4xIIIHH", header)
+        name = reader.read_exact(name_len).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = reader.read_exact(extra_len)
+        zip64 = _has_zip64(extra)
+        described = bool(flags & 0x08)
+        if flags & 0x01 or method not in (STORED, DEFLATED) or (method == STORED and described):
+            raise ValueError(f"Zip member {name} cannot be streamed")
+        #Directory entries have no content, but may still be stored as an empty deflate stream
+        directory = name.endswith("/")
+        target = _target(dest_dir, name.rstrip("/"))
+        if directory:
+            os.makedirs(target, exist_ok=True)
+        actual = 0
+        with open(os.devnull if directory else target + ".part", "wb", buffering=buffer_size) as f:
+            if method == STORED:
+                remaining = compressed
+                while remaining:
+                    block = reader.read(min(buffer_size, remaining))
+                    if not block:
+                        raise EOFError("Archive ended early")
+                    remaining -= len(block)
+                    actual = zlib.crc32(block, actual)
+                    f.write(block)
+            else:
+                inflater = zlib.decompressobj(-15)
+                while not inflater.eof:
+                    block = reader.read()
+                    if not block:
+                        raise EOFError("Archive ended early")
+                    #Bounded output per call, so a highly compressed block does not fill memory
+                    data = inflater.decompress(block, buffer_size)
+                    while data:
+                        actual = zlib.crc32(data, actual)
+                        f.write(data)
+                        data = inflater.decompress(inflater.unconsumed_tail, buffer_size)
+                reader.unread(inflater.unused_data)
+        if described:
+            #Data descriptor: optional signature, CRC and the two sizes
+            first = reader.read_exact(4)
+            crc = struct.unpack("<I", reader.read_exact(4) if first == DESCRIPTOR else first)[0]
+            reader.read_exact(16 if zip64 else 8)
+        if directory:
+            continue
+        if actual != crc:
+            os.remove(target + ".part")
+            raise zlib.error(f"CRC mismatch in {name}")
+        os.replace(target + ".part", target)
+        paths.append(target)
+    return paths
+
+
+def _has_zip64(extra):
+    while len(extra) >= 4:
+        tag, length = struct.unpack("<HH", extra[:4])
+        if tag == 0x0001:
+            return True
+        extra = extra[4 + length:]
+    return False
+
+
+def extract_zip(zip_path, dest_dir, buffer_size=BUFFER):
+    """
+    Extract a zip file on disk with large buffers
+    Returns:
+        List of extracted file paths
+    """
+    paths = []
+    with ZipFile(zip_path) as zfile:
+        for info in zfile.infolist():
+            if info.is_dir():
+                continue
+            target = _target(dest_dir, info.filename)
+            with zfile.open(info) as src, open(target + ".part", "wb") as dst:
+                shutil.copyfileobj(src, dst, buffer_size)
+            os.replace(target + ".part", target)
+            paths.append(target)
+    return paths
+
+
+def _spool(response, path, buffer_size):
+    with open(path + ".part", "wb") as f:
+        shutil.copyfileobj(response, f, buffer_size)
+    os.replace(path + ".part", path)
+    return path
+
+
+def fetch(url, dest_dir, mode='stream', buffer_size=BUFFER, timeout=None):
+    """
+    Download a zipped table and extract it
+    Args:
+        url = URL of the .zip file
+        dest_dir = directory the table is written to (created if needed)
+        mode = 'stream', 'spool' or 'keep' (see the module docstring)
+        buffer_size = bytes read and written at a time
+        timeout = socket timeout in seconds
+    Returns:
+        List of the extracted file paths, or the path of the kept .zip file
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    zip_path = os.path.join(dest_dir, os.path.basename(urlparse(url).path))
+    with urlopen(url, timeout=timeout) as response:
+        if mode == 'keep':
+            return [_spool(response, zip_path, buffer_size)]
+        if mode == 'stream':
+            #Peek at the first header, so an archive that cannot be streamed is spooled before anything is read
+            reader = _Reader(response, buffer_size)
+            head = reader.read_exact(30)
+            flags, method = struct.unpack("<6xHH", head[:10])
+            if head[:4] == LOCAL_HEADER and not flags & 0x01 and (method == DEFLATED or
+                                                                  (method == STORED and not flags & 0x08)):
+                reader.unread(head)
+                return stream_extract(reader, dest_dir, buffer_size)
+            response = reader
+            reader.unread(head)
+        tmp = _spool(response, zip_path + ".download", buffer_size)
+    try:
+        return extract_zip(tmp, dest_dir, buffer_size)
+    finally:
+        os.remove(tmp)
+
+
+def table_file(path):
+    """
+    Path of a table that may have been kept zipped: path itself if it exists, else path + ".zip"
+    """
+    return path if os.path.exists(path) or not os.path.exists(path + ".zip") else path + ".zip"
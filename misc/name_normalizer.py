@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Normalization of assignee/organization names.
+
+Names repeat heavily (a release has millions of assignee rows but only a few hundred
+thousand distinct names), so the names are dictionary encoded first and the rules are
+applied once to each distinct name, as vectorized string operations over the distinct
+values. The mapping of raw to normalized names can be cached on disk, so later runs
+only normalize names they have not seen before.
+
+A rule is a function taking a pd.Series of names and returning the normalized
+pd.Series. Rules are applied in order; the cache is kept per list of rules.
+
+Usage:
+    normalizer = NameNormalizer(rules=[fold_unicode, strip_punctuation, upper, strip_suffixes()],
+                                cache_dir="name_cache")
+    data['organization'] = normalizer.normalize(data['organization'])
+"""
+import glob
+import hashlib
+import os
+import re
+import unicodedata
+import uuid
+import numpy as np
+import pandas as pd
+
+#Corporate suffixes removed by strip_suffixes, as they appear after strip_punctuation and upper
+SUFFIXES = ['INC', 'INCORPORATED', 'CORP', 'CORPORATION', 'CO', 'COMPANY', 'LTD', 'LIMITED', 'LLC', 'LLP', 'LP',
+            'PLC', 'GMBH', 'AG', 'KG', 'SA', 'SAS', 'SRL', 'SPA', 'BV', 'NV', 'AB', 'AS', 'OY', 'KK', 'PTY']
+
+
+def strip_punctuation(names):
+    #Remove all punctuation
+    return names.str.replace(r'[^\w\s]+', '', regex=True)
+
+
+def upper(names):
+    #Make all names capitalized
+    return names.str.upper()
+
+
+def collapse_whitespace(names):
+    #Trim and reduce runs of whitespace to a single space
+    return names.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def fold_unicode(names):
+    #Decompose accented characters and drop the accents, e.g. "Société" -> "Societe"
+    def fold(name):
+        return "".join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+    return names.map(fold, na_action='ignore')
+
+
+def strip_suffixes(suffixes=SUFFIXES):
+    """
+    Make a rule removing trailing corporate suffixes, e.g. "ACME WIDGETS CO LTD" -> "ACME WIDGETS"
+    Args:
+        suffixes = suffixes to remove, matched as whole words at the end of the name
+    Returns:
+        The rule function
+    """
+    pattern = r'(?:[\s,.]+(?:' + "|".join(re.escape(s) for s in sorted(suffixes, key=len, reverse=True)) + r')\.?)+\s*$'
+
+    def rule(names):
+        return names.str.replace(pattern, '', regex=True, flags=re.IGNORECASE)
+    #The name identifies the rule in the cache, so it changes with the suffix list
+    rule.__name__ = "strip_suffixes_" + hashlib.sha256("|".join(suffixes).encode('utf-8')).hexdigest()[:12]
+    return rule
+
+
+#Rules of top_filings_PGPUB.cleanData
+DEFAULT_RULES = [strip_punctuation, upper]
+
+
+class NameNormalizer:
+    """
+    Applies a list of rules to each distinct name once, with an optional cache across runs
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, cache_dir=None):
+        """
+        Args:
+            rules = list of rule functions, applied in order
+            cache_dir = directory for the cached mapping of raw to normalized names. None disables the cache.
+                        Each call that finds new names adds a part file with only those names
+        """
+        self.rules = list(rules)
+        self.cache_dir = cache_dir
+        self.mapping = None
+        return
+
+    @property
+    def signature(self):
+        #Identifies the list of rules, so a cache made with other rules is not used
+        names = "|".join(f"{rule.__module__}.{rule.__name__}" for rule in self.rules)
+        return hashlib.sha256(names.encode('utf-8')).hexdigest()[:16]
+
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, f"names_{self.signature}")
+
+    def _load(self):
+        if self.mapping is not None:
+            return
+        self.mapping = pd.Series(dtype=object, index=pd.Index([], dtype=object))
+        parts = sorted(glob.glob(os.path.join(self._cache_path(), "part-*.parquet"))) if self.cache_dir else []
+        if parts:
+            df = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+            #Runs sharing the cache can both have added a name
+            df = df.drop_duplicates('name')
+            self.mapping = pd.Series(df['normalized'].to_numpy(dtype=object),
+                                     index=pd.Index(df['name'].to_numpy(dtype=object), dtype=object))
+            print(f"Loaded {len(self.mapping)} cached names")
+        return
+
+    def _save(self, names, normalized):
+        #Only the new names are written, as a part file of their own
+        os.makedirs(self._cache_path(), exist_ok=True)
+        path = os.path.join(self._cache_path(), f"part-{uuid.uuid4().hex}.parquet")
+        tmp = path + ".tmp"
+        pd.DataFrame({'name': names, 'normalized': normalized}).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        return
+
+    def apply_rules(self, names):
+        """
+        Apply the rules to a Series of names, without the cache
+        """
+        for rule in self.rules:
+            names = rule(names)
+        return names
+
+    def normalize(self, names, categorical=False):
+        """
+        Normalize a Series of names
+        Args:
+            names = pd.Series of names (missing values stay missing)
+            categorical = return a categorical Series, which uses less memory for repeated names
+        Returns:
+            pd.Series of normalized names aligned with names
+        """
+        self._load()
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            codes, uniques = names.cat.codes.to_numpy(), names.cat.categories.to_numpy(dtype=object)
+        else:
+            codes, uniques = pd.factorize(names)
+            uniques = np.asarray(uniques, dtype=object)
+        #Only distinct names missing from the mapping go through the rules
+        positions = self.mapping.index.get_indexer(uniques)
+        new = uniques[positions < 0]
+        if len(new):
+            #Object dtype keeps Python regex semantics, where \w also matches accented letters
+            normalized = self.apply_rules(pd.Series(new, dtype=object)).to_numpy(dtype=object)
+            self.mapping = pd.concat([self.mapping, pd.Series(normalized, index=new)])
+            positions = self.mapping.index.get_indexer(uniques)
+            if self.cache_dir:
+                self._save(new, normalized)
+        print(f"Normalized {len(uniques)} distinct names ({len(new)} new) in {len(names)} records")
+        values = self.mapping.to_numpy(dtype=object)[positions]
+        if categorical:
+            #Distinct raw names can normalize to the same name, so the categories are factorized again
+            value_codes, categories = pd.factorize(values)
+            codes = np.append(value_codes, -1)[codes]
+            return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=names.index, name=names.name)
+        return pd.Series(np.append(values, None)[codes], index=names.index, name=names.name, dtype=object)
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Client for the PatentsView API.
+
+Queries are paged automatically (cursor pagination with the "after" option of the
+PatentSearch API, or page numbers for the legacy API), run with a bounded number of
+concurrent requests, retried with exponential backoff on 429 and 5xx responses and
+cached on disk by query, so re-running a script does not hit the API again.
+
+Requests are made with the requests library on worker threads driven by asyncio, so no
+extra HTTP dependency is needed.
+
+Usage:
+    client = PatentsViewAPI(api_key="...", cache_dir="api_cache")
+    df = client.run(client.query_frame({"_gte": {"patent_date": "2024-01-01"}},
+                                       fields=["patent_id", "patent_date"], sort=[{"patent_id": "asc"}]))
+
+For info about the PatentsView API see:
+https://search.patentsview.org/docs/
+"""
+import asyncio
+import email.utils
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import requests
+
+#Current PatentSearch API endpoint for patents
+ENDPOINT = r"https://search.patentsview.org/api/v1/patent/"
+#Statuses that are retried: rate limited and server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PatentsViewAPIError(Exception):
+    """
+    Raised when the API returns an error that retrying did not fix
+    """
+
+
+def retry_after_seconds(value, now=None):
+    """
+    Read a Retry-After header, given either as seconds (possibly fractional) or as an HTTP date
+
+    Args:
+        value = header value, or None
+        now = current time as an aware datetime, for the HTTP date form. Defaults to the clock
+    Returns:
+        Seconds to wait (0 for a date in the past), or None if the header is missing or unreadable
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+        return max(seconds, 0.0) if math.isfinite(seconds) else None
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        # HTTP dates are in GMT
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - (now or datetime.now(timezone.utc))).total_seconds(), 0.0)
+
+
+class PatentsViewAPI:
+    """
+    Paged, concurrent, cached queries against a PatentsView API endpoint
+    """
+
+    def __init__(self, endpoint=ENDPOINT, api_key=None, cache_dir=None, max_concurrency=4, max_retries=5,
+                 backoff=1.0, timeout=60, page_size=1000, pagination='cursor', verify=True):
+        """
+        Args:
+            endpoint = URL of the query endpoint, e.g. https://search.patentsview.org/api/v1/assignee/
+            api_key = API key sent as X-Api-Key. Defaults to the PATENTSVIEW_API_KEY environment variable
+            cache_dir = directory for cached responses. None disables the cache
+            max_concurrency = most requests in flight at once, across all queries
+            max_retries = times a request is retried after a 429/5xx response or a connection error
+            backoff = seconds waited before the first retry, doubled for every further retry
+            timeout = request timeout in seconds
+            page_size = records requested per page
+            pagination = 'cursor' to page with the "after" option (PatentSearch API) or 'page' for
+                         page numbers (legacy API, whose pages can be fetched concurrently)
+            verify = verify TLS certificates
+        """
+        self.endpoint = endpoint
+        self.api_key = api_key or os.environ.get("PATENTSVIEW_API_KEY")
+        self.cache_dir = cache_dir
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.page_size = page_size
+        self.pagination = pagination
+        self.verify = verify
+        self.session = requests.Session()
+        if self.api_key:
+            self.session.headers['X-Api-Key'] = self.api_key
+        self._semaphore = None
+        self._loop = None
+        return
+
+    @staticmethod
+    def run(coroutine):
+        """
+        Run a coroutine of this client from synchronous code
+        """
+        return asyncio.run(coroutine)
+
+    def _cache_path(self, params):
+        key = json.dumps({'endpoint': self.endpoint, **params}, sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + ".json")
+
+    def _get(self, params):
+        """
+        Make one request, retrying rate limits and server errors (runs on a worker thread)
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(self.endpoint, params=params, timeout=self.timeout, verify=self.verify)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise PatentsViewAPIError(f"Request failed after {attempt + 1} attempts: {e}")
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                # The PatentSearch API says how long to wait with Retry-After when it rate limits
+                delay = retry_after_seconds(response.headers.get('Retry-After'))
+                time.sleep(self._delay(attempt) if delay is None else delay)
+                continue
+            if response.status_code != 200:
+                raise PatentsViewAPIError(f"API returned {response.status_code}: {response.text[:200]}")
+            return response.json()
+
+    def _delay(self, attempt):
+        return self.backoff * 2 ** attempt * (1 + random.random() / 4)
+
+    async def fetch(self, params):
+        """
+        Get one page of results, from the cache if it was fetched before
+
+        Args:
+            params = query string parameters (q, f, s and o as JSON strings)
+        Returns:
+            The decoded JSON response
+        """
+        path = self._cache_path(params) if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        if self._loop is not asyncio.get_running_loop():
+            # A semaphore belongs to one event loop, and every run() starts a new one
+            self._loop = asyncio.get_running_loop()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            data = await asyncio.to_thread(self._get, params)
+        if data.get('error') is True:
+            raise PatentsViewAPIError(f"API reported an error for {params}")
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        return data
+
+    @staticmethod
+    def records(data):
+        """
+        Get the list of records from a response, whatever the entity (patents, assignees, ...)
+        """
+        for key, value in data.items():
+            if isinstance(value, list) and (not value or isinstance(value[0], dict)):
+                return value
+        return []
+
+    @staticmethod
+    def total(data):
+        return data.get('total_hits', data.get('total_patent_count', data.get('count', 0)))
+
+    def _params(self, query, fields, sort, options):
+        params = {'q': json.dumps(query)}
+        if fields:
+            params['f'] = json.dumps(fields)
+        if sort:
+            params['s'] = json.dumps(sort)
+        params['o'] = json.dumps(options)
+        return params
+
+    async def iter_pages(self, query, fields=None, sort=None):
+        """
+        Iterate over the pages of results of a query, in order
+
+        Args:
+            query = query as a dict, e.g. {"_gte": {"patent_date": "2024-01-01"}}
+            fields = fields returned for each record
+            sort = sort order, e.g. [{"patent_id": "asc"}]. Cursor pagination needs a sort on a unique
+                   field, patent_id ascending is used when none is given
+        Yields:
+            List of records of each page
+        """
+        if self.pagination == 'page':
+            async for page in self._iter_numbered_pages(query, fields, sort):
+                yield page
+            return
+        sort = sort or [{"patent_id": "asc"}]
+        sort_fields = [next(iter(item)) for item in sort]
+        if fields:
+            # The cursor is read from the sort fields of the last record, so they must be returned
+            fields = list(fields) + [field for field in sort_fields if field not in fields]
+        options = {'size': self.page_size}
+        while True:
+            data = await self.fetch(self._params(query, fields, sort, options))
+            page = self.records(data)
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            # The next page starts after the sort values of the last record
+            last = page[-1]
+            options = {'size': self.page_size, 'after': [last.get(field) for field in sort_fields]}
+
+    async def _iter_numbered_pages(self, query, fields, sort):
+        first = await self.fetch(self._params(query, fields, sort, {'page': 1, 'per_page': self.page_size}))
+        if self.records(first):
+            yield self.records(first)
+        pages = -(-self.total(first) // self.page_size)
+        # Later pages are requested together, up to max_concurrency at a time, and yielded in order
+        tasks = [asyncio.ensure_future(self.fetch(self._params(query, fields, sort,
+                                                               {'page': page, 'per_page': self.page_size})))
+                 for page in range(2, pages + 1)]
+        try:
+            for task in tasks:
+                page = self.records(await task)
+                if page:
+                    yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def query_frame(self, query, fields=None, sort=None):
+        """
+        Get all results of a query as a DataFrame
+
+        Args:
+            query, fields, sort = see iter_pages
+        Returns:
+            pd.DataFrame with one row per record (nested lists are left as objects)
+        """
+        frames = [pd.DataFrame(page) async for page in self.iter_pages(query, fields, sort)]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=fields)
+
+    async def query_to_parquet(self, path, query, fields=None, sort=None):
+        """
+        Write all results of a query to a Parquet file page by page, so memory does not grow with
+        the number of results (requires pyarrow)
+
+        Args:
+            path = Parquet file to write
+            query, fields, sort = see iter_pages
+        Returns:
+            Number of records written
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        rows = 0
+        tmp = path + ".tmp"
+        try:
+            async for page in self.iter_pages(query, fields, sort):
+                if writer is None:
+                    schema = pa.Table.from_pylist(page).schema
+                    # Fields that are null throughout the first page are stored as strings
+                    text_fields = [field.name for field in schema if pa.types.is_null(field.type)]
+                    schema = pa.schema([pa.field(field.name, pa.string()) if field.name in text_fields else field
+                                        for field in schema])
+                    writer = pq.ParquetWriter(tmp, schema)
+                if text_fields:
+                    page = [{**record, **{name: self._text(record.get(name)) for name in text_fields}}
+                            for record in page]
+                # Later pages are conformed to the schema of the first one
+                writer.write_table(pa.Table.from_pylist(page, schema=schema))
+                rows += len(page)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is not None:
+            os.replace(tmp, path)
+        print(f"\t Wrote {rows} records to {path}")
+        return rows
+
+    @staticmethod
+    def _text(value):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value)
+
+    async def query_many(self, queries, fields=None, sort=None):
+        """
+        Run several queries concurrently, sharing the request limit
+
+        Args:
+            queries = list of queries
+            fields, sort = see iter_pages
+        Returns:
+            List of DataFrames, one per query in the same order
+        """
+        return await asyncio.gather(*[self.query_frame(query, fields, sort) for query in queries])
+
+    def status(self):
+        """
+        Check that the endpoint answers, with a single small uncached request
+
+        Returns:
+            HTTP status code, or None if the server could not be reached
+        """
+        options = {'size': 1} if self.pagination == 'cursor' else {'page': 1, 'per_page': 1}
+        try:
+            response = self.session.get(self.endpoint, params=self._params({"patent_id": "0"}, None, None, options),
+                                        timeout=self.timeout, verify=self.verify)
+        except requests.exceptions.RequestException:
+            return None
+        return response.status_code
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming top-N counts of filings by assignee, without building the joined table.
+
+The publication table is held as an index of document numbers (with the publication year
+and country), and the rawassignee table is read in chunks. Each chunk is matched
+to the index, its organization names cleaned, and its counts added to a counter:
+
+    ExactCounter - exact hash aggregation; memory grows with the number of distinct keys
+    SpaceSaving  - Space-Saving heavy hitters; keeps at most `capacity` keys, and each count
+                   is an overestimate by at most its `error` (at most records / capacity)
+
+Counts can be by organization alone or by organization and year and/or country.
+"""
+import pandas as pd
+from name_normalizer import NameNormalizer
+
+
+class ExactCounter:
+    """
+    Exact counts of keys, added chunk by chunk
+    """
+
+    def __init__(self):
+        self.counts = None
+        self.records = 0
+        return
+
+    def update(self, counts):
+        """
+        Args:
+            counts = pd.Series of counts of one chunk, indexed by key
+        """
+        self.records += int(counts.sum())
+        self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+        return
+
+    def top(self, n):
+        """
+        Returns:
+            pd.DataFrame of the n keys with the highest counts, with columns count and error (always 0)
+        """
+        if self.counts is None:
+            return pd.DataFrame({'count': pd.Series(dtype='int64'), 'error': pd.Series(dtype='int64')})
+        counts = self.counts.astype('int64').sort_values(ascending=False, kind='stable').head(n)
+        return pd.DataFrame({'count': counts, 'error': 0})
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the heaviest keys in bounded memory
+
+    Each chunk is counted exactly and merged into the summary: keys already in the summary add
+    their counts, new keys start from the smallest count of a full summary (recorded as their
+    error), and only the `capacity` highest counts are kept. A key's true count lies between
+    count - error and count, and any key with more than records / capacity filings is kept.
+    """
+
+    def __init__(self, capacity=100000):
+        """
+        Args:
+            capacity = number of keys kept
+        """
+        self.capacity = capacity
+        self.counts = None
+        self.errors = None
+        self.records = 0
+        return
+
+    def update(self, counts):
+        """
+        Args:
+            counts = pd.Series of counts of one chunk, indexed by key
+        """
+        self.records += int(counts.sum())
+        counts = counts.astype('int64')
+        if self.counts is None:
+            self.counts, self.errors = counts, pd.Series(0, index=counts.index, dtype='int64')
+        else:
+            #Smallest count in a full summary bounds the count of any key it has dropped
+            floor = int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+            new = ~counts.index.isin(self.counts.index)
+            self.counts = self.counts.add(counts, fill_value=0).astype('int64')
+            self.errors = self.errors.reindex(self.counts.index, fill_value=0)
+            added = counts.index[new]
+            self.counts.loc[added] += floor
+            self.errors.loc[added] = floor
+        if len(self.counts) > self.capacity:
+            keep = self.counts.sort_values(ascending=False, kind='stable').index[:self.capacity]
+            self.counts, self.errors = self.counts.loc[keep], self.errors.loc[keep]
+        return
+
+    def top(self, n):
+        """
+        Returns:
+            pd.DataFrame of the n keys with the highest counts, with columns count and error
+        """
+        if self.counts is None:
+            return pd.DataFrame({'count': pd.Series(dtype='int64'), 'error': pd.Series(dtype='int64')})
+        counts = self.counts.sort_values(ascending=False, kind='stable').head(n)
+        return pd.DataFrame({'count': counts, 'error': self.errors.loc[counts.index]})
+
+
+def load_publications(path, chunksize=1000000):
+    """
+    Read the publication table into an index of document numbers
+    Args:
+        path = path of publication.tsv
+        chunksize = rows read at a time
+    Returns:
+        pd.DataFrame indexed by document_number with columns year and pub_country
+    """
+    parts = []
+    for chunk in pd.read_csv(path, delimiter="\t", usecols=['document_number', 'date', 'country'],
+                             dtype=str, chunksize=chunksize):
+        chunk = chunk.set_index('document_number')
+        parts.append(pd.DataFrame({'year': pd.to_numeric(chunk['date'].str[:4], errors='coerce').astype('Int16'),
+                                   'pub_country': chunk['country'].astype('category')}))
+    publications = pd.concat(parts) if parts else pd.DataFrame(columns=['year', 'pub_country'], dtype=object)
+    #pub_country is categorical again after concat only if every chunk had the same categories
+    publications['pub_country'] = publications['pub_country'].astype('category')
+    return publications[~publications.index.duplicated()]
+
+
+def stream_top_assignees(publication, rawassignee, n=25, by=None, method='exact', capacity=100000,
+                         chunksize=1000000, normalizer=None, save=None):
+    """
+    Count filings by assignee organization from chunked input and return the top n
+    Args:
+        publication = path of publication.tsv
+        rawassignee = path of rawassignee.tsv
+        n = number of keys returned
+        by = extra keys of the counts: any of 'year' (year of the publication) and 'country'
+             (assignee country)
+        method = 'exact' for hash aggregation or 'spacesaving' for the bounded-memory summary
+        capacity = keys kept by the Space-Saving summary
+        chunksize = rawassignee rows read at a time
+        normalizer = NameNormalizer used to clean the names. The default rules are used if None
+        save = CSV path to also write the joined records to, chunk by chunk. None to not write them
+    Returns:
+        pd.DataFrame of the top n keys with columns count and error (0 for exact counts)
+    """
+    by = list(by or [])
+    counter = ExactCounter() if method == 'exact' else SpaceSaving(capacity)
+    normalizer = normalizer or NameNormalizer()
+    publications = load_publications(publication)
+    print("Number of records in publication table: ", len(publications))
+    col = ['document_number', 'sequence', 'name_first', 'name_last', 'organization', 'type', 'city', 'state',
+           'country']
+    rows = 0
+    for i, chunk in enumerate(pd.read_csv(rawassignee, delimiter="\t", usecols=col if save else
+                                          ['document_number', 'organization', 'country'],
+                                          dtype={'document_number': str}, chunksize=chunksize)):
+        rows += len(chunk)
+        #Inner join on the publication index: assignees of unknown publications are not counted
+        positions = publications.index.get_indexer(chunk['document_number'])
+        found = positions >= 0
+        chunk = chunk[found].rename(columns={'country': 'assignee_country'})
+        matched = publications.iloc[positions[found]]
+        chunk['year'] = matched['year'].to_numpy()
+        chunk['pub_country'] = matched['pub_country'].to_numpy()
+        chunk['organization'] = normalizer.normalize(chunk['organization'], categorical=True)
+        if save:
+            chunk.to_csv(save, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        keys = ['organization'] + [{'country': 'assignee_country'}.get(key, key) for key in by]
+        counter.update(chunk.groupby(keys, observed=True).size())
+    print(f"Counted {counter.records} filings of {rows} assignee records")
+    top = counter.top(n)
+    top.index.names = ['organization'] + by
+    return top.reset_index()
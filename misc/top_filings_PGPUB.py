@@ -18,10 +18,12 @@ Cleans data and counts publications by assignee sorted by descending count.
 """
 #Import python libararies
 import os #for changing directory
-from io import BytesIO #for unzipping files
-from urllib.request import urlopen #for downloading data
-from zipfile import ZipFile #for unzipping files
+import sys #for importing the query layer from PV_Compare
+from fetch_extract import fetch, table_file #for downloading and unzipping files
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PV_Compare"))
 import pandas as pd #for working with data
+from name_normalizer import NameNormalizer, DEFAULT_RULES #for cleaning organization names
+from streaming_counts import stream_top_assignees #for counting without joining the whole tables
 
 #Global variables - can be edited if needed
 DIR = os.getcwd() #Directory location where python file is saved
@@ -39,18 +41,31 @@ F1 = r"publication.tsv"
 F2 = r"rawassignee.tsv"
 #File name to save data to same directory as python file
 SAVE = r"application_assignee_data.csv"
+#How tables are downloaded: 'stream' unzips while downloading, 'keep' leaves them zipped (pandas reads the zip)
+FETCH_MODE = 'stream'
+#Directory for the cache of cleaned organization names, None to not cache
+NAME_CACHE = DIR + "/name_cache"
+#Rules used to clean organization names, e.g. add fold_unicode or strip_suffixes() from name_normalizer
+NAME_RULES = DEFAULT_RULES
+#Count filings from chunks of the tables instead of joining and saving the whole tables
+STREAMING = True
+#Number of top assignees shown, and extra keys of the counts ('year' and/or 'country')
+TOP_N = 25
+COUNT_BY = []
+#'exact' counts, or 'spacesaving' to keep only the heaviest assignees in bounded memory
+COUNT_METHOD = 'exact'
+#Set to True to also save the joined data to SAVE in streaming mode
+SAVE_JOINED = False
+#Set to True to count with the embedded SQL engine instead (needs the duckdb package)
+SQL = False
 
 #This function downloads and unzips data into the directory
 def getData():
     print("Beginning data download ...")
     urls = [URL1, URL2]
-    for url in urls:
-        with urlopen(url) as zipresp:
-            with ZipFile(BytesIO(zipresp.read())) as zfile:
-                if url == URL1:
-                    zfile.extractall(DIR1)
-                else:
-                    zfile.extractall(DIR2)
+    dirs = [DIR1, DIR2]
+    for url, folder in zip(urls, dirs):
+        fetch(url, folder, mode=FETCH_MODE)
     return
 
 def joinData():
@@ -58,14 +73,14 @@ def joinData():
     path = DIR + "/" + DIR1 + "/"
     os.chdir(path)
     col = ['document_number','date','country','kind','filing_type']
-    df1 = pd.read_csv(F1, delimiter="\t", usecols = col)
+    df1 = pd.read_csv(table_file(F1), delimiter="\t", usecols = col)
     df1.rename(columns = {'country':'pub_country'}, inplace = True)
     #print(len(df1))
     path = DIR + "/" + DIR2 + "/"
     os.chdir(path)
     col = ['document_number','sequence', 'name_first', 'name_last',
        'organization', 'type', 'city', 'state', 'country']
-    df2 = pd.read_csv(F2, delimiter="\t", usecols = col)
+    df2 = pd.read_csv(table_file(F2), delimiter="\t", usecols = col)
     df2.rename(columns = {'country':'assignee_country'}, inplace = True)
     #print(len(df2))
     df3 = df1.merge(df2, how = 'left', on = 'document_number')
@@ -74,10 +89,10 @@ def joinData():
 #Cleans the organization/assignee name
 def cleanData(data):
     print("Cleaning data ...")
-    #Remove all punctuation from organziation
-    data['organization'] = data['organization'].str.replace(r'[^\w\s]+', '')
-    #Make all organization names capitalized
-    data['organization'] = data['organization'].str.upper()
+    #Remove all punctuation from organziation and make all organization names capitalized,
+    #cleaning each distinct name once
+    normalizer = NameNormalizer(rules=NAME_RULES, cache_dir=NAME_CACHE)
+    data['organization'] = normalizer.normalize(data['organization'])
     return data
 
 #Counts applications by organization/assignee
@@ -87,6 +102,32 @@ def countApps(data):
     print(data2)
     return
 
+#Counts applications by organization/assignee from chunks of the tables, without the joined table
+def countAppsStreaming():
+    print('Number of filings per Assignee since 2005')
+    data = stream_top_assignees(table_file(DIR + "/" + DIR1 + "/" + F1), table_file(DIR + "/" + DIR2 + "/" + F2), n=TOP_N, by=COUNT_BY,
+                                method=COUNT_METHOD, normalizer=NameNormalizer(rules=NAME_RULES, cache_dir=NAME_CACHE),
+                                save=DIR + "/" + SAVE if SAVE_JOINED else None)
+    print(data)
+    return data
+
+#Counts applications by organization/assignee with a SQL query over the table files
+def countAppsSQL():
+    print('Number of filings per Assignee since 2005')
+    from release_query import ReleaseQuery
+    tables = {'publication': table_file(DIR + "/" + DIR1 + "/" + F1), 'rawassignee': table_file(DIR + "/" + DIR2 + "/" + F2)}
+    with ReleaseQuery(tables=tables) as query:
+        #Counted by raw name in SQL, so only the distinct names are cleaned in python
+        data = query.sql("""
+            SELECT r.organization, count(*) AS count
+            FROM rawassignee r JOIN publication p ON r.document_number = p.document_number
+            WHERE r.organization IS NOT NULL
+            GROUP BY r.organization""")
+    data['organization'] = NameNormalizer(rules=NAME_RULES, cache_dir=NAME_CACHE).normalize(data['organization'])
+    data = data.groupby('organization')['count'].sum().sort_values(ascending=False).head(TOP_N)
+    print(data)
+    return data
+
 #save data as csv file to same directory as python file
 def saveData(data):
     print('Saving Data to directory')
@@ -97,6 +138,12 @@ def saveData(data):
 #main function to run script
 def main():
     getData(); #comment out after downloading data to avoid downloading again
+    if SQL:
+        countAppsSQL() #counts applications by filer with the SQL engine
+        return
+    if STREAMING:
+        countAppsStreaming() #counts applications by filer from chunks of the tables
+        return
     data = joinData() #joins the tables together
     data = cleanData(data) #cleans organization names
     saveData(data) #save data to csv file
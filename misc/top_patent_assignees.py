@@ -16,10 +16,9 @@ Also uses patent_assignee table to merge the tables
 """
 #Import python libararies
 import os #for changing directory
-from io import BytesIO #for unzipping files
-from urllib.request import urlopen #for downloading data
-from zipfile import ZipFile #for unzipping files
+from fetch_extract import fetch, table_file #for downloading and unzipping files
 import pandas as pd #for working with data
+from assignee_join import AssigneeJoinPipeline #for joining tables larger than memory
 
 #Global variables - can be edited if needed
 DIR = os.getcwd() #Directory location where python file is saved
@@ -49,22 +48,18 @@ F3 = r"patent_assignee.tsv"
 F4 = r"location.tsv"
 #File name to save data to same directory as python file
 SAVE = r"application_assignee_data.csv"
+#Directory of the Parquet output of the out-of-core join, partitioned by filing year
+SAVE_PARQUET = r"application_assignee_data"
+#How tables are downloaded: 'stream' unzips while downloading, 'keep' leaves them zipped (pandas reads the zip)
+FETCH_MODE = 'stream'
 
 #This function downloads and unzips data into the directory
 def getData():
     print("Beginning data download ...")
     urls = [URL1, URL2, URL3, URL4]
-    for url in urls:
-        with urlopen(url) as zipresp:
-            with ZipFile(BytesIO(zipresp.read())) as zfile:
-                if url == URL1:
-                    zfile.extractall(DIR1)
-                elif url == URL2:
-                    zfile.extractall(DIR2)
-                elif url == URL3:
-                    zfile.extractall(DIR3)
-                else:
-                    zfile.extractall(DIR4)
+    dirs = [DIR1, DIR2, DIR3, DIR4]
+    for url, folder in zip(urls, dirs):
+        fetch(url, folder, mode=FETCH_MODE)
     return
 
 def joinData():
@@ -72,7 +67,7 @@ def joinData():
     #Read application data
     path = DIR + "/" + DIR1 + "/"
     os.chdir(path)
-    df1 = pd.read_csv(F1, delimiter="\t", low_memory=False)
+    df1 = pd.read_csv(table_file(F1), delimiter="\t", low_memory=False)
     df1 = df1[['patent_id','date']]
     df1 = df1.rename(columns={'patent_id':'patent_id', 'date':'filing_date'})
     print("Number of records in application table: ", len(df1))
@@ -80,7 +75,7 @@ def joinData():
     #Read assignee data
     path = DIR + "/" + DIR2 + "/"
     os.chdir(path)
-    df2 = pd.read_csv(F2, delimiter="\t", low_memory=False)
+    df2 = pd.read_csv(table_file(F2), delimiter="\t", low_memory=False)
     df2 = df2[['id','type','organization']]
     cols = {'id':'assignee_id', 'type':'assignee_type','organization':'assignee_name'}
     df2 = df2.rename(columns=cols)
@@ -89,13 +84,13 @@ def joinData():
     #Read cross walk data
     path = DIR + "/" + DIR3 + "/"
     os.chdir(path)
-    df3 = pd.read_csv(F3, delimiter="\t", low_memory=False)
+    df3 = pd.read_csv(table_file(F3), delimiter="\t", low_memory=False)
     print("Number of records in cross-walk table: ", len(df3))
 
     #Read location data
     path = DIR + "/" + DIR4 + "/"
     os.chdir(path)
-    df4 = pd.read_csv(F4, delimiter="\t", low_memory=False)
+    df4 = pd.read_csv(table_file(F4), delimiter="\t", low_memory=False)
     df4 = df4[['id','country']]
     cols = {'id':'location_id','country':'assignee_country'}
     df4 = df4.rename(columns=cols)
@@ -109,6 +104,13 @@ def joinData():
     print(df5[:10])
     return df5
 
+#Joins the same tables as joinData in bounded memory and saves them as Parquet
+def joinDataOutOfCore():
+    print("Now joining the data...")
+    pipeline = AssigneeJoinPipeline(table_file(os.path.join(DIR, DIR1, F1)), table_file(os.path.join(DIR, DIR2, F2)),
+                                    table_file(os.path.join(DIR, DIR3, F3)), table_file(os.path.join(DIR, DIR4, F4)))
+    return pipeline.run(os.path.join(DIR, SAVE_PARQUET))
+
 #save data as csv file to same directory as python file
 def saveData(data):
     print('Saving Data to directory')
@@ -119,8 +121,9 @@ def saveData(data):
 #main function to run script
 def main():
     getData(); #comment out after downloading data to avoid downloading again
-    data = joinData() #joins the tables together
-    saveData(data) #save data to csv file
+    joinDataOutOfCore() #joins the tables together and saves them as Parquet
+    #data = joinData() #joins the tables in memory instead, for small releases
+    #saveData(data) #save data to csv file
     return
 
 #Calls the main function above
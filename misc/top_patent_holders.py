@@ -13,10 +13,9 @@ https://api.patentsview.org/doc.html
 """
 # import python libraries
 import requests # to make API request
-import json #to retrieve API data
-import pandas as pd #for data manipulation
 import os #to get current working directory
 from requests.packages.urllib3.exceptions import InsecureRequestWarning # to deal with PatentsView API issue
+from patentsview_api import PatentsViewAPI # paged, cached API queries
 
 
 #Global variables - can be edited if needed
@@ -24,17 +23,18 @@ DIR = os.getcwd() #Directory location where this python file is saved
 STATA_FILE = r'patents_assignees.dta' #Name of the stata file created and saved in same directory
 
 #API settings - most adhere to API documentation noted above
-URL = r'https://api.patentsview.org/patents/query?q='
-q = r'{"_gte":{"patent_date":"1979-12-31"}}'
-f = r'["patent_number","patent_date","patent_type"]'
-s = r'[{"patent_date":"asc"}]'
-QUERY = URL + q + "&f=" + f + "&s=" + s
+URL = r'https://api.patentsview.org/patents/query'
+q = {"_gte":{"patent_date":"1979-12-31"}}
+f = ["patent_number","patent_date","patent_type"]
+s = [{"patent_date":"asc"}]
+CACHE_DIR = os.path.join(DIR, "api_cache") #API responses are saved here so reruns do not query again
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+#The legacy API pages by page number, so pages are requested 4 at a time
+CLIENT = PatentsViewAPI(URL, cache_dir=CACHE_DIR, max_concurrency=4, pagination='page', verify=False)
 
 #Checks that the API is working properly. Will send error message if not.
 def check_api_status():
-    response = requests.get(QUERY, verify = False)
-    status = response.status_code
+    status = CLIENT.status()
     print('API Status Code', status)
     if status != 200:
         print("Error: not able to process PatentsView API request.")
@@ -42,15 +42,23 @@ def check_api_status():
         print("Connected to PatentsView API and downloading data.")
     return
 
-#Retrives data from PatentsViewAPI
+#Retrives every page of data from PatentsViewAPI
 def get_data():
-    response = requests.get(QUERY, verify = False)
-    print(json.dumps(response.json(), sort_keys=True, indent=4))
-    return response
+    data = CLIENT.run(CLIENT.query_frame(q, fields=f, sort=s))
+    print("Number of patents retrieved: ", len(data))
+    print(data[:10])
+    return data
+
+#save data as stata file to same directory as python file
+def saveData(data):
+    print('Saving Data to directory')
+    data.to_stata(os.path.join(DIR, STATA_FILE), write_index=False)
+    return
 
 def main():
     check_api_status()
     data = get_data()
+    saveData(data)
     return
 
 
@@ -0,0 +1,47 @@
+import os
+import sys
+import pytest
+
+# The script folders import each other's modules by name, as they do when run from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ["PV_Compare", "PV_Downloader", "misc", "PV_Benchmark"]:
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    # Caches kept under ~/.cache (release catalogs, ...) go to a fresh directory for every test
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    return tmp_path / "home"
+
+
+
+def baseline_metrics(new, old):
+    """
+    Metrics of two fully read DataFrames computed the way DataFrameComparator did before it read
+    tables in chunks (nunique, set intersection, drop_duplicates), keyed by column
+    """
+    metrics = {}
+    for col in new.columns:
+        metrics[col] = {'New_Num_Unique_Values': new[col].nunique(),
+                        'Prior_Num_Unique_Values': old[col].nunique(),
+                        'New_Num_Missing_Values': new[col].isna().sum(),
+                        'Prior_Num_Missing_Values': old[col].isna().sum(),
+                        'Num_Values_Common': len(set(new[col].dropna()) & set(old[col].dropna())),
+                        'New_Data_Type': str(new[col].dtype),
+                        'Prior_Data_Type': str(old[col].dtype)}
+    metrics['New Release'] = {'Num_Records': len(new), 'Num_Duplicated_Rows': len(new) - len(new.drop_duplicates())}
+    metrics['Prior Release'] = {'Num_Records': len(old), 'Num_Duplicated_Rows': len(old) - len(old.drop_duplicates())}
+    return metrics
+
+
+@pytest.fixture
+def assert_matches_baseline():
+    """
+    Check a metrics table against the metrics of the fully read releases
+    """
+    def check(metrics, new, old):
+        actual = {row['Column']: {key: value for key, value in row.items() if key != 'Column' and value == value}
+                  for row in metrics.to_dict('records')}
+        assert actual == baseline_metrics(new, old)
+    return check
@@ -0,0 +1,116 @@
+import gzip
+import zipfile
+import pandas as pd
+import pytest
+from backends import ArrowBackend, MetricsBackend, PandasBackend, PolarsBackend, get_backend
+
+NEW = {
+    'id': ['1000001', '1000002', '1000003', '1000001', 'D900001', '1000002'],
+    'score': ['1', '2', '', '2.5', '1', '3'],
+    'count': ['1', '2', '3', '4', '', '6'],
+    'flag': ['True', 'False', 'True', '', 'False', 'True'],
+    'title': ['a', 'b', 'c', 'a', 'NULL', 'b'],
+    'empty': [''] * 6,
+}
+OLD = {
+    'id': ['1000001', 'D900001', '1000004', '1000002', '1000002', 'RE12345'],
+    'score': ['1', '2', '2', '4.5', '2', ''],
+    'count': ['1', '2', '3', '4', '5', '6'],
+    'flag': ['True', 'True', 'False', 'False', 'True', 'False'],
+    'title': ['a', 'd', 'c', 'b', 'b', 'e'],
+    'empty': [''] * 6,
+}
+
+
+def write_tsv(path, columns):
+    pd.DataFrame(columns).to_csv(path, sep="\t", index=False)
+    return str(path)
+
+
+def write_zip(path, columns):
+    with zipfile.ZipFile(path, 'w') as zfile:
+        zfile.writestr(path.name.replace(".zip", ""), pd.DataFrame(columns).to_csv(sep="\t", index=False))
+    return str(path)
+
+
+def write_gz(path, columns):
+    with gzip.open(path, 'wt') as f:
+        pd.DataFrame(columns).to_csv(f, index=False)
+    return str(path)
+
+
+def write_parquet(path, columns):
+    pd.read_csv(write_tsv(str(path) + ".tsv", columns), sep="\t").to_parquet(path, index=False)
+    return str(path)
+
+
+WRITERS = {'tsv': ('g_table.tsv', write_tsv), 'zip': ('g_table.tsv.zip', write_zip),
+           'gz': ('g_table.csv.gz', write_gz), 'parquet': ('g_table.parquet', write_parquet)}
+
+
+def release_pair(tmp_path, fmt):
+    name, writer = WRITERS[fmt]
+    (tmp_path / "new").mkdir()
+    (tmp_path / "old").mkdir()
+    return writer(tmp_path / "new" / name, NEW), writer(tmp_path / "old" / name, OLD)
+
+
+@pytest.mark.parametrize("fmt", list(WRITERS))
+@pytest.mark.parametrize("backend", ['arrow', 'polars'])
+def test_backends_match_pandas(tmp_path, fmt, backend):
+    new_path, old_path = release_pair(tmp_path, fmt)
+    expected = PandasBackend().compute(new_path, old_path)
+    pd.testing.assert_frame_equal(get_backend(backend).compute(new_path, old_path), expected)
+
+
+# Equal values written differently ('001', '1', '1.0'; 'True', 'true'), and a column that is numeric in one
+# release and text in the other
+SPELLED_NEW = {
+    'id': ['a', 'b', 'c', 'd', 'e', 'a', 'b', 'f'],
+    'number': ['001', '1', '1.0', '2', '2.0', '1', '1.0', '3'],
+    'flag': ['True', 'true', 'FALSE', 'false', 'True', 'True', 'True', ''],
+    'code': ['1', '2', '3', '4', '5', '1', '2', '6'],
+}
+SPELLED_OLD = {
+    'id': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'],
+    'number': ['1', '2', '4', '4.0', '5', '', '01', '2.5'],
+    'flag': ['true', 'True', 'false', '', 'TRUE', 'false', 'true', 'False'],
+    'code': ['1', '2', 'X3', '4', '5', '6', '7', '8'],
+}
+
+
+@pytest.mark.parametrize("fmt", list(WRITERS))
+@pytest.mark.parametrize("backend", [PandasBackend(chunksize=3), ArrowBackend(), PolarsBackend()],
+                         ids=['pandas', 'arrow', 'polars'])
+def test_backends_match_a_full_typed_read(tmp_path, fmt, backend, assert_matches_baseline):
+    name, writer = WRITERS[fmt]
+    (tmp_path / "new").mkdir()
+    (tmp_path / "old").mkdir()
+    new_path = writer(tmp_path / "new" / name, SPELLED_NEW)
+    old_path = writer(tmp_path / "old" / name, SPELLED_OLD)
+    new = pd.read_csv(write_tsv(tmp_path / "new.tsv", SPELLED_NEW), sep="\t")
+    old = pd.read_csv(write_tsv(tmp_path / "old.tsv", SPELLED_OLD), sep="\t")
+    assert_matches_baseline(backend.compute(new_path, old_path), new, old)
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 4])
+def test_pandas_chunks_match_arrow(tmp_path, chunksize):
+    new_path, old_path = release_pair(tmp_path, 'zip')
+    expected = ArrowBackend().compute(new_path, old_path)
+    actual = PandasBackend(chunksize=chunksize).compute(new_path, old_path)
+    pd.testing.assert_frame_equal(actual, expected)
+    ids = actual.set_index('Column').loc['id']
+    assert (ids['New_Num_Unique_Values'], ids['Prior_Num_Unique_Values'], ids['Num_Values_Common']) == (4, 5, 3)
+
+
+def test_dtypes_match_a_typed_pandas_read(tmp_path):
+    new_path, old_path = release_pair(tmp_path, 'tsv')
+    full = pd.read_csv(new_path, sep="\t")
+    for backend in [PandasBackend(chunksize=2), ArrowBackend(), PolarsBackend()]:
+        dtypes = backend.compute(new_path, old_path).set_index('Column')['New_Data_Type']
+        assert {col: dtypes[col] for col in full.columns} == {col: str(full[col].dtype) for col in full.columns}
+
+
+def test_metrics_backend_is_abstract():
+    with pytest.raises(TypeError):
+        MetricsBackend()
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+from column_stats import ReleaseStats, hash_column, infer_kind, merge_kinds
+from dataframe_comparator import DataFrameComparator
+from pv_loader import read_file
+
+MIXED_IDS = ['1000001', '1000002', '1000003', '1000001', 'D900001', '1000002']
+
+
+def write_table(path, columns):
+    pd.DataFrame(columns).to_csv(path, sep="\t", index=False)
+    return str(path)
+
+
+def release_metrics(path, chunksize, output):
+    comparator = DataFrameComparator(read_file(path, chunksize, text=True), read_file(path, chunksize, text=True))
+    return pd.read_csv(comparator.export_metrics(str(output)))
+
+
+def test_same_value_hashes_the_same_whatever_the_chunk_dtype():
+    numbers, _ = hash_column(pd.Series([1000001, 1000002]))
+    floats, _ = hash_column(pd.Series([1000001.0, np.nan]))
+    text, _ = hash_column(pd.Series(['1000001', 'D900001']))
+    assert numbers[0] == floats[0] == text[0]
+
+
+def test_missing_values_hash_the_same():
+    floats, float_missing = hash_column(pd.Series([np.nan, 1.5]))
+    text, text_missing = hash_column(pd.Series([None, 'x']))
+    assert float_missing[0] and text_missing[0]
+    assert floats[0] == text[0]
+
+
+@pytest.mark.parametrize("chunksize", [None, 1, 2, 3, 4])
+def test_chunked_metrics_match_unchunked_on_mixed_columns(tmp_path, chunksize):
+    path = write_table(tmp_path / "g_table.tsv", {
+        'id': MIXED_IDS,
+        'score': ['1', '2', '', '2.5', '1', '3'],
+        'flag': ['True', 'False', 'True', '', 'False', 'True'],
+        'empty': [''] * 6,
+    })
+    expected = release_metrics(path, None, tmp_path / "full.csv")
+    pd.testing.assert_frame_equal(release_metrics(path, chunksize, tmp_path / "chunked.csv"), expected)
+    by_column = expected.set_index('Column')
+    assert by_column.loc['id', 'New_Num_Unique_Values'] == 4
+    assert by_column.loc['id', 'Num_Values_Common'] == 4
+    assert by_column.loc['New Release', 'Num_Duplicated_Rows'] == 0
+
+
+def test_dtypes_match_a_typed_full_read(tmp_path):
+    path = write_table(tmp_path / "g_table.tsv", {
+        'id': MIXED_IDS,
+        'number': ['1', '2', '3', '4', '5', '6'],
+        'score': ['1', '2', '', '2.5', '1', '3'],
+        'flag': ['True', 'False', 'True', 'True', 'False', 'True'],
+        'empty': [''] * 6,
+    })
+    stats = ReleaseStats()
+    for batch in read_file(path, 2, text=True):
+        stats.update(batch)
+    full = pd.read_csv(path, sep="\t")
+    assert {col: stats.dtype(col) for col in stats.columns} == {col: str(full[col].dtype) for col in full.columns}
+
+
+def test_merge_kinds():
+    assert merge_kinds(['null', 'int', 'null']) == 'int'
+    assert merge_kinds(['int', 'float']) == 'float'
+    assert merge_kinds(['int', 'string']) == 'string'
+    assert merge_kinds(['bool', 'int']) == 'string'
+    assert merge_kinds(['null']) == 'null'
+
+
+def test_infer_kind_of_text():
+    assert infer_kind(pd.Series(['1', None, '2'], dtype=object)) == 'int'
+    assert infer_kind(pd.Series(['1', '2.5'], dtype=object)) == 'float'
+    assert infer_kind(pd.Series(['true', 'False'], dtype=object)) == 'bool'
+    assert infer_kind(pd.Series(['1', 'D1'], dtype=object)) == 'string'
+    assert infer_kind(pd.Series([None, None], dtype=object)) == 'null'
+
+
+def test_saved_profile_round_trip(tmp_path):
+    stats = ReleaseStats()
+    stats.update(pd.DataFrame({'id': MIXED_IDS}))
+    stats.save(str(tmp_path / "profile"))
+    loaded = ReleaseStats.load(str(tmp_path / "profile"))
+    assert loaded.dtype('id') == stats.dtype('id')
+    assert loaded.num_unique('id') == 4
+
+
+# Equal values written differently, which a full typed read parses to the same number or boolean
+SPELLED_NEW = {
+    'id': ['a', 'b', 'c', 'd', 'e', 'a', 'b', 'f'],
+    'number': ['001', '1', '1.0', '2', '2.0', '1', '1.0', '3'],
+    'flag': ['True', 'true', 'FALSE', 'false', 'True', 'True', 'True', ''],
+    'code': ['1', '2', '3', '4', '5', '1', '2', '6'],
+}
+SPELLED_OLD = {
+    'id': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'],
+    'number': ['1', '2', '4', '4.0', '5', '', '01', '2.5'],
+    'flag': ['true', 'True', 'false', '', 'TRUE', 'false', 'true', 'False'],
+    'code': ['1', '2', 'X3', '4', '5', '6', '7', '8'],
+}
+
+
+@pytest.mark.parametrize("chunksize", [None, 1, 2, 3, 5])
+def test_metrics_match_a_full_typed_read_of_differently_written_values(tmp_path, chunksize, assert_matches_baseline):
+    new_path = write_table(tmp_path / "new.tsv", SPELLED_NEW)
+    old_path = write_table(tmp_path / "old.tsv", SPELLED_OLD)
+    comparator = DataFrameComparator(read_file(new_path, chunksize, text=True), read_file(old_path, chunksize, text=True))
+    metrics = pd.read_csv(comparator.export_metrics(str(tmp_path / "metrics.csv")))
+    assert_matches_baseline(metrics, pd.read_csv(new_path, sep="\t"), pd.read_csv(old_path, sep="\t"))
+    by_column = metrics.set_index('Column')
+    assert by_column.loc['number', 'New_Num_Unique_Values'] == 3
+    assert by_column.loc['flag', 'New_Num_Unique_Values'] == 2
+    assert by_column.loc['New Release', 'Num_Duplicated_Rows'] == 2
@@ -0,0 +1,321 @@
+import functools
+import json
+import http.server
+import os
+import random
+import threading
+import time
+import zipfile
+import pytest
+import ranged_download
+from PatentsViewDownloader import PatentsViewDownloader
+from release_manifest import ReleaseManifest
+
+TABLES = ['g_patent', 'g_claims', 'g_inventor_disambiguated', 'pg_published_application', 'pg_claims', 'g_cpc_current']
+
+
+class ZipHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the release directory, recording when each zip download starts and how many run at once
+
+    Zips are served with an ETag and byte ranges, honouring If-Range like a real server. A number of
+    zip downloads can be made to drop the connection after drop_after bytes, or to send a damaged member.
+    """
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    starts = []
+    requests = []
+    delay = 0.0
+    version = 1
+    drops = 0
+    drop_after = 0
+    corrupt = 0
+
+    def do_HEAD(self):
+        if not self.path.endswith(".zip"):
+            return super().do_HEAD()
+        return self._send_zip(body=False)
+
+    def do_GET(self):
+        if not self.path.endswith(".zip"):
+            return super().do_GET()
+        cls = type(self)
+        with cls.lock:
+            cls.starts.append(time.monotonic())
+        return self._send_zip(body=True)
+
+    def _send_zip(self, body):
+        cls = type(self)
+        with cls.lock:
+            cls.requests.append((self.command, os.path.basename(self.path), self.headers.get('Range'),
+                                 self.headers.get('If-Range')))
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(cls.delay)
+            path = self.translate_path(self.path)
+            if not os.path.exists(path):
+                return self.send_error(404)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with cls.lock:
+                damage = body and cls.corrupt > 0
+                cls.corrupt -= damage
+            if damage:
+                # Flip a byte of the first member's data, past its local header
+                data = data[:60] + bytes([data[60] ^ 0xFF]) + data[61:]
+            etag = f'"{len(data)}-{cls.version}"'
+            start, end, status = 0, len(data) - 1, 200
+            requested = self.headers.get('Range')
+            if requested and self.headers.get('If-Range', etag) == etag:
+                first, last = requested.split("=")[1].split("-")
+                start, end, status = int(first), int(last) if last else len(data) - 1, 206
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+            self.send_response(status)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            self.end_headers()
+            if not body:
+                return
+            with cls.lock:
+                drop = cls.drops > 0
+                cls.drops -= drop
+            if drop:
+                # Send part of the body and close the connection, like a dropped transfer
+                self.wfile.write(data[start:end + 1][:cls.drop_after])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(data[start:end + 1])
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, format, *args):
+        return
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "site"
+    root.mkdir()
+    links = []
+    for i, table in enumerate(TABLES):
+        with zipfile.ZipFile(root / f"{table}.tsv.zip", 'w', zipfile.ZIP_DEFLATED) as zfile:
+            zfile.writestr(f"{table}.tsv", "id\tvalue\n" + "".join(f"{n}\t{table}\n" for n in range(200 * (i + 1))))
+        links.append(f'<a href="{table}.tsv.zip">{table}</a>')
+    (root / "index.html").write_text("<html><body>" + "".join(links) + "</body></html>")
+    ZipHandler.active = ZipHandler.max_active = 0
+    ZipHandler.starts = []
+    ZipHandler.requests = []
+    ZipHandler.delay = 0.0
+    ZipHandler.version = 1
+    ZipHandler.drops = 0
+    ZipHandler.corrupt = 0
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(ZipHandler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/index.html", root
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def downloader(url, path):
+    return PatentsViewDownloader(url, download_dir=str(path), link_cache=None)
+
+
+def test_concurrent_download_matches_sequential(server, tmp_path):
+    url, root = server
+    sequential = downloader(url, tmp_path / "sequential").download_all(delay=0, max_workers=1)
+    concurrent = downloader(url, tmp_path / "concurrent").download_all(delay=0, max_workers=4, per_host_limit=4)
+    assert len(sequential) == len(TABLES)
+    assert [os.path.basename(path) for path in concurrent] == [os.path.basename(path) for path in sequential]
+    for path in concurrent:
+        with open(path, 'rb') as f, open(root / os.path.basename(path), 'rb') as served:
+            assert f.read() == served.read()
+
+
+def large_zip(url, root, size=600_000):
+    """
+    Add a zip larger than a network read to the site, so a dropped transfer leaves bytes to resume from
+    """
+    with zipfile.ZipFile(root / "g_large.tsv.zip", 'w', zipfile.ZIP_STORED) as zfile:
+        zfile.writestr("g_large.tsv", random.Random(0).randbytes(size))
+    return url.replace("index.html", "g_large.tsv.zip"), (root / "g_large.tsv.zip").read_bytes()
+
+
+def zip_urls(url):
+    return [url.replace("index.html", f"{table}.tsv.zip") for table in TABLES]
+
+
+def test_per_host_limit_is_respected(server, tmp_path):
+    url, root = server
+    ZipHandler.delay = 0.3
+    paths = downloader(url, tmp_path / "release").download_urls(zip_urls(url), delay=0, max_workers=6,
+                                                                per_host_limit=2)
+    assert all(paths)
+    # HEAD probes and downloads both count
+    assert ZipHandler.max_active == 2
+
+
+def test_segments_share_the_per_host_limit(server, tmp_path):
+    url, root = server
+    ZipHandler.delay = 0.1
+    release = PatentsViewDownloader(url, download_dir=str(tmp_path / "release"), link_cache=None,
+                                    segments=4, min_segment_size=1)
+    paths = release.download_urls(zip_urls(url)[:2], delay=0, max_workers=2, per_host_limit=2)
+    assert all(paths)
+    assert ZipHandler.max_active == 2
+    assert any(method == 'GET' and requested for method, name, requested, validator in ZipHandler.requests)
+    for path in paths:
+        assert open(path, 'rb').read() == (root / os.path.basename(path)).read_bytes()
+
+
+def test_token_bucket_paces_download_starts(server, tmp_path):
+    url, root = server
+    rate = 5.0
+    paths = downloader(url, tmp_path / "release").download_all(max_workers=6, per_host_limit=6, rate=rate, burst=1)
+    assert len(paths) == len(TABLES)
+    starts = sorted(ZipHandler.starts)
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    # Tokens are taken before the HEAD probe, so the request latency only adds a little jitter
+    assert min(gaps) > 0.75 / rate
+    assert starts[-1] - starts[0] >= (len(TABLES) - 1) / rate * 0.9
+
+
+def test_dropped_connection_resumes_the_part_file(server, tmp_path):
+    url, root = server
+    file_url, served = large_zip(url, root)
+    ZipHandler.drops, ZipHandler.drop_after = 1, 200_000
+    path = downloader(url, tmp_path / "release").download_file(file_url)
+    assert open(path, 'rb').read() == served
+    gets = [(requested, validator) for method, name, requested, validator in ZipHandler.requests if method == 'GET']
+    assert len(gets) == 2 and gets[0] == (None, None)
+    # Only the chunks received in full before the drop are kept
+    resumed_from = int(gets[1][0].split("=")[1].rstrip("-"))
+    assert resumed_from == 200_000 // ranged_download.READ_CHUNK_SIZE * ranged_download.READ_CHUNK_SIZE
+    assert gets[1][1] == f'"{len(served)}-1"'
+    assert not os.path.exists(path + ".part") and not os.path.exists(path + ".part.validator")
+
+
+def test_segment_sidecar_resumes_each_segment(server, tmp_path):
+    url, root = server
+    file_url, served = large_zip(url, root)
+    ZipHandler.drops, ZipHandler.drop_after = 4, 100_000
+    release = PatentsViewDownloader(url, download_dir=str(tmp_path / "release"), link_cache=None,
+                                    segments=4, min_segment_size=1, max_retries=0)
+    assert release.download_file(file_url) is None
+    part_path = str(tmp_path / "release" / "g_large.tsv.zip.part")
+    with open(part_path + ".segments.json") as f:
+        state = json.load(f)
+    assert state['validator'] == f'"{len(served)}-1"'
+    assert [done for start, end, done in state['ranges']] == [ranged_download.READ_CHUNK_SIZE] * 4
+    ZipHandler.requests = []
+    path = release.download_file(file_url)
+    assert open(path, 'rb').read() == served
+    resumed = sorted(requested for method, name, requested, validator in ZipHandler.requests if method == 'GET')
+    assert resumed == sorted(f"bytes={start + done}-{end}" for start, end, done in state['ranges'])
+    assert not os.path.exists(part_path + ".segments.json")
+
+
+def test_part_file_of_another_version_is_downloaded_again(server, tmp_path):
+    url, root = server
+    release_dir = tmp_path / "release"
+    release_dir.mkdir()
+    part_path = release_dir / "g_patent.tsv.zip.part"
+    part_path.write_bytes(b"bytes of the previous version")
+    (release_dir / "g_patent.tsv.zip.part.validator").write_text('"old-version"')
+    path = downloader(url, release_dir).download_file(zip_urls(url)[0])
+    assert open(path, 'rb').read() == (root / "g_patent.tsv.zip").read_bytes()
+    assert [requested for method, name, requested, validator in ZipHandler.requests if method == 'GET'] == [None]
+
+
+def test_if_range_restarts_a_file_that_changed_since_the_probe(server, tmp_path):
+    url, root = server
+    release_dir = tmp_path / "release"
+    release_dir.mkdir()
+    served = (root / "g_patent.tsv.zip").read_bytes()
+    (release_dir / "g_patent.tsv.zip.part").write_bytes(served[:500])
+    (release_dir / "g_patent.tsv.zip.part.validator").write_text(f'"{len(served)}-1"')
+    release = downloader(url, release_dir)
+    # The server replaces the file between the HEAD probe and the GET
+    probe = ranged_download.probe
+
+    def probe_then_change(*args, **kwargs):
+        result = probe(*args, **kwargs)
+        ZipHandler.version = 2
+        return result
+
+    ranged_download.probe = probe_then_change
+    try:
+        path = release.download_file(zip_urls(url)[0])
+    finally:
+        ranged_download.probe = probe
+    assert open(path, 'rb').read() == served
+    gets = [(requested, validator) for method, name, requested, validator in ZipHandler.requests if method == 'GET']
+    assert gets == [('bytes=500-', f'"{len(served)}-1"')]
+    assert (release_dir / "g_patent.tsv.zip").stat().st_size == len(served)
+
+
+def zip_gets():
+    return [name for method, name, requested, validator in ZipHandler.requests if method == 'GET']
+
+
+def test_rerun_skips_files_the_manifest_records_as_unchanged(server, tmp_path):
+    url, root = server
+    first = downloader(url, tmp_path / "release").download_urls(zip_urls(url), delay=0)
+    assert len(zip_gets()) == len(TABLES)
+    ZipHandler.requests = []
+    assert downloader(url, tmp_path / "release").download_urls(zip_urls(url), delay=0) == first
+    assert zip_gets() == []
+    # A new ETag on the server means the file changed
+    ZipHandler.version = 2
+    downloader(url, tmp_path / "release").download_urls(zip_urls(url), delay=0)
+    assert len(zip_gets()) == len(TABLES)
+
+
+def test_unchanged_files_are_linked_from_the_previous_release(server, tmp_path):
+    url, root = server
+    previous = downloader(url, tmp_path / "previous").download_urls(zip_urls(url), delay=0)
+    ZipHandler.requests = []
+    current = PatentsViewDownloader(url, download_dir=str(tmp_path / "current"), link_cache=None,
+                                    previous_dir=str(tmp_path / "previous"))
+    paths = current.download_urls(zip_urls(url), delay=0)
+    assert zip_gets() == []
+    for old, new in zip(previous, paths):
+        assert os.path.dirname(new) == str(tmp_path / "current")
+        assert os.path.samefile(old, new)
+    recorded = ReleaseManifest(str(tmp_path / "previous")).get("g_patent.tsv.zip")
+    assert current.manifest.get("g_patent.tsv.zip")['sha256'] == recorded['sha256']
+
+
+def test_file_with_a_bad_crc_is_downloaded_again(server, tmp_path):
+    url, root = server
+    ZipHandler.corrupt = 1
+    path = downloader(url, tmp_path / "release").download_file(zip_urls(url)[0])
+    assert open(path, 'rb').read() == (root / "g_patent.tsv.zip").read_bytes()
+    assert zip_gets() == ["g_patent.tsv.zip"] * 2
+
+
+def test_verify_release_refetches_corrupt_files(server, tmp_path):
+    url, root = server
+    release = downloader(url, tmp_path / "release")
+    paths = release.download_urls(zip_urls(url), delay=0)
+    data = bytearray(open(paths[1], 'rb').read())
+    data[60] ^= 0xFF
+    with open(paths[1], 'wb') as f:
+        f.write(data)
+    ZipHandler.requests = []
+    assert release.verify_release() == [os.path.basename(paths[1])]
+    assert zip_gets() == [os.path.basename(paths[1])]
+    assert open(paths[1], 'rb').read() == (root / os.path.basename(paths[1])).read_bytes()
+    # Verified files are not read again
+    assert release.verify_release() == []
@@ -0,0 +1,114 @@
+import http.server
+import threading
+import pytest
+from link_discovery import LinkDiscovery, prioritize, table_family, table_name
+from release_manifest import ReleaseManifest
+from table_names import table_family as compare_table_family, table_name as compare_table_name
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves download pages, answering If-None-Match with 304 for pages that have an ETag, and HEAD
+    requests for the linked zips
+    """
+    pages = {}
+    sizes = {}
+    requests = []
+
+    def do_GET(self):
+        html, etag = type(self).pages[self.path]
+        type(self).requests.append(('GET', self.path, self.headers.get('If-None-Match')))
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = html.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        type(self).requests.append(('HEAD', self.path, None))
+        self.send_response(200)
+        self.send_header('Content-Length', str(type(self).sizes[self.path.lstrip("/")]))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{self.path}"')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        return
+
+
+def page(*files):
+    links = "".join(f'<a href="/{file}">{file}</a>' for file in files)
+    return f'<html><body>{links}<a href="/faq">FAQ</a></body></html>'
+
+
+@pytest.fixture
+def site():
+    # The grants page has an ETag; the pgpub page has none, so only its content hash tells it did not change
+    PageHandler.pages = {'/grants': (page("g_patent.tsv.zip", "g_claims.tsv.zip"), '"grants-1"'),
+                         '/pgpubs': (page("pg_claims.tsv.zip"), None)}
+    PageHandler.sizes = {'g_patent.tsv.zip': 300, 'g_claims.tsv.zip': 900, 'pg_claims.tsv.zip': 500,
+                         'pg_published_application.tsv.zip': 100}
+    PageHandler.requests = []
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def discover(site, cache_path):
+    return LinkDiscovery([site + "/grants", site + "/pgpubs"], str(cache_path)).discover()
+
+
+def heads():
+    return sorted(path for method, path, etag in PageHandler.requests if method == 'HEAD')
+
+
+def test_links_are_described_by_their_head_metadata(site, tmp_path):
+    links = discover(site, tmp_path / "links.json")
+    assert [(link['table'], link['family'], link['size']) for link in links] == [
+        ('g_patent', 'grant', 300), ('g_claims', 'grant', 900), ('pg_claims', 'pgpub', 500)]
+    assert links[0]['etag'] == '"/g_patent.tsv.zip"' and links[0]['accepts_ranges']
+    assert len(heads()) == 3
+
+
+def test_unchanged_pages_reuse_their_cached_links(site, tmp_path):
+    first = discover(site, tmp_path / "links.json")
+    PageHandler.requests = []
+    assert discover(site, tmp_path / "links.json") == first
+    # 304 for the page with an ETag, same content hash for the other, and no HEAD requests
+    assert ('GET', '/grants', '"grants-1"') in PageHandler.requests
+    assert heads() == []
+
+
+def test_changed_page_probes_its_links_again(site, tmp_path):
+    discover(site, tmp_path / "links.json")
+    PageHandler.pages['/pgpubs'] = (page("pg_claims.tsv.zip", "pg_published_application.tsv.zip"), None)
+    PageHandler.requests = []
+    links = discover(site, tmp_path / "links.json")
+    assert [link['table'] for link in links][-1] == 'pg_published_application'
+    assert heads() == ['/pg_claims.tsv.zip', '/pg_published_application.tsv.zip']
+
+
+def test_prioritize_puts_large_changed_files_first(tmp_path):
+    links = [{'file': file, 'size': size, 'etag': f'"{file}"', 'last_modified': None}
+             for file, size in [('a.tsv.zip', 100), ('b.tsv.zip', 0), ('c.tsv.zip', 900), ('d.tsv.zip', 500)]]
+    manifest = ReleaseManifest(str(tmp_path))
+    (tmp_path / "c.tsv.zip").write_bytes(b"x" * 900)
+    manifest.update('c.tsv.zip', size=900, etag='"c.tsv.zip"')
+    ordered = prioritize(links, [manifest, None])
+    # Largest first, then unknown sizes, then the file the manifest records as unchanged
+    assert [link['file'] for link in ordered] == ['d.tsv.zip', 'a.tsv.zip', 'b.tsv.zip', 'c.tsv.zip']
+
+
+def test_table_naming_matches_the_comparison_modules():
+    for path in ["/x/g_patent.tsv.zip", "pg_claims.tsv.zip", "other.csv.gz"]:
+        assert table_name(path) == compare_table_name(path)
+        assert table_family(table_name(path)) == compare_table_family(compare_table_name(path))
@@ -0,0 +1,24 @@
+import glob
+import os
+import pandas as pd
+from name_normalizer import NameNormalizer
+
+
+def test_cache_keeps_only_new_names_per_part(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    normalizer = NameNormalizer(cache_dir=cache_dir)
+    first = normalizer.normalize(pd.Series(["Acme, Inc.", "Widgets Co", None, "Acme, Inc."]))
+    second = normalizer.normalize(pd.Series(["Widgets Co", "Société Générale"]))
+    assert first.tolist() == ["ACME INC", "WIDGETS CO", None, "ACME INC"]
+    assert second.tolist() == ["WIDGETS CO", "SOCIÉTÉ GÉNÉRALE"]
+    parts = glob.glob(os.path.join(normalizer._cache_path(), "part-*.parquet"))
+    assert sorted(sorted(pd.read_parquet(part)['name']) for part in parts) == [["Acme, Inc.", "Widgets Co"],
+                                                                                ["Société Générale"]]
+
+
+def test_cache_is_reused_by_the_next_run(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    NameNormalizer(cache_dir=cache_dir).normalize(pd.Series(["Acme, Inc."]))
+    rerun = NameNormalizer(cache_dir=cache_dir)
+    rerun.apply_rules = None  # every name must come from the cache
+    assert rerun.normalize(pd.Series(["Acme, Inc."]), categorical=True).astype(object).tolist() == ["ACME INC"]
@@ -0,0 +1,90 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from mock_api import MockPatentsViewAPI
+from patentsview_api import PatentsViewAPI, retry_after_seconds
+
+QUERY = {"_gte": {"patent_date": "1900-01-01"}}
+FIELDS = ["patent_id", "patent_date", "num_claims"]
+
+
+@pytest.fixture
+def mock_api():
+    apis = []
+
+    def start(patents=250, **kwargs):
+        api = MockPatentsViewAPI(patents, **kwargs)
+        apis.append(api)
+        return api, api.start()
+
+    yield start
+    for api in apis:
+        api.stop()
+
+
+@pytest.mark.parametrize("pagination", ['cursor', 'page'])
+@pytest.mark.parametrize("patents", [250, 200])
+def test_pagination_returns_every_record_once(mock_api, pagination, patents):
+    api, url = mock_api(patents)
+    client = PatentsViewAPI(url, page_size=100, pagination=pagination)
+    df = client.run(client.query_frame(QUERY, fields=FIELDS))
+    expected = sorted(record['patent_id'] for record in api.records)
+    assert df['patent_id'].tolist() == expected
+    # Three pages of 100 and a final short page for 250 records
+    pages = -(-patents // 100) + (1 if pagination == 'cursor' and patents % 100 == 0 else 0)
+    assert api.requests == pages
+
+
+def test_rate_limits_and_server_errors_are_retried(mock_api):
+    api, url = mock_api(fail_every=2, retry_after="0.5")
+    client = PatentsViewAPI(url, page_size=100, backoff=0.0)
+    start = time.monotonic()
+    df = client.run(client.query_frame(QUERY, fields=FIELDS))
+    elapsed = time.monotonic() - start
+    assert len(df) == 250
+    # Request 2 is answered 429 with a fractional Retry-After and request 4 with 503
+    assert api.requests == 5
+    assert elapsed >= 0.5
+
+
+def test_retry_after_http_date():
+    now = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert retry_after_seconds(format_datetime(now + timedelta(seconds=30), usegmt=True), now) == 30
+    assert retry_after_seconds("Wed, 01 May 2024 11:00:00 GMT", now) == 0
+    assert retry_after_seconds("1.5") == 1.5
+    assert retry_after_seconds("120") == 120
+    assert retry_after_seconds("soon") is None
+    assert retry_after_seconds(None) is None
+
+
+def test_second_run_is_served_from_the_cache(mock_api, tmp_path):
+    api, url = mock_api()
+    client = PatentsViewAPI(url, page_size=100, cache_dir=str(tmp_path / "cache"))
+    first = client.run(client.query_frame(QUERY, fields=FIELDS))
+    requests = api.requests
+    rerun = PatentsViewAPI(url, page_size=100, cache_dir=str(tmp_path / "cache"))
+    second = rerun.run(rerun.query_frame(QUERY, fields=FIELDS))
+    assert requests == 3 and api.requests == requests
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_query_to_parquet_with_nulls_on_later_pages(mock_api, tmp_path):
+    api, url = mock_api()
+    api.records = [{'patent_id': f"{10000000 + n}", 'patent_date': "2024-01-02",
+                    # Filled on the first page only
+                    'num_claims': n if n < 100 else None,
+                    # Null throughout the first page, filled later
+                    'withdrawn': None if n < 100 else n % 2} for n in range(250)]
+    client = PatentsViewAPI(url, page_size=100)
+    path = str(tmp_path / "patents.parquet")
+    fields = FIELDS + ['withdrawn']
+    assert client.run(client.query_to_parquet(path, QUERY, fields=fields)) == 250
+    table = pq.read_table(path)
+    assert str(table.schema.field('num_claims').type) == 'int64'
+    assert str(table.schema.field('withdrawn').type) == 'string'
+    df = table.to_pandas()
+    assert df['num_claims'].isna().sum() == 150
+    assert table.column('withdrawn').to_pylist() == [None] * 100 + [str(n % 2) for n in range(100, 250)]
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+import pandas as pd
+from column_stats import ReleaseStats
+from profile_cache import ProfileCache
+
+
+def hash_files(cache_dir, paths):
+    cache = ProfileCache(cache_dir)
+    return [cache.file_hash(path) for path in paths]
+
+
+def write_tables(path, count):
+    os.makedirs(path)
+    paths = []
+    for n in range(count):
+        paths.append(os.path.join(path, f"g_table_{n}.tsv"))
+        pd.DataFrame({'id': [str(i) for i in range(n + 1)]}).to_csv(paths[-1], sep="\t", index=False)
+    return paths
+
+
+def test_hashes_from_concurrent_processes_are_all_kept(tmp_path):
+    cache_dir = str(tmp_path / "profiles")
+    paths = write_tables(tmp_path / "release", 8)
+    context = multiprocessing.get_context('spawn')
+    # One process per table, as compare_releases runs them, all sharing the cache
+    with context.Pool(4) as pool:
+        hashes = pool.starmap(hash_files, [(cache_dir, [path]) for path in paths])
+    cache = ProfileCache(cache_dir)
+    assert len(os.listdir(cache._hashes_dir)) == len(paths)
+    for path, [digest] in zip(paths, hashes):
+        with open(cache._hash_entry(path)) as f:
+            assert digest in f.read()
+        assert cache.file_hash(path) == digest
+
+
+def test_changed_file_is_hashed_again(tmp_path):
+    cache = ProfileCache(str(tmp_path / "profiles"))
+    [path] = write_tables(tmp_path / "release", 1)
+    first = cache.file_hash(path)
+    with open(path, 'a') as f:
+        f.write("x\n")
+    assert cache.file_hash(path) != first
+
+
+def test_profile_round_trip(tmp_path):
+    cache = ProfileCache(str(tmp_path / "profiles"))
+    [path] = write_tables(tmp_path / "release", 1)
+    stats = ReleaseStats()
+    stats.update(pd.read_csv(path, sep="\t", dtype=str))
+    cache.put(path, stats)
+    assert cache.get(path).num_records == 1
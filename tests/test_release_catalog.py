@@ -0,0 +1,28 @@
+import os
+import pandas as pd
+from release_catalog import ReleaseCatalog
+
+
+def write_release(path):
+    os.makedirs(path)
+    pd.DataFrame({'patent_id': ['1', '2']}).to_csv(os.path.join(path, "g_patent.tsv.zip"), sep="\t", index=False)
+    pd.DataFrame({'document_number': ['3']}).to_csv(os.path.join(path, "pg_published_application.tsv.zip"),
+                                                     sep="\t", index=False)
+    return str(path)
+
+
+def test_index_is_kept_outside_the_release_by_default(tmp_path, home):
+    release = write_release(tmp_path / "release")
+    catalog = ReleaseCatalog(release)
+    assert catalog.counts() == {'total': 2, 'pgpub': 1, 'grant': 1}
+    assert sorted(os.listdir(release)) == ["g_patent.tsv.zip", "pg_published_application.tsv.zip"]
+    assert os.path.dirname(catalog.index_path) == str(home / ".cache" / "pv_catalog")
+    assert ReleaseCatalog(release).index_path == catalog.index_path
+
+
+def test_index_in_the_release_directory_is_opt_in(tmp_path):
+    release = write_release(tmp_path / "release")
+    catalog = ReleaseCatalog(release, in_directory=True)
+    assert catalog.row_count("g_patent") == 2
+    assert catalog.index_path == os.path.join(release, ".catalog.sqlite")
+    assert os.path.exists(catalog.index_path)
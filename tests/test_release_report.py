@@ -0,0 +1,69 @@
+import zipfile
+import pandas as pd
+import pytest
+from compare_driver import compare_releases
+from release_report import REPORT_FILE, check_release, evaluate
+
+NEW = {
+    'g_patent': {'patent_id': ['1', '2', '3'], 'type': ['utility', 'design', 'utility']},
+    'g_claims': {'patent_id': ['1', '2', '3', '4'], 'claim_number': ['1', '2', 'A3', '4']},
+    'pg_claims': {'document_number': ['1', '2', '3', '4'], 'text': ['a', '', '', '']},
+    'g_cpc_current': {'patent_id': ['1', '2', '3'], 'cpc_section': ['A', 'B', 'C']},
+    'g_other_reference': {'patent_id': ['1'], 'reference': ['x']},
+}
+OLD = {
+    'g_patent': {'patent_id': ['1', '2', '3', '4'], 'type': ['utility', 'design', 'utility', 'plant']},
+    'g_claims': {'patent_id': ['1', '2', '3', '4'], 'claim_number': ['1', '2', '3', '4']},
+    'pg_claims': {'document_number': ['1', '2', '3', '4'], 'text': ['a', 'b', 'c', 'd']},
+    'g_cpc_current': {'patent_id': ['1', '2', '3'], 'cpc_section': ['A', 'B', 'C']},
+}
+
+
+def write_release(path, tables):
+    path.mkdir()
+    for table, columns in tables.items():
+        with zipfile.ZipFile(path / f"{table}.tsv.zip", 'w') as zfile:
+            zfile.writestr(f"{table}.tsv", pd.DataFrame(columns).to_csv(sep="\t", index=False))
+    return str(path)
+
+
+@pytest.fixture
+def compared(tmp_path):
+    new_dir = write_release(tmp_path / "new", NEW)
+    old_dir = write_release(tmp_path / "old", OLD)
+    output_dir = str(tmp_path / "output")
+    compare_releases(new_dir, old_dir, output_dir, max_workers=2)
+    return output_dir
+
+
+def alert_set(alerts):
+    return set(alerts[['Table', 'Column', 'Rule', 'Severity']].itertuples(index=False, name=None))
+
+
+def test_rules_flag_the_changed_tables(compared):
+    report = pd.read_parquet(f"{compared}/{REPORT_FILE}")
+    alerts = alert_set(evaluate(report))
+    # Table-level rules alert once per table, without a column
+    assert ('g_patent', '', 'row_count_drop', 'fail') in alerts
+    assert ('g_claims', 'claim_number', 'dtype_changed', 'fail') in alerts
+    assert ('pg_claims', 'text', 'null_rate_jump', 'warn') in alerts
+    assert ('pg_claims', 'text', 'low_overlap', 'warn') in alerts
+    assert not {alert for alert in alerts if alert[0] == 'g_cpc_current'}
+    assert len([alert for alert in alerts if alert[2] == 'row_count_drop']) == 1
+
+
+def test_thresholds_are_applied(compared):
+    report = pd.read_parquet(f"{compared}/{REPORT_FILE}")
+    alerts = alert_set(evaluate(report, thresholds={'max_row_drop': 0.5, 'max_null_rate_jump': 0.9}))
+    assert not {alert for alert in alerts if alert[2] in ('row_count_drop', 'null_rate_jump')}
+
+
+def test_check_release_reports_one_status_per_table(compared):
+    passed, status, alerts = check_release(compared)
+    assert not passed
+    assert dict(zip(status['Table'], status['Status'])) == {
+        'g_patent': 'fail', 'g_claims': 'fail', 'pg_claims': 'warn', 'g_cpc_current': 'pass',
+        'g_other_reference': 'warn'}
+    warnings = status.set_index('Table')['Warnings']
+    assert warnings['g_other_reference'] == 'not in prior release'
+    assert warnings['pg_claims'] == 'null_rate_jump, unique_drop, low_overlap'
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from pv_loader import read_file
+from row_diff import RowDiff
+
+
+def write_table(path, columns):
+    pd.DataFrame(columns).to_csv(path, sep="\t", index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunksize", [None, 1, 2, 3])
+def test_reordered_mixed_type_keys_match(tmp_path, chunksize):
+    new = write_table(tmp_path / "new.tsv", {'patent_id': ['1000001', '1000002', '1000003', 'D900001'],
+                                             'title': ['a', 'b', 'c', 'd']})
+    old = write_table(tmp_path / "old.tsv", {'patent_id': ['1000001', 'D900001', '1000002', '1000003'],
+                                             'title': ['a', 'd', 'b', 'changed']})
+    diff = RowDiff(read_file(new, chunksize, text=True), read_file(old, chunksize, text=True), ['patent_id'],
+                   partitions=4)
+    counts = diff.export_diff(str(tmp_path / "diff"))
+    assert (counts['added'], counts['removed'], counts['changed']) == (0, 0, 1)
+    changed = pd.read_csv(tmp_path / "diff" / "changed.csv", dtype=str)
+    assert changed.to_dict('records') == [{'patent_id': '1000003', 'changed_columns': 'title'}]
+
+
+def test_keys_of_typed_and_text_chunks_match(tmp_path):
+    new = pd.DataFrame({'patent_id': [1000001, 1000002], 'title': ['a', 'b']})
+    old = pd.DataFrame({'patent_id': ['1000001', 'D900001'], 'title': ['a', 'd']})
+    counts = RowDiff(new, old, ['patent_id'], partitions=2).export_diff(str(tmp_path / "diff"))
+    assert (counts['added'], counts['removed'], counts['changed']) == (1, 1, 0)
+    added = pd.read_csv(tmp_path / "diff" / "added.csv", dtype=str)
+    assert added['patent_id'].tolist() == ['1000002']
+
+
+def test_reused_work_dir_drops_old_partitions(tmp_path):
+    work_dir = str(tmp_path / "work")
+    first = pd.DataFrame({'patent_id': [str(i) for i in range(10)], 'title': ['x'] * 10})
+    RowDiff([first.iloc[:5], first.iloc[5:]], first, ['patent_id'], partitions=2,
+            work_dir=work_dir).export_diff(str(tmp_path / "first"))
+    second = pd.DataFrame({'patent_id': ['1', '2'], 'title': ['x', 'x']})
+    diff = RowDiff(second, second, ['patent_id'], partitions=2, work_dir=work_dir)
+    counts = diff.export_diff(str(tmp_path / "second"))
+    assert counts == {'added': 0, 'removed': 0, 'changed': 0, 'new_duplicate_keys': 0, 'prior_duplicate_keys': 0}
@@ -0,0 +1,97 @@
+import functools
+import hashlib
+import http.server
+import os
+import threading
+import pytest
+import requests
+from storage import MIN_PART_SIZE, S3Storage
+
+boto3 = pytest.importorskip("boto3")
+moto_server = pytest.importorskip("moto.server")
+
+BUCKET = "pv-releases"
+# Three parts: two full ones and a short tail
+BODY = os.urandom(2 * MIN_PART_SIZE + 123457)
+
+
+class FileHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the release directory. With drop set, zip downloads are cut off halfway through
+    """
+    drop = False
+
+    def do_GET(self):
+        if not type(self).drop:
+            return super().do_GET()
+        size = os.path.getsize(self.translate_path(self.path))
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        with open(self.translate_path(self.path), 'rb') as f:
+            self.wfile.write(f.read(size // 2))
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        return
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for key, value in {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                       'AWS_DEFAULT_REGION': 'us-east-1'}.items():
+        monkeypatch.setenv(key, value)
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    client = boto3.client('s3', endpoint_url=f"http://{host}:{port}")
+    client.create_bucket(Bucket=BUCKET)
+    yield client
+    # The moto backend is shared by every server in the process
+    requests.post(f"http://{host}:{port}/moto-api/reset")
+    server.stop()
+
+
+@pytest.fixture
+def site(tmp_path):
+    root = tmp_path / "site"
+    root.mkdir()
+    (root / "g_patent.tsv.zip").write_bytes(BODY)
+    FileHandler.drop = False
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(FileHandler, directory=str(root)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/g_patent.tsv.zip"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_multipart_body_is_stored_intact(s3):
+    storage = S3Storage(BUCKET, "11_2024", part_size=MIN_PART_SIZE, client=s3)
+    upload = storage.open_upload("g_patent.tsv.zip")
+    for start in range(0, len(BODY), 65536):
+        upload.write(BODY[start:start + 65536])
+    assert upload.complete() == len(BODY)
+    assert len(upload.parts) == 3
+    assert upload.digest.hexdigest() == hashlib.sha256(BODY).hexdigest()
+    assert s3.get_object(Bucket=BUCKET, Key="11_2024/g_patent.tsv.zip")['Body'].read() == BODY
+    assert storage.size("g_patent.tsv.zip") == len(BODY)
+
+
+def test_download_streams_into_s3(s3, site, tmp_path):
+    from PatentsViewDownloader import PatentsViewDownloader
+    storage = S3Storage(BUCKET, "11_2024", part_size=MIN_PART_SIZE, client=s3)
+    downloader = PatentsViewDownloader(site, download_dir=str(tmp_path / "release"), storage=storage, link_cache=None)
+    assert downloader.download_file(site) == f"s3://{BUCKET}/11_2024/g_patent.tsv.zip"
+    assert s3.get_object(Bucket=BUCKET, Key="11_2024/g_patent.tsv.zip")['Body'].read() == BODY
+    assert downloader.manifest.get("g_patent.tsv.zip")['sha256'] == hashlib.sha256(BODY).hexdigest()
+
+
+def test_failed_transfer_aborts_the_upload(s3, site, tmp_path):
+    from PatentsViewDownloader import PatentsViewDownloader
+    FileHandler.drop = True
+    storage = S3Storage(BUCKET, "11_2024", part_size=MIN_PART_SIZE, client=s3)
+    downloader = PatentsViewDownloader(site, download_dir=str(tmp_path / "release"), storage=storage,
+                                       max_retries=1, link_cache=None)
+    assert downloader.download_file(site) is None
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+    assert storage.size("g_patent.tsv.zip") is None
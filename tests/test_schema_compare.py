@@ -0,0 +1,42 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from test_agg_compare import Agg_Compare
+
+TABLE = pd.DataFrame({'patent_id': ['1000001', '1000002'], 'num_claims': [3, 4], 'title': ['a', 'b']})
+
+
+def write_release(path, parquet_copy=False):
+    os.makedirs(path)
+    TABLE.to_csv(os.path.join(path, "g_patent.tsv.zip"), sep="\t", index=False)
+    if parquet_copy:
+        # Like the downloader's conversion stage, which stores ids with their registry type
+        os.makedirs(os.path.join(path, "parquet"))
+        schema = pa.schema([('patent_id', pa.string()), ('num_claims', pa.int64()), ('title', pa.string())])
+        pq.write_table(pa.Table.from_pandas(TABLE, schema=schema, preserve_index=False),
+                       os.path.join(path, "parquet", "g_patent.parquet"))
+    return str(path)
+
+
+def test_parquet_copy_in_one_release_is_not_a_schema_change(tmp_path, capsys):
+    compare = Agg_Compare(write_release(tmp_path / "new", parquet_copy=True), write_release(tmp_path / "old"))
+    new_file = os.path.join(compare.new_dir, "g_patent.tsv.zip")
+    assert compare.schema_sources(new_file) == ['parquet', 'read']
+    compare.compare_data_types()
+    assert "All tables have the same columns and data types" in capsys.readouterr().out
+
+
+def test_parquet_copies_in_both_releases_are_compared(tmp_path, capsys):
+    compare = Agg_Compare(write_release(tmp_path / "new", parquet_copy=True),
+                          write_release(tmp_path / "old", parquet_copy=True))
+    assert compare.read_schema(os.path.join(compare.old_dir, "g_patent.tsv.zip"))[1][0] == 'string'
+    compare.compare_data_types()
+    assert "All tables have the same columns and data types" in capsys.readouterr().out
+
+
+def test_arrow_and_pandas_type_names_have_the_same_kinds():
+    pairs = [('int64', 'int64'), ('float64', 'double'), ('str', 'large_string'), ('object', 'string'),
+             ('bool', 'bool'), ('datetime64[ns]', 'timestamp[ns]'), ('float64', 'null')]
+    for pandas_name, arrow_name in pairs:
+        assert Agg_Compare.dtype_kind(pandas_name) == Agg_Compare.dtype_kind(arrow_name)
@@ -0,0 +1,29 @@
+import zipfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from zip_to_parquet import convert_zip_to_parquet
+
+
+def write_zip(path, text):
+    with zipfile.ZipFile(path, 'w') as zfile:
+        zfile.writestr(path.name.replace(".zip", ""), text)
+    return str(path)
+
+
+def test_numbers_are_typed_from_the_sample(tmp_path):
+    zip_path = write_zip(tmp_path / "g_table.tsv.zip", "id\tcount\tscore\n1\t10\t0.5\n2\t20\t1.5\n3\t30\t2\n")
+    [out] = convert_zip_to_parquet(zip_path, str(tmp_path / "parquet"), chunksize=2, sample_rows=2)
+    table = pq.read_table(out)
+    assert table.schema.field('count').type == pa.int64()
+    assert table.schema.field('score').type == pa.float64()
+    assert table['count'].to_pylist() == [10, 20, 30]
+
+
+def test_leading_zeros_after_the_sample_keep_the_column_as_text(tmp_path):
+    zip_path = write_zip(tmp_path / "g_table.tsv.zip",
+                         "id\tcount\tscore\n1\t10\t0.5\n2\t20\t1.5\n3\t007\t-01.5\n4\t40\t2\n")
+    [out] = convert_zip_to_parquet(zip_path, str(tmp_path / "parquet"), chunksize=2, sample_rows=2)
+    table = pq.read_table(out)
+    assert table.schema.field('count').type == pa.string()
+    assert table['count'].to_pylist() == ['10', '20', '007', '40']
+    assert table['score'].to_pylist() == ['0.5', '1.5', '-01.5', '2']